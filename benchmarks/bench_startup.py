@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# startup cost of the tools: each script run on its own, through the
+# noahmp-tools dispatcher, and many invocations in one --serve interpreter
+
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import statistics
+
+TOOLDIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, TOOLDIR)
+from noahmp_tools import COMMANDS
+
+def wall(argv, repeat):
+    '''median wall time (s) of running argv repeat times'''
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        subprocess.run(argv, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        times.append(time.perf_counter() - t0)
+    return statistics.median(times)
+
+def serve_wall(commands, repeat):
+    '''wall time (s) per command line of repeat rounds of commands in one --serve run'''
+    lines = ''.join('{0:s} --help\n'.format(command) for _ in range(repeat) for command in commands)
+    t0 = time.perf_counter()
+    subprocess.run([sys.executable, os.path.join(TOOLDIR, 'noahmp_tools.py'), '--serve', '-'],
+                   input=lines.encode(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return (time.perf_counter() - t0) / (repeat * len(commands))
+
+def main(commands, repeat=5, jsonfile=None):
+    dispatcher = os.path.join(TOOLDIR, 'noahmp_tools.py')
+    results = {'python': sys.version.split()[0], 'repeat': repeat,
+               'interpreter': wall([sys.executable, '-c', 'pass'], repeat),
+               'dispatcher': wall([sys.executable, dispatcher, '--help'], repeat),
+               'commands': {}}
+    print('{0:<22s}{1:>10s}{2:>12s}'.format('', 'script', 'dispatcher'))
+    for command in commands:
+        script = os.path.join(TOOLDIR, COMMANDS[command][0] + '.py')
+        results['commands'][command] = {
+            'script': wall([sys.executable, script, '--help'], repeat),
+            'dispatcher': wall([sys.executable, dispatcher, command, '--help'], repeat),
+        }
+        print('{0:<22s}{1[script]:>9.3f}s{1[dispatcher]:>11.3f}s'.format(
+            command, results['commands'][command]), flush=True)
+    results['serve'] = serve_wall(commands, repeat)
+    print('python -c pass {0:.3f} s, noahmp-tools --help {1:.3f} s, '
+          '--serve {2:.4f} s per command'.format(
+              results['interpreter'], results['dispatcher'], results['serve']))
+    if jsonfile is not None:
+        with open(jsonfile, 'w') as f:
+            json.dump(results, f, indent=1)
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='measure the startup time of the tools (COMMAND --help)')
+    parser.add_argument('commands', nargs='*', metavar='COMMAND',
+                        default=['ldasout2cf', 'extract-tws', 'towrf', 'new-case', 'queue', 'rgb2cpt'],
+                        help='commands to time (default: a few light and heavy ones)')
+    parser.add_argument('-n', '--repeat', type=int, default=5,
+                        help='runs of each measurement (default: 5)')
+    parser.add_argument('--json', type=str, default=None,
+                        help='also write the results to this JSON file')
+    args = parser.parse_args()
+    for command in args.commands:
+        if command not in COMMANDS:
+            parser.error('unknown command: ' + command)
+    main(args.commands, args.repeat, args.json)
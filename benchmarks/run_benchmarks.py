@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# throughput and peak memory of the tools on synthetic inputs; results are
+# written as JSON (with the git commit) to compare runs across commits
+
+import os
+import sys
+import glob
+import json
+import time
+import shutil
+import platform
+import argparse
+import datetime
+import subprocess
+import statistics
+import numpy as np
+import netCDF4 as nc
+
+BENCHDIR = os.path.dirname(os.path.realpath(__file__))
+TOOLDIR = os.path.dirname(BENCHDIR)
+import synthetic
+
+def tools(workdir, params):
+    '''tool: (script, arguments, input files, records); out/ is emptied before each run'''
+    out = os.path.join(workdir, 'out')
+    ldasout = sorted(glob.glob(os.path.join(workdir, 'ldasout', '*.LDASOUT_DOMAIN1')))
+    cfdir = os.path.join(workdir, 'cf')
+    cffiles = glob.glob(os.path.join(cfdir, '*.nc'))
+    princeton = sorted(glob.glob(os.path.join(workdir, 'princeton', '*.nc')))
+    wrfinput = os.path.join(workdir, 'wrfinput_d01')
+    begtime = synthetic.BEGTIME + datetime.timedelta(seconds=params['step'])
+    endtime = synthetic.BEGTIME + datetime.timedelta(seconds=params['step'] * params['nrec'])
+    nrec = params['nrec']
+    return {
+        'ldasout2cf': ('noahmp_ldasout2cf.py',
+                       [wrfinput, os.path.dirname(ldasout[0]), os.path.join(out, 'cf.nc'),
+                        begtime.isoformat(), endtime.isoformat()], ldasout, nrec - 1),
+        'extract-et': ('extract_et.py', [cfdir, out], cffiles, nrec),
+        'extract-runoff': ('extract_runoff.py', [cfdir, out], cffiles, nrec),
+        'extract-tws': ('extract_tws.py', [cfdir, out], cffiles, nrec),
+        'extract-rad': ('extract_rad.py', [cfdir, out], cffiles, nrec),
+        'extract-budget': ('extract_budget.py', [cfdir, out], cffiles, nrec),
+        'rechunk': ('noahmp_rechunk.py', [cffiles[0], os.path.join(out, 'rechunk.nc')], cffiles, nrec),
+        'ungrib-princeton': ('ungrib_princeton.py', princeton + ['-p', os.path.join(out, 'FILE')],
+                             princeton, nrec),
+        'wrfinput-nc4tonc3sub': ('wrfinput_nc4tonc3sub.py', [wrfinput, os.path.join(out, 'wrfinput.nc')],
+                                 [wrfinput], 1),
+    }
+
+def measure(argv, logfile):
+    '''(exit status, wall time in s, peak RSS in MiB of the largest process)'''
+    with open(logfile, 'w') as log:
+        t0 = time.perf_counter()
+        p = subprocess.Popen(argv, stdout=log, stderr=subprocess.STDOUT)
+        _, status, rusage = os.wait4(p.pid, 0)
+        wall = time.perf_counter() - t0
+    p.returncode = os.waitstatus_to_exitcode(status)
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    maxrss = rusage.ru_maxrss / (2**20 if sys.platform == 'darwin' else 2**10)
+    return p.returncode, wall, maxrss
+
+def git_commit():
+    '''(commit, dirty) of the tools'''
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=TOOLDIR, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=TOOLDIR,
+                               capture_output=True, text=True, check=True).stdout.strip() != ''
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, dirty
+
+def compare(results, reference):
+    '''speedup of results over a reference results file'''
+    with open(reference, 'r') as f:
+        old = json.load(f)
+    print('against {0:s} ({1:s})'.format(reference, str(old.get('commit'))[0:10]))
+    for name, new in results['tools'].items():
+        if name in old.get('tools', {}) and new['status'] == 0 and old['tools'][name]['status'] == 0:
+            print('{0:<22s}{1:>6.2f}x speed{2:>6.2f}x peak RSS'.format(
+                name, old['tools'][name]['wall'] / new['wall'],
+                new['maxrss_mb'] / old['tools'][name]['maxrss_mb']))
+    return
+
+def main(workdir, ny=100, nx=200, nrec=24, step=3600, compress=False, names=None,
+         repeat=3, outfile=None, reference=None):
+    params = synthetic.generate(workdir, ny, nx, nrec, step, compress)
+    commit, dirty = git_commit()
+    results = {'commit': commit, 'dirty': dirty,
+               'date': datetime.datetime.now().isoformat(timespec='seconds'),
+               'host': platform.node(), 'cpus': os.cpu_count(),
+               'python': platform.python_version(), 'numpy': np.__version__,
+               'netCDF4': nc.__version__, 'params': params, 'repeat': repeat, 'tools': {}}
+    out = os.path.join(workdir, 'out')
+    print('{0:<22s}{1:>9s}{2:>11s}{3:>10s}{4:>10s}'.format('', 'wall', 'records/s', 'MiB/s', 'peak RSS'))
+    for name, (script, args, inputs, records) in tools(workdir, params).items():
+        if names and name not in names:
+            continue
+        walls, maxrss, status = [], 0.0, 0
+        for _ in range(repeat):
+            shutil.rmtree(out, ignore_errors=True)
+            os.makedirs(out)
+            status, wall, rss = measure([sys.executable, os.path.join(TOOLDIR, script)] + args,
+                                        os.path.join(workdir, name + '.log'))
+            if status != 0:
+                break
+            walls.append(wall)
+            maxrss = max(maxrss, rss)
+        mbytes = sum(os.path.getsize(x) for x in inputs) / 2**20
+        if status != 0:
+            results['tools'][name] = {'status': status}
+            print('{0:<22s} failed ({1:d}), see {2:s}'.format(name, status,
+                                                             os.path.join(workdir, name + '.log')))
+            continue
+        wall = statistics.median(walls)
+        results['tools'][name] = {'status': 0, 'wall': wall, 'walls': walls, 'maxrss_mb': maxrss,
+                                  'records': records, 'input_mb': mbytes,
+                                  'records_per_s': records / wall, 'mb_per_s': mbytes / wall}
+        print('{0:<22s}{1:>8.3f}s{2:>11.1f}{3:>10.1f}{4:>7.0f} MiB'.format(
+            name, wall, records / wall, mbytes / wall, maxrss), flush=True)
+    shutil.rmtree(out, ignore_errors=True)
+    if outfile is None:
+        outfile = os.path.join(workdir, 'results-{0:s}.json'.format((commit or 'unknown')[0:10]))
+    with open(outfile, 'w') as f:
+        json.dump(results, f, indent=1)
+    print('-> ' + outfile)
+    if reference is not None:
+        compare(results, reference)
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='benchmark the tools on synthetic inputs')
+    parser.add_argument('-w', '--workdir', type=str, default=os.path.join(BENCHDIR, 'work'),
+                        help='directory of the inputs (reused) and results (default: benchmarks/work)')
+    parser.add_argument('--ny', type=int, default=100, help='rows (default: 100)')
+    parser.add_argument('--nx', type=int, default=200, help='columns (default: 200)')
+    parser.add_argument('-n', '--nrec', type=int, default=24, help='records (default: 24)')
+    parser.add_argument('--step', type=int, default=3600, help='seconds between LDASOUT files (default: 3600)')
+    parser.add_argument('--compress', action='store_true', help='zlib-compress LDASOUT variables')
+    parser.add_argument('-t', '--tools', type=str, nargs='+', default=None,
+                        help='tools to run (default: all)')
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+                        help='runs of each tool, the median is reported (default: 3)')
+    parser.add_argument('-o', '--output', type=str, default=None,
+                        help='results file (default: WORKDIR/results-COMMIT.json)')
+    parser.add_argument('--compare', type=str, default=None, metavar='RESULTS',
+                        help='print the speedup over an earlier results file')
+    args = parser.parse_args()
+    main(args.workdir, args.ny, args.nx, args.nrec, args.step, args.compress, args.tools,
+         args.repeat, args.output, args.compare)
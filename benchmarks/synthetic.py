@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# synthetic inputs of the tools, no model run needed:
+#   ldasout/YYYYMMDDHH.LDASOUT_DOMAIN1  HRLDAS outputs (accumulated ACCVARS,
+#                                       VALIDMIN-style fill over water)
+#   wrfinput_d01                        lat/lon grid and static fields
+#   cf/cf.nc                            CF file as written by noahmp_ldasout2cf
+#   princeton/VAR_3hourly_YYYY-YYYY.nc  Princeton forcing
+
+import os
+import sys
+import json
+import datetime
+import argparse
+import numpy as np
+import netCDF4 as nc
+
+TOOLDIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, TOOLDIR)
+from noahmp_ldasout2cf import ACCVARS, VALIDMIN
+
+FILLVALUE = -1.0e33             # HRLDAS value of water cells, below VALIDMIN
+NSOIL, NSNOW = 4, 3
+# 2-D state and flux variables: (units, typical value)
+VARS2D = {
+    'SNEQV': ('mm', 50.0), 'SNOWH': ('m', 0.2), 'FSNO': ('1', 0.5),
+    'CANLIQ': ('mm', 0.2), 'CANICE': ('mm', 0.1), 'WA': ('mm', 4900.0),
+    'WT': ('mm', 4900.0), 'ZWT': ('m', 2.5), 'TG': ('K', 285.0),
+    'TV': ('K', 285.0), 'T2MV': ('K', 285.0), 'Q2MV': ('kg kg-1', 0.008),
+    'FSA': ('W m-2', 150.0), 'FIRA': ('W m-2', 60.0), 'SWFORC': ('W m-2', 180.0),
+    'LWFORC': ('W m-2', 330.0), 'HFX': ('W m-2', 40.0), 'LH': ('W m-2', 80.0),
+    'GRDFLX': ('W m-2', 5.0), 'ECAN': ('mm s-1', 1e-5), 'EDIR': ('mm s-1', 1e-5),
+    'ETRAN': ('mm s-1', 2e-5), 'RAINRATE': ('mm s-1', 3e-5), 'LAI': ('m2 m-2', 2.0),
+    'SAI': ('m2 m-2', 0.5),
+}
+# 3-D variables: (layer dimension, units, typical value)
+VARS3D = {
+    'SOIL_M': ('soil_layers_stag', 'm3 m-3', 0.3),
+    'SOIL_W': ('soil_layers_stag', 'm3 m-3', 0.25),
+    'SOIL_T': ('soil_layers_stag', 'K', 285.0),
+    'SNOW_T': ('snow_layers', 'K', 265.0),
+    'ZSNSO': ('snso_layers', 'm', -0.5),
+}
+# accumulated since the start, mm
+ACCRATES = {'ACSNOW': 1e-5, 'ACSNOM': 5e-6, 'SFCRNOFF': 1e-5, 'UGDRNOFF': 5e-6}
+PRINCETON = {
+    'dswrf': ('W/m2', 180.0), 'dlwrf': ('W/m2', 330.0), 'wind': ('m/s', 4.0),
+    'tas': ('K', 285.0), 'shum': ('kg/kg', 0.008), 'pres': ('Pa', 95000.0),
+    'prcp': ('kg/m2/s', 3e-5),
+}
+BEGTIME = datetime.datetime(2000, 1, 1)
+LAT0, LON0, DLL = 25.0625, -124.9375, 0.125   # NLDAS-like grid
+
+def coords(ny, nx):
+    return LAT0 + DLL * np.arange(ny), LON0 + DLL * np.arange(nx)
+
+def water(ny, nx):
+    '''water cells: a coastal strip in the south-west corner and a lake'''
+    jj, ii = np.meshgrid(np.arange(ny), np.arange(nx), indexing='ij')
+    lake = (jj - 0.6 * ny)**2 + (ii - 0.6 * nx)**2 < (0.1 * min(ny, nx))**2
+    return (jj / ny + ii / nx < 0.3) | lake
+
+def field(rng, shape, value, itim=0):
+    '''smooth field around value with a diurnal cycle and some noise'''
+    ny, nx = shape[-2:]
+    jj, ii = np.meshgrid(np.linspace(0, np.pi, ny), np.linspace(0, 2 * np.pi, nx), indexing='ij')
+    pattern = 1 + 0.3 * np.sin(jj) * np.cos(ii) + 0.1 * np.sin(2 * np.pi * itim / 24)
+    noise = 0.05 * rng.standard_normal(shape)
+    return (value * (pattern + noise)).astype('f4')
+
+def wrfinput(filename, ny, nx):
+    lat, lon = coords(ny, nx)
+    rng = np.random.default_rng(1)
+    with nc.Dataset(filename, 'w') as f:
+        f.createDimension('Time', None)
+        f.createDimension('south_north', ny)
+        f.createDimension('west_east', nx)
+        for att, value in dict(MAP_PROJ=6, DX=DLL, DY=DLL, GRID_ID=1, TRUELAT1=0.0, TRUELAT2=0.0,
+                               STAND_LON=0.0, MMINLU='MODIFIED_IGBP_MODIS_NOAH',
+                               ISWATER=17, ISURBAN=13, ISICE=15, ISOILWATER=14).items():
+            setattr(f, att, value)
+        lat2d, lon2d = np.meshgrid(lat, lon, indexing='ij')
+        landmask = ~water(ny, nx)
+        statics = {'XLAT': lat2d, 'XLONG': lon2d, 'HGT': field(rng, (ny, nx), 500.0),
+                   'TMN': field(rng, (ny, nx), 285.0), 'MAPFAC_MX': np.ones((ny, nx)),
+                   'MAPFAC_MY': np.ones((ny, nx)), 'XLAND': np.where(landmask, 1.0, 2.0),
+                   'LANDMASK': landmask.astype('f4'),
+                   'ISLTYP': np.where(landmask, rng.integers(1, 13, (ny, nx)), 14),
+                   'IVGTYP': np.where(landmask, rng.integers(1, 17, (ny, nx)), 17)}
+        for var, v in statics.items():
+            dtype = 'i4' if var in ('ISLTYP', 'IVGTYP') else 'f4'
+            f.createVariable(var, dtype, ('Time', 'south_north', 'west_east'))[0] = v
+    return
+
+def ldasout(datadir, ny, nx, nrec, step=3600, compress=False):
+    '''nrec hourly (step s) LDASOUT files of domain 1'''
+    os.makedirs(datadir, exist_ok=True)
+    rng = np.random.default_rng(0)
+    mask = water(ny, nx)
+    accs = {var: np.zeros((ny, nx), dtype='f8') for var in ACCVARS}
+    for itim in range(nrec):
+        dt = BEGTIME + datetime.timedelta(seconds=step * itim)
+        filename = os.path.join(datadir, dt.strftime('%Y%m%d%H') + '.LDASOUT_DOMAIN1')
+        with nc.Dataset(filename, 'w', format='NETCDF4') as f:
+            f.TITLE = 'OUTPUT FROM HRLDAS v20150506'
+            f.createDimension('Time', None)
+            f.createDimension('DateStrLen', 19)
+            f.createDimension('west_east', nx)
+            f.createDimension('south_north', ny)
+            f.createDimension('soil_layers_stag', NSOIL)
+            f.createDimension('snow_layers', NSNOW)
+            f.createDimension('snso_layers', NSOIL + NSNOW)
+            f.createVariable('Times', 'S1', ('Time', 'DateStrLen'))[0] = \
+                nc.stringtoarr(dt.strftime('%Y-%m-%d_%H:%M:%S'), 19)
+            for var, (units, value) in VARS2D.items():
+                v = field(rng, (ny, nx), value, itim)
+                v[mask] = FILLVALUE
+                x = f.createVariable(var, 'f4', ('Time', 'south_north', 'west_east'), zlib=compress)
+                x.units = units
+                x.description = var
+                x[0] = v
+            for var, (dim, units, value) in VARS3D.items():
+                nz = len(f.dimensions[dim])
+                v = field(rng, (ny, nz, nx), value, itim)
+                v[np.broadcast_to(mask[:, None, :], v.shape)] = FILLVALUE
+                x = f.createVariable(var, 'f4', ('Time', 'south_north', dim, 'west_east'), zlib=compress)
+                x.units = units
+                x.description = var
+                x[0] = v
+            for var in ACCVARS:
+                accs[var] += np.abs(field(rng, (ny, nx), ACCRATES.get(var, 1e-5), itim)) * step
+                v = accs[var].astype('f4')
+                v[mask] = FILLVALUE
+                x = f.createVariable(var, 'f4', ('Time', 'south_north', 'west_east'), zlib=compress)
+                x.units = 'mm'
+                x.description = 'Accumulated ' + var
+                x[0] = v
+            x = f.createVariable('ISNOW', 'i4', ('Time', 'south_north', 'west_east'), zlib=compress)
+            x[0] = np.where(mask, -9999, rng.integers(-NSNOW, 1, (ny, nx)))
+    return
+
+def cf(filename, ny, nx, nrec, step=3600):
+    '''CF file with the inputs of the extract_* tools (NaN over water)'''
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    rng = np.random.default_rng(2)
+    mask = water(ny, nx)
+    lat, lon = coords(ny, nx)
+    with nc.Dataset(filename, 'w') as f:
+        f.TITLE = 'OUTPUT FROM HRLDAS v20150506'
+        f.createDimension('time', None)
+        f.createDimension('south_north', ny)
+        f.createDimension('west_east', nx)
+        f.createDimension('soil_layers_stag', NSOIL)
+        for dim, v, name, units, axis in (('west_east', lon, 'longitude', 'degree_east', 'X'),
+                                          ('south_north', lat, 'latitude', 'degree_north', 'Y')):
+            x = f.createVariable(dim, 'f4', (dim,), zlib=True, complevel=6)
+            x.standard_name = name
+            x.units = units
+            x.axis = axis
+            x[:] = v
+        x = f.createVariable('time', 'f8', ('time',), zlib=True, complevel=6)
+        x.standard_name = 'time'
+        x.units = 'hours since 1900-01-01'
+        x.calendar = 'standard'
+        x.axis = 'T'
+        x[:] = nc.date2num([BEGTIME + datetime.timedelta(seconds=step * (i + 1)) for i in range(nrec)],
+                           x.units)
+        variables = {'SOIL_M': VARS3D['SOIL_M'][1:]}
+        variables.update({var: VARS2D[var] for var in ('SNEQV', 'WA', 'ZWT', 'ECAN', 'EDIR', 'ETRAN',
+                                                       'SWFORC', 'FSA', 'LWFORC', 'FIRA', 'RAINRATE')})
+        variables.update({var: ('mm s-1', ACCRATES.get(var, 1e-5)) for var in ('SFCRNOFF', 'UGDRNOFF')})
+        for var, (units, value) in variables.items():
+            dims = ('time', 'soil_layers_stag', 'south_north', 'west_east') if var == 'SOIL_M' \
+                else ('time', 'south_north', 'west_east')
+            x = f.createVariable(var, 'f4', dims, fill_value=float('nan'), zlib=True, complevel=6)
+            x.units = units
+            for itim in range(nrec):
+                v = field(rng, [len(f.dimensions[d]) for d in dims[1:]], value, itim)
+                v[..., mask] = np.nan
+                x[itim] = v
+    return
+
+def princeton(datadir, ny, nx, nrec):
+    '''one year-file per variable, 3-hourly, nrec records'''
+    os.makedirs(datadir, exist_ok=True)
+    rng = np.random.default_rng(3)
+    lat, lon = coords(ny, nx)
+    for var, (units, value) in PRINCETON.items():
+        filename = os.path.join(datadir, '{0:s}_3hourly_{1:d}-{1:d}.nc'.format(var, BEGTIME.year))
+        with nc.Dataset(filename, 'w') as f:
+            f.createDimension('time', None)
+            f.createDimension('z', 1)
+            f.createDimension('latitude', ny)
+            f.createDimension('longitude', nx)
+            x = f.createVariable('time', 'f8', ('time',))
+            x.units = BEGTIME.strftime('hours since %Y-%m-%d %H:%M:%S')
+            x[:] = 3.0 * np.arange(nrec)
+            f.createVariable('z', 'f4', ('z',))[:] = [200100.0]
+            f.createVariable('latitude', 'f4', ('latitude',))[:] = lat
+            f.createVariable('longitude', 'f4', ('longitude',))[:] = lon
+            x = f.createVariable(var, 'f4', ('time', 'z', 'latitude', 'longitude'), zlib=True)
+            x.source = 'Princeton Global Meteorological Forcing Dataset (synthetic)'
+            x.units = units
+            x.title = var
+            for itim in range(nrec):
+                x[itim] = field(rng, (1, ny, nx), value, 3 * itim)
+    return
+
+def generate(workdir, ny=100, nx=200, nrec=24, step=3600, compress=False):
+    '''all inputs under workdir, reused when generated with the same parameters'''
+    params = {'ny': ny, 'nx': nx, 'nrec': nrec, 'step': step, 'compress': compress}
+    paramfile = os.path.join(workdir, 'params.json')
+    if os.path.isfile(paramfile):
+        with open(paramfile, 'r') as f:
+            if json.load(f) == params:
+                return params
+    os.makedirs(workdir, exist_ok=True)
+    print('generating {0:d}x{1:d}x{2:d} inputs in {3:s}'.format(nrec, ny, nx, workdir), flush=True)
+    wrfinput(os.path.join(workdir, 'wrfinput_d01'), ny, nx)
+    ldasout(os.path.join(workdir, 'ldasout'), ny, nx, nrec, step, compress)
+    cf(os.path.join(workdir, 'cf', 'cf.nc'), ny, nx, nrec, step)
+    princeton(os.path.join(workdir, 'princeton'), ny, nx, nrec)
+    with open(paramfile, 'w') as f:
+        json.dump(params, f)
+    return params
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='generate synthetic inputs of the tools')
+    parser.add_argument('workdir', type=str)
+    parser.add_argument('--ny', type=int, default=100, help='rows (default: 100)')
+    parser.add_argument('--nx', type=int, default=200, help='columns (default: 200)')
+    parser.add_argument('-n', '--nrec', type=int, default=24, help='records (default: 24)')
+    parser.add_argument('--step', type=int, default=3600, help='seconds between LDASOUT files (default: 3600)')
+    parser.add_argument('--compress', action='store_true', help='zlib-compress LDASOUT variables')
+    args = parser.parse_args()
+    generate(args.workdir, args.ny, args.nx, args.nrec, args.step, args.compress)
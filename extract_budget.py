@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# water budget closure (P - ET - R - dTWS), computed in the same pass as
+# the ET, runoff and TWS products
+
+import os.path
+import sys
+import glob
+import argparse
+import contextlib
+import numpy as np
+import netCDF4 as nc
+from noahmp_prefetch import Prefetcher, dataset
+from noahmp_writer import Writer
+from noahmp_pack import Packer, parse_spec, scan
+import noahmp_profile
+import extract_et
+import extract_runoff
+import extract_tws
+
+# product: (module, loader, per-step computation, definition)
+PRODUCTS = {
+    'et': (extract_et, extract_et.read_et, extract_et.compute_et, extract_et.define_et),
+    'runoff': (extract_runoff, extract_runoff.read_runoff, extract_runoff.compute_runoff,
+               extract_runoff.define_runoff),
+    'tws': (extract_tws, extract_tws.read_tws, extract_tws.compute_tws, extract_tws.define_tws),
+}
+STORAGES = ['TWS', 'SMC', 'SNW', 'GW']
+
+
+class Budget(object):
+    '''streaming water budget closure over consecutive time steps
+
+    residual = (P - ET - R) * dt - (TWS - TWS_previous), in kg m-2 per
+    step, with fluxes of a step averaged over the interval ending at it.
+    Keeps running sums, the max-abs step residual of every cell and the
+    domain-mean (over valid cells) residual of every step.
+    '''
+    def __init__(self):
+        self.lat = None
+        self.lon = None
+        self.units = None
+        self.last = None        # (date, storages) of the previous step
+        self.first = None       # storages of the first step
+        self.sums = {}
+        self.maxabs = None
+        self.times = []
+        self.means = []
+
+    def add(self, date, prcp, et, runoff, storages):
+        storages = {var: np.ma.filled(np.ma.asarray(storages[var], dtype='f8'), np.nan)
+                    for var in STORAGES}
+        if self.last is None:
+            self.first = storages
+        else:
+            dt = (date - self.last[0]).total_seconds()
+            fluxes = {'PRCP': prcp, 'ET': et, 'RUNOFF': runoff}
+            for var in fluxes:
+                fluxes[var] = np.ma.filled(np.ma.asarray(fluxes[var], dtype='f8'), np.nan) * dt
+                self.sums[var] = self.sums.get(var, 0.0) + fluxes[var]
+            residual = fluxes['PRCP'] - fluxes['ET'] - fluxes['RUNOFF'] \
+                - (storages['TWS'] - self.last[1]['TWS'])
+            self.sums['RESIDUAL'] = self.sums.get('RESIDUAL', 0.0) + residual
+            self.maxabs = np.abs(residual) if self.maxabs is None \
+                else np.fmax(self.maxabs, np.abs(residual))
+            self.times.append(nc.date2num(date, self.units))
+            self.means.append(np.nanmean(residual) if np.any(np.isfinite(residual)) else np.nan)
+        self.last = (date, storages)
+        return
+
+    def nstep(self):
+        return len(self.times)
+
+    def total(self, var):
+        '''domain mean (over valid cells) of a summed or storage-change map'''
+        v = self.changes()[var] if var in STORAGES else self.sums[var]
+        return np.nanmean(v) if np.any(np.isfinite(v)) else np.nan
+
+    def changes(self):
+        return {var: self.last[1][var] - self.first[var] for var in STORAGES}
+
+    def write(self, outfile):
+        with nc.Dataset(outfile, 'w') as fo:
+            fo.Conventions = 'CF-1.8'
+            fo.title = 'NLDAS-NoahMP water budget closure diagnostics'
+            fo.comment = 'RESIDUAL = (PRCP - ET - RUNOFF) * dt - dTWS per time step'
+            fo.createDimension('time', None)
+            fo.createDimension('lat', len(self.lat))
+            fo.createDimension('lon', len(self.lon))
+            fo.createVariable('time', 'f8', ('time',), zlib=True, complevel=6)
+            fo.variables['time'].units = self.units
+            fo.variables['time'].standard_name = 'time'
+            fo.variables['time'].axis = 'T'
+            fo.createVariable('lat', 'f8', ('lat',), zlib=True, complevel=6)
+            fo.variables['lat'].units = 'degree_north'
+            fo.variables['lat'].standard_name = 'latitude'
+            fo.variables['lat'].axis = 'Y'
+            fo.createVariable('lon', 'f8', ('lon',), zlib=True, complevel=6)
+            fo.variables['lon'].units = 'degree_east'
+            fo.variables['lon'].standard_name = 'longitude'
+            fo.variables['lon'].axis = 'X'
+            fo.variables['time'][:] = self.times
+            fo.variables['lat'][:] = self.lat
+            fo.variables['lon'][:] = self.lon
+            fo.createVariable('RESIDUAL', 'f4', ('time',),
+                              fill_value=float('nan'), zlib=True, complevel=6)
+            fo.variables['RESIDUAL'].units = 'kg m-2'
+            fo.variables['RESIDUAL'].long_name = 'domain-mean budget residual of the time step'
+            fo.variables['RESIDUAL'][:] = self.means
+            maps = [('PRCP_SUM', self.sums['PRCP'], 'precipitation'),
+                    ('ET_SUM', self.sums['ET'], 'evapotranspiration'),
+                    ('RUNOFF_SUM', self.sums['RUNOFF'], 'runoff'),
+                    ('RESIDUAL_SUM', self.sums['RESIDUAL'], 'budget residual'),
+                    ('RESIDUAL_MAXABS', self.maxabs, 'maximum absolute budget residual of a time step')] \
+                + [('D' + var, v, 'change of ' + var) for var, v in self.changes().items()]
+            for var, v, long_name in maps:
+                fo.createVariable(var, 'f4', ('lat', 'lon'),
+                                  fill_value=float('nan'), zlib=True, complevel=6)
+                fo.variables[var].units = 'kg m-2'
+                fo.variables[var].long_name = long_name
+                fo.variables[var][:] = v
+        return
+
+    def report(self):
+        if self.nstep() == 0:
+            print('BUDGET: no closed time steps')
+            return
+        print('BUDGET: {0:d} steps, P {1:.3f}, ET {2:.3f}, R {3:.3f}, dTWS {4:.3f}, '
+              'residual {5:.3g} kg m-2 (domain mean), max |step residual| {6:.3g} kg m-2'.format(
+                  self.nstep(), self.total('PRCP'), self.total('ET'), self.total('RUNOFF'),
+                  self.total('TWS'), self.total('RESIDUAL'), np.nanmax(self.maxabs)),
+              flush=True)
+        return
+
+
+def main(indir, outdir, precip='RAINRATE', products=True, prefetch=2, queue=8,
+         pack=None, tolerance=None):
+    if os.path.isfile(indir):
+        infiles = [indir]
+    else:
+        infiles = sorted(glob.glob(os.path.join(indir, '*.nc')))
+    if len(infiles) == 0:
+        print('no CF files in ' + indir)
+        sys.exit(1)
+    budget = Budget()
+    for infile in infiles:
+        with nc.Dataset(infile, 'r') as fi:
+            if precip not in fi.variables:
+                print('no precipitation variable ' + precip + ' in ' + infile + ' (try --precip)')
+                sys.exit(1)
+        extract_budget(infile, outdir, budget, precip, products, prefetch, queue, pack)
+    if budget.nstep() == 0:
+        print('BUDGET: fewer than 2 time steps, no budget to close')
+        sys.exit(1)
+    outfile = os.path.join(outdir, 'budget.nc')
+    print('-> ' + outfile, flush=True)
+    budget.write(outfile)
+    budget.report()
+    if tolerance is not None and not abs(budget.total('RESIDUAL')) <= tolerance:
+        print('BUDGET: residual exceeds tolerance {0:g} kg m-2'.format(tolerance))
+        return False
+    return True
+
+
+def read_budget(item):
+    '''inputs of all products and precipitation of one time step (prefetch loader)'''
+    infile, itim, precip = item
+    values = {name: product[1]((infile, itim)) for name, product in PRODUCTS.items()}
+    values['precip'] = dataset(infile).variables[precip][itim, ...]
+    return values
+
+
+def extract_budget(infile, outdir, budget, precip='RAINRATE', products=True,
+                   prefetch=2, queue=8, pack=None):
+    with nc.Dataset(infile, 'r') as fi:
+        tim = fi.variables['time'][:]
+        dates = nc.num2date(tim, fi.variables['time'].units,
+                            only_use_cftime_datetimes=False)
+        if budget.units is None:
+            budget.units = fi.variables['time'].units
+            budget.lat = fi.variables['south_north'][:]
+            budget.lon = fi.variables['west_east'][:]
+    writers = {}
+    packers = {}
+    if products:
+        for name, (module, read, compute, define) in PRODUCTS.items():
+            outfile = module.in2outfiles([infile], outdir)[0]
+            print(infile + ' -> ' + outfile, flush=True)
+            packers[name] = Packer(pack, module.VARIABLES)
+            if packers[name].needs_scan():
+                scan(packers[name], read, compute,
+                     [(infile, itim) for itim in range(len(tim))], prefetch)
+            writers[name] = Writer(outfile, queue, maskandscale=False)
+            with nc.Dataset(infile, 'r') as fi, writers[name].define() as fo:
+                define(fi, fo, packers[name])
+    # one read of the inputs for the products and the budget
+    with contextlib.ExitStack() as stack:
+        for writer in writers.values():
+            stack.enter_context(writer)
+        reader = Prefetcher(read_budget, [(infile, itim, precip) for itim in range(len(tim))],
+                            prefetch)
+        for (_, itim, _), values in reader:
+            outputs = {}
+            for name, (_, _, compute, _) in PRODUCTS.items():
+                with noahmp_profile.stage('compute'):
+                    outputs[name] = compute(values[name])
+                if name in writers:
+                    writers[name].write('time', itim, tim[itim])
+                    for var, v in outputs[name].items():
+                        writers[name].write(var, itim, packers[name].pack(var, v))
+            with noahmp_profile.stage('budget'):
+                budget.add(dates[itim], values['precip'], outputs['et']['ET'],
+                           outputs['runoff']['RUNOFF'], outputs['tws'])
+        reader.report()
+    for name in writers:
+        writers[name].report()
+        packers[name].report()
+    return
+
+
+def cli(argv=None):
+    '''command line; argv defaults to sys.argv[1:]'''
+    parser = argparse.ArgumentParser(
+        description='extract ET, runoff and TWS, and check the water budget closure in the same pass.')
+    parser.add_argument('indir', type=str,
+                        help='input directory, or a single CF file')
+    parser.add_argument('outdir', type=str,
+                        help='output directory')
+    parser.add_argument('--precip', type=str, default='RAINRATE',
+                        help='precipitation rate variable (kg m-2 s-1) of the input (default: RAINRATE)')
+    parser.add_argument('--budget-only', action='store_true',
+                        help='write only the budget diagnostics, not the et/run/tws products')
+    parser.add_argument('--tolerance', type=float, default=None,
+                        help='exit with 1 if the domain-mean residual exceeds this (kg m-2)')
+    parser.add_argument('--prefetch', type=int, default=2,
+                        help='number of time steps read ahead in the background, 0 to disable (default: 2)')
+    parser.add_argument('--queue', type=int, default=8,
+                        help='number of pending writes queued for each background writer, 0 writes in the foreground (default: 8)')
+    parser.add_argument('--pack', nargs='*', metavar='VAR=PRECISION[:MIN:MAX]',
+                        help='store the products as int16 with scale_factor/add_offset; optional items override the default precision (and bounds) of variables')
+    noahmp_profile.add_arguments(parser)
+    args = parser.parse_args(argv)
+    noahmp_profile.setup(args)
+    if not main(args.indir, args.outdir, args.precip, not args.budget_only,
+                args.prefetch, args.queue, parse_spec(args.pack), args.tolerance):
+        sys.exit(1)
+    return
+
+if __name__ == '__main__':
+    cli()
@@ -5,14 +5,23 @@ import os.path
 import glob
 import argparse
 import netCDF4 as nc
+from noahmp_prefetch import Prefetcher, dataset
+from noahmp_writer import Writer
+from noahmp_pack import Packer, parse_spec, scan
+import noahmp_profile
 
+VARIABLES = ['ET', 'ETRAN', 'ECAN', 'EDIR']
 
-def main(indir, outdir):
-    infiles = sorted(glob.glob(os.path.join(indir, '*.nc')))
+
+def main(indir, outdir, prefetch=2, queue=8, pack=None):
+    if os.path.isfile(indir):
+        infiles = [indir]
+    else:
+        infiles = sorted(glob.glob(os.path.join(indir, '*.nc')))
     outfiles = in2outfiles(infiles, outdir)
     for infile, outfile in zip(infiles, outfiles):
         print(infile + ' -> ' + outfile, flush=True)
-        extract_et(infile, outfile)
+        extract_et(infile, outfile, prefetch, queue, pack)
     pass
 
 
@@ -24,81 +33,122 @@ def in2outfiles(infiles, outdir):
     return outfiles
 
 
-def extract_et(infile, outfile):
+def read_et(item):
+    '''ET components of one time step (prefetch loader)'''
+    infile, itim = item
+    fi = dataset(infile)
+    return [fi.variables[var][itim, ...] for var in ['ECAN', 'EDIR', 'ETRAN']]
+
+
+def compute_et(values):
+    '''output variables of one time step'''
+    ec, eg, ev = values
+    et = ec + eg + ev
+    return {'ECAN': ec, 'EDIR': eg, 'ETRAN': ev, 'ET': et}
+
+
+def define_et(fi, fo, packer):
+    '''attributes, dimensions, coordinates and variables of the ET product'''
+    # global attributes
+    fo.Conventions = 'CF-1.8'
+    fo.title = 'NLDAS-NoahMP evapotranspiration and its components'
+    fo.institution = 'Institute of Atmospheric Physics, Chinese Academy of Sciences'
+    fo.source = 'Noah-MP v3.6 driven by NLDAS-2'
+    fo.references = ''
+    fo.comment = ''
+    # dimensions
+    lat = fi.variables['south_north'][:]
+    lon = fi.variables['west_east'][:]
+    nlat = len(fi.dimensions['south_north'])
+    nlon = len(fi.dimensions['west_east'])
+    fo.createDimension('time', None)
+    fo.createDimension('lat', nlat)
+    fo.createDimension('lon', nlon)
+    # coordinates
+    fo.createVariable('time', 'f8', ('time',), zlib=True, complevel=6)
+    fo.variables['time'].units = fi.variables['time'].units
+    fo.variables['time'].standard_name = 'time'
+    fo.variables['time'].axis = 'T'
+    fo.createVariable('lat', 'f8', ('lat',), zlib=True, complevel=6)
+    fo.variables['lat'].units = fi.variables['south_north'].units
+    fo.variables['lat'].standard_name = fi.variables['south_north'].standard_name
+    fo.variables['lat'].axis = 'Y'
+    fo.createVariable('lon', 'f8', ('lon',), zlib=True, complevel=6)
+    fo.variables['lon'].units = fi.variables['west_east'].units
+    fo.variables['lon'].standard_name = fi.variables['west_east'].standard_name
+    fo.variables['lon'].axis = 'X'
+    fo.variables['lat'][:] = lat
+    fo.variables['lon'][:] = lon
+    # model values
+    packer.create_variable(fo, 'ET', ('time', 'lat', 'lon'),
+                           zlib=True, complevel=6)
+    fo.variables['ET'].units = 'kg m-2 s-1'
+    fo.variables['ET'].standard_name = 'water_evapotranspiration_flux'
+    fo.variables['ET'].long_name = 'evapotranspiration'
+    packer.create_variable(fo, 'ETRAN', ('time', 'lat', 'lon'),
+                           zlib=True, complevel=6)
+    fo.variables['ETRAN'].units = 'kg m-2 s-1'
+    fo.variables['ETRAN'].standard_name = 'transpiration_flux'
+    fo.variables['ETRAN'].long_name = 'transpiration'
+    packer.create_variable(fo, 'ECAN', ('time', 'lat', 'lon'),
+                           zlib=True, complevel=6)
+    fo.variables['ECAN'].units = 'kg m-2 s-1'
+    fo.variables['ECAN'].standard_name = 'water_evaporation_flux_from_canopy'
+    fo.variables['ECAN'].long_name = 'canopy evaporation'
+    packer.create_variable(fo, 'EDIR', ('time', 'lat', 'lon'),
+                           zlib=True, complevel=6)
+    fo.variables['EDIR'].units = 'kg m-2 s-1'
+    fo.variables['EDIR'].standard_name = 'water_evaporation_flux_from_soil'
+    fo.variables['EDIR'].long_name = 'soil evaporation'
+
+
+def extract_et(infile, outfile, prefetch=2, queue=8, pack=None):
+    packer = Packer(pack, VARIABLES)
+    writer = Writer(outfile, queue, maskandscale=False)
     with nc.Dataset(infile, 'r') as fi,\
-            nc.Dataset(outfile, 'w') as fo:
-        # global attributes
-        fo.Conventions = 'CF-1.8'
-        fo.title = 'NLDAS-NoahMP evapotranspiration and its components'
-        fo.institution = 'Institute of Atmospheric Physics, Chinese Academy of Sciences'
-        fo.source = 'Noah-MP v3.6 driven by NLDAS-2'
-        fo.references = ''
-        fo.comment = ''
-        # dimensions
+            writer.define() as fo:
         tim = fi.variables['time'][:]
-        lat = fi.variables['south_north'][:]
-        lon = fi.variables['west_east'][:]
-        nlat = len(fi.dimensions['south_north'])
-        nlon = len(fi.dimensions['west_east'])
-        fo.createDimension('time', None)
-        fo.createDimension('lat', nlat)
-        fo.createDimension('lon', nlon)
-        # coordinates
-        fo.createVariable('time', 'f8', ('time',), zlib=True, complevel=6)
-        fo.variables['time'].units = fi.variables['time'].units
-        fo.variables['time'].standard_name = 'time'
-        fo.variables['time'].axis = 'T'
-        fo.createVariable('lat', 'f8', ('lat',), zlib=True, complevel=6)
-        fo.variables['lat'].units = fi.variables['south_north'].units
-        fo.variables['lat'].standard_name = fi.variables['south_north'].standard_name
-        fo.variables['lat'].axis = 'Y'
-        fo.createVariable('lon', 'f8', ('lon',), zlib=True, complevel=6)
-        fo.variables['lon'].units = fi.variables['west_east'].units
-        fo.variables['lon'].standard_name = fi.variables['west_east'].standard_name
-        fo.variables['lon'].axis = 'X'
-        fo.variables['lat'][:] = lat
-        fo.variables['lon'][:] = lon
-        # model values
-        fo.createVariable('ET', 'f4', ('time', 'lat', 'lon'),
-                          fill_value=float('nan'), zlib=True, complevel=6)
-        fo.variables['ET'].units = 'kg m-2 s-1'
-        fo.variables['ET'].standard_name = 'water_evapotranspiration_flux'
-        fo.variables['ET'].long_name = 'evapotranspiration'
-        fo.createVariable('ETRAN', 'f4', ('time', 'lat', 'lon'),
-                          fill_value=float('nan'), zlib=True, complevel=6)
-        fo.variables['ETRAN'].units = 'kg m-2 s-1'
-        fo.variables['ETRAN'].standard_name = 'transpiration_flux'
-        fo.variables['ETRAN'].long_name = 'transpiration'
-        fo.createVariable('ECAN', 'f4', ('time', 'lat', 'lon'),
-                          fill_value=float('nan'), zlib=True, complevel=6)
-        fo.variables['ECAN'].units = 'kg m-2 s-1'
-        fo.variables['ECAN'].standard_name = 'water_evaporation_flux_from_canopy'
-        fo.variables['ECAN'].long_name = 'canopy evaporation'
-        fo.createVariable('EDIR', 'f4', ('time', 'lat', 'lon'),
-                          fill_value=float('nan'), zlib=True, complevel=6)
-        fo.variables['EDIR'].units = 'kg m-2 s-1'
-        fo.variables['EDIR'].standard_name = 'water_evaporation_flux_from_soil'
-        fo.variables['EDIR'].long_name = 'soil evaporation'
-        # write data
-        for itim, tim in enumerate(fi.variables['time'][:]):
-            fo.variables['time'][itim] = tim
-            ec = fi.variables['ECAN'][itim, :, :]
-            eg = fi.variables['EDIR'][itim, :, :]
-            ev = fi.variables['ETRAN'][itim, :, :]
-            et = ec + eg + ev
-            fo.variables['ECAN'][itim, :, :] = ec
-            fo.variables['EDIR'][itim, :, :] = eg
-            fo.variables['ETRAN'][itim, :, :] = ev
-            fo.variables['ET'][itim, :, :] = et
+        # packing needs the range of each variable first
+        if packer.needs_scan():
+            scan(packer, read_et, compute_et,
+                 [(infile, itim) for itim in range(len(tim))], prefetch)
+        define_et(fi, fo, packer)
+    # write data, reading the next time steps in the background and
+    # compressing in the writer process
+    with writer:
+        reader = Prefetcher(read_et, [(infile, itim) for itim in range(len(tim))],
+                            prefetch)
+        for (_, itim), values in reader:
+            writer.write('time', itim, tim[itim])
+            with noahmp_profile.stage('compute'):
+                outputs = compute_et(values)
+            for var, v in outputs.items():
+                writer.write(var, itim, packer.pack(var, v))
+        reader.report()
+    writer.report()
+    packer.report()
     pass
 
 
-if __name__ == '__main__':
+def cli(argv=None):
+    '''command line; argv defaults to sys.argv[1:]'''
     parser = argparse.ArgumentParser(
         description='extract evapotranspiration and its omponents.')
     parser.add_argument('indir', type=str,
-                        help='input directory')
+                        help='input directory, or a single CF file')
     parser.add_argument('outdir', type=str,
                         help='output directory')
-    args = parser.parse_args()
-    main(args.indir, args.outdir)
+    parser.add_argument('--prefetch', type=int, default=2,
+                        help='number of time steps read ahead in the background, 0 to disable (default: 2)')
+    parser.add_argument('--queue', type=int, default=8,
+                        help='number of pending writes queued for the background writer, 0 writes in the foreground (default: 8)')
+    parser.add_argument('--pack', nargs='*', metavar='VAR=PRECISION[:MIN:MAX]',
+                        help='store as int16 with scale_factor/add_offset; optional items override the default precision (and bounds) of variables')
+    noahmp_profile.add_arguments(parser)
+    args = parser.parse_args(argv)
+    noahmp_profile.setup(args)
+    main(args.indir, args.outdir, args.prefetch, args.queue, parse_spec(args.pack))
+    return
+
+if __name__ == '__main__':
+    cli()
@@ -6,14 +6,21 @@ import glob
 import argparse
 import numpy as np
 import netCDF4 as nc
+from noahmp_prefetch import Prefetcher, dataset
+from noahmp_writer import Writer
+from noahmp_pack import Packer, parse_spec, scan
+import noahmp_profile
 
 
-def main(indir, outdir):
-    infiles = sorted(glob.glob(os.path.join(indir, '*.nc')))
+def main(indir, outdir, prefetch=2, queue=8, pack=None):
+    if os.path.isfile(indir):
+        infiles = [indir]
+    else:
+        infiles = sorted(glob.glob(os.path.join(indir, '*.nc')))
     outfiles = in2outfiles(infiles, outdir)
     for infile, outfile in zip(infiles, outfiles):
         print(infile + ' -> ' + outfile, flush=True)
-        extract_rad(infile, outfile)
+        extract_rad(infile, outfile, prefetch, queue, pack)
     return
 
 
@@ -25,9 +32,27 @@ def in2outfiles(infiles, outdir):
     return outfiles
 
 
-def extract_rad(infile, outfile):
+def read_rad(item):
+    '''radiation components of one time step (prefetch loader)'''
+    infile, itim = item
+    fi = dataset(infile)
+    return [fi.variables[var][itim, ...] for var in ['SWFORC', 'FSA', 'LWFORC', 'FIRA']]
+
+
+def compute_rad(values):
+    '''output variables of one time step'''
+    swd, swa, lwd, fira = values
+    swu = swd - swa
+    lwa = -fira
+    lwu = lwd - lwa
+    return {'SWU': swu, 'LWU': lwu}
+
+
+def extract_rad(infile, outfile, prefetch=2, queue=8, pack=None):
+    packer = Packer(pack, ['SWU', 'LWU'])
+    writer = Writer(outfile, queue, maskandscale=False)
     with nc.Dataset(infile, 'r') as fi,\
-         nc.Dataset(outfile, 'w') as fo:
+         writer.define() as fo:
         # dimensions
         tim = fi.variables['time'][:]
         lat = fi.variables['south_north'][:]
@@ -49,34 +74,51 @@ def extract_rad(infile, outfile):
         fo.variables['lon'].standard_name = fi.variables['west_east'].standard_name
         fo.variables['lat'][:] = lat
         fo.variables['lon'][:] = lon
-        # model values
-        fo.createVariable('SWU', 'f4', ('time', 'lat', 'lon'),
-                          fill_value=float('nan'), zlib=True)
+        # model values (packing needs the range of each variable first)
+        if packer.needs_scan():
+            scan(packer, read_rad, compute_rad,
+                 [(infile, itim) for itim in range(len(tim))], prefetch)
+        packer.create_variable(fo, 'SWU', ('time', 'lat', 'lon'), zlib=True)
         fo.variables['SWU'].units = 'W m-2'
         fo.variables['SWU'].long_name = 'upward_solar_radiation'
-        fo.createVariable('LWU', 'f4', ('time', 'lat', 'lon'),
-                          fill_value=float('nan'), zlib=True)
+        packer.create_variable(fo, 'LWU', ('time', 'lat', 'lon'), zlib=True)
         fo.variables['LWU'].units = 'W m-2'
         fo.variables['LWU'].long_name = 'upward_longwave_radiation'
-        # write data
-        for itim, tim in enumerate(fi.variables['time'][:]):
-            fo.variables['time'][itim] = tim
-            swd = fi.variables['SWFORC'][itim,:,:]
-            swa = fi.variables['FSA'][itim,:,:]
-            swu = swd - swa
-            fo.variables['SWU'][itim,:,:] = swu
-            lwd = fi.variables['LWFORC'][itim,:,:]
-            lwa = -fi.variables['FIRA'][itim,:,:]
-            lwu = lwd - lwa
-            fo.variables['LWU'][itim,:,:] = lwu
+    # write data, reading the next time steps in the background and
+    # compressing in the writer process
+    with writer:
+        reader = Prefetcher(read_rad, [(infile, itim) for itim in range(len(tim))],
+                            prefetch)
+        for (_, itim), values in reader:
+            writer.write('time', itim, tim[itim])
+            with noahmp_profile.stage('compute'):
+                outputs = compute_rad(values)
+            for var, v in outputs.items():
+                writer.write(var, itim, packer.pack(var, v))
+        reader.report()
+    writer.report()
+    packer.report()
     return
 
 
-if __name__ == '__main__':
+def cli(argv=None):
+    '''command line; argv defaults to sys.argv[1:]'''
     parser = argparse.ArgumentParser(description='extract upward shortwave and longwave radiation.')
     parser.add_argument('indir', type=str,
-                        help='input directory')
+                        help='input directory, or a single CF file')
     parser.add_argument('outdir', type=str,
                         help='output directory')
-    args = parser.parse_args()
-    main(args.indir, args.outdir)
+    parser.add_argument('--prefetch', type=int, default=2,
+                        help='number of time steps read ahead in the background, 0 to disable (default: 2)')
+    parser.add_argument('--queue', type=int, default=8,
+                        help='number of pending writes queued for the background writer, 0 writes in the foreground (default: 8)')
+    parser.add_argument('--pack', nargs='*', metavar='VAR=PRECISION[:MIN:MAX]',
+                        help='store as int16 with scale_factor/add_offset; optional items override the default precision (and bounds) of variables')
+    noahmp_profile.add_arguments(parser)
+    args = parser.parse_args(argv)
+    noahmp_profile.setup(args)
+    main(args.indir, args.outdir, args.prefetch, args.queue, parse_spec(args.pack))
+    return
+
+if __name__ == '__main__':
+    cli()
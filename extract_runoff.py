@@ -5,14 +5,23 @@ import os.path
 import glob
 import argparse
 import netCDF4 as nc
+from noahmp_prefetch import Prefetcher, dataset
+from noahmp_writer import Writer
+from noahmp_pack import Packer, parse_spec, scan
+import noahmp_profile
 
+VARIABLES = ['RUNOFF', 'SFCRNOFF', 'UGDRNOFF']
 
-def main(indir, outdir):
-    infiles = sorted(glob.glob(os.path.join(indir, '*.nc')))
+
+def main(indir, outdir, prefetch=2, queue=8, pack=None):
+    if os.path.isfile(indir):
+        infiles = [indir]
+    else:
+        infiles = sorted(glob.glob(os.path.join(indir, '*.nc')))
     outfiles = in2outfiles(infiles, outdir)
     for infile, outfile in zip(infiles, outfiles):
         print(infile + ' -> ' + outfile, flush=True)
-        extract_runoff(infile, outfile)
+        extract_runoff(infile, outfile, prefetch, queue, pack)
     pass
 
 
@@ -24,73 +33,116 @@ def in2outfiles(infiles, outdir):
     return outfiles
 
 
-def extract_runoff(infile, outfile):
+def read_runoff(item):
+    '''runoff components of one time step (prefetch loader)'''
+    infile, itim = item
+    fi = dataset(infile)
+    return [fi.variables[var][itim, ...] for var in ['SFCRNOFF', 'UGDRNOFF']]
+
+
+def compute_runoff(values):
+    '''output variables of one time step'''
+    runs, rung = values
+    run = runs + rung
+    return {'SFCRNOFF': runs, 'UGDRNOFF': rung, 'RUNOFF': run}
+
+
+def define_runoff(fi, fo, packer):
+    '''attributes, dimensions, coordinates and variables of the runoff product'''
+    # global attributes
+    fo.Conventions = 'CF-1.8'
+    fo.title = 'NLDAS-NoahMP runoff and its components'
+    fo.institution = 'Institute of Atmospheric Physics, Chinese Academy of Sciences'
+    fo.source = 'Noah-MP v3.6 driven by NLDAS-2'
+    fo.references = ''
+    fo.comment = ''
+    # dimensions
+    lat = fi.variables['south_north'][:]
+    lon = fi.variables['west_east'][:]
+    nlat = len(fi.dimensions['south_north'])
+    nlon = len(fi.dimensions['west_east'])
+    fo.createDimension('time', None)
+    fo.createDimension('lat', nlat)
+    fo.createDimension('lon', nlon)
+    # coordinates
+    fo.createVariable('time', 'f8', ('time',), zlib=True, complevel=6)
+    fo.variables['time'].units = fi.variables['time'].units
+    fo.variables['time'].standard_name = 'time'
+    fo.variables['time'].axis = 'T'
+    fo.createVariable('lat', 'f8', ('lat',), zlib=True, complevel=6)
+    fo.variables['lat'].units = fi.variables['south_north'].units
+    fo.variables['lat'].standard_name = fi.variables['south_north'].standard_name
+    fo.variables['lat'].axis = 'Y'
+    fo.createVariable('lon', 'f8', ('lon',), zlib=True, complevel=6)
+    fo.variables['lon'].units = fi.variables['west_east'].units
+    fo.variables['lon'].standard_name = fi.variables['west_east'].standard_name
+    fo.variables['lon'].axis = 'X'
+    fo.variables['lat'][:] = lat
+    fo.variables['lon'][:] = lon
+    # model values
+    packer.create_variable(fo, 'RUNOFF', ('time', 'lat', 'lon'),
+                           zlib=True, complevel=6)
+    fo.variables['RUNOFF'].units = 'kg m-2 s-1'
+    fo.variables['RUNOFF'].standard_name = 'runoff_flux'
+    fo.variables['RUNOFF'].long_name = 'runoff'
+    packer.create_variable(fo, 'SFCRNOFF', ('time', 'lat', 'lon'),
+                           zlib=True, complevel=6)
+    fo.variables['SFCRNOFF'].units = 'kg m-2 s-1'
+    fo.variables['SFCRNOFF'].standard_name = 'surface_runoff_flux'
+    fo.variables['SFCRNOFF'].long_name = 'surface runoff'
+    packer.create_variable(fo, 'UGDRNOFF', ('time', 'lat', 'lon'),
+                           zlib=True, complevel=6)
+    fo.variables['UGDRNOFF'].units = 'kg m-2 s-1'
+    fo.variables['UGDRNOFF'].standard_name = 'subsurface_runoff_flux'
+    fo.variables['UGDRNOFF'].long_name = 'subsurface runoff'
+
+
+def extract_runoff(infile, outfile, prefetch=2, queue=8, pack=None):
+    packer = Packer(pack, VARIABLES)
+    writer = Writer(outfile, queue, maskandscale=False)
     with nc.Dataset(infile, 'r') as fi,\
-            nc.Dataset(outfile, 'w') as fo:
-        # global attributes
-        fo.Conventions = 'CF-1.8'
-        fo.title = 'NLDAS-NoahMP runoff and its components'
-        fo.institution = 'Institute of Atmospheric Physics, Chinese Academy of Sciences'
-        fo.source = 'Noah-MP v3.6 driven by NLDAS-2'
-        fo.references = ''
-        fo.comment = ''
-        # dimensions
+            writer.define() as fo:
         tim = fi.variables['time'][:]
-        lat = fi.variables['south_north'][:]
-        lon = fi.variables['west_east'][:]
-        nlat = len(fi.dimensions['south_north'])
-        nlon = len(fi.dimensions['west_east'])
-        fo.createDimension('time', None)
-        fo.createDimension('lat', nlat)
-        fo.createDimension('lon', nlon)
-        # coordinates
-        fo.createVariable('time', 'f8', ('time',), zlib=True, complevel=6)
-        fo.variables['time'].units = fi.variables['time'].units
-        fo.variables['time'].standard_name = 'time'
-        fo.variables['time'].axis = 'T'
-        fo.createVariable('lat', 'f8', ('lat',), zlib=True, complevel=6)
-        fo.variables['lat'].units = fi.variables['south_north'].units
-        fo.variables['lat'].standard_name = fi.variables['south_north'].standard_name
-        fo.variables['lat'].axis = 'Y'
-        fo.createVariable('lon', 'f8', ('lon',), zlib=True, complevel=6)
-        fo.variables['lon'].units = fi.variables['west_east'].units
-        fo.variables['lon'].standard_name = fi.variables['west_east'].standard_name
-        fo.variables['lon'].axis = 'X'
-        fo.variables['lat'][:] = lat
-        fo.variables['lon'][:] = lon
-        # model values
-        fo.createVariable('RUNOFF', 'f4', ('time', 'lat', 'lon'),
-                          fill_value=float('nan'), zlib=True, complevel=6)
-        fo.variables['RUNOFF'].units = 'kg m-2 s-1'
-        fo.variables['RUNOFF'].standard_name = 'runoff_flux'
-        fo.variables['RUNOFF'].long_name = 'runoff'
-        fo.createVariable('SFCRNOFF', 'f4', ('time', 'lat', 'lon'),
-                          fill_value=float('nan'), zlib=True, complevel=6)
-        fo.variables['SFCRNOFF'].units = 'kg m-2 s-1'
-        fo.variables['SFCRNOFF'].standard_name = 'surface_runoff_flux'
-        fo.variables['SFCRNOFF'].long_name = 'surface runoff'
-        fo.createVariable('UGDRNOFF', 'f4', ('time', 'lat', 'lon'),
-                          fill_value=float('nan'), zlib=True, complevel=6)
-        fo.variables['UGDRNOFF'].units = 'kg m-2 s-1'
-        fo.variables['UGDRNOFF'].standard_name = 'subsurface_runoff_flux'
-        fo.variables['UGDRNOFF'].long_name = 'subsurface runoff'
-        # write data
-        for itim, tim in enumerate(fi.variables['time'][:]):
-            fo.variables['time'][itim] = tim
-            runs = fi.variables['SFCRNOFF'][itim, :, :]
-            rung = fi.variables['UGDRNOFF'][itim, :, :]
-            run = runs + rung
-            fo.variables['SFCRNOFF'][itim, :, :] = runs
-            fo.variables['UGDRNOFF'][itim, :, :] = rung
-            fo.variables['RUNOFF'][itim, :, :] = run
+        # packing needs the range of each variable first
+        if packer.needs_scan():
+            scan(packer, read_runoff, compute_runoff,
+                 [(infile, itim) for itim in range(len(tim))], prefetch)
+        define_runoff(fi, fo, packer)
+    # write data, reading the next time steps in the background and
+    # compressing in the writer process
+    with writer:
+        reader = Prefetcher(read_runoff, [(infile, itim) for itim in range(len(tim))],
+                            prefetch)
+        for (_, itim), values in reader:
+            writer.write('time', itim, tim[itim])
+            with noahmp_profile.stage('compute'):
+                outputs = compute_runoff(values)
+            for var, v in outputs.items():
+                writer.write(var, itim, packer.pack(var, v))
+        reader.report()
+    writer.report()
+    packer.report()
     pass
 
 
-if __name__ == '__main__':
+def cli(argv=None):
+    '''command line; argv defaults to sys.argv[1:]'''
     parser = argparse.ArgumentParser(description='extract runoff components.')
     parser.add_argument('indir', type=str,
-                        help='input directory')
+                        help='input directory, or a single CF file')
     parser.add_argument('outdir', type=str,
                         help='output directory')
-    args = parser.parse_args()
-    main(args.indir, args.outdir)
+    parser.add_argument('--prefetch', type=int, default=2,
+                        help='number of time steps read ahead in the background, 0 to disable (default: 2)')
+    parser.add_argument('--queue', type=int, default=8,
+                        help='number of pending writes queued for the background writer, 0 writes in the foreground (default: 8)')
+    parser.add_argument('--pack', nargs='*', metavar='VAR=PRECISION[:MIN:MAX]',
+                        help='store as int16 with scale_factor/add_offset; optional items override the default precision (and bounds) of variables')
+    noahmp_profile.add_arguments(parser)
+    args = parser.parse_args(argv)
+    noahmp_profile.setup(args)
+    main(args.indir, args.outdir, args.prefetch, args.queue, parse_spec(args.pack))
+    return
+
+if __name__ == '__main__':
+    cli()
@@ -6,14 +6,23 @@ import glob
 import argparse
 import numpy as np
 import netCDF4 as nc
+from noahmp_prefetch import Prefetcher, dataset
+from noahmp_writer import Writer
+from noahmp_pack import Packer, parse_spec, scan
+import noahmp_profile
 
+VARIABLES = ['TWS', 'SMC', 'SNW', 'GW', 'SOIL_M', 'ZWT']
 
-def main(indir, outdir):
-    infiles = sorted(glob.glob(os.path.join(indir, '*.nc')))
+
+def main(indir, outdir, prefetch=2, queue=8, pack=None):
+    if os.path.isfile(indir):
+        infiles = [indir]
+    else:
+        infiles = sorted(glob.glob(os.path.join(indir, '*.nc')))
     outfiles = in2outfiles(infiles, outdir)
     for infile, outfile in zip(infiles, outfiles):
         print(infile + ' -> ' + outfile, flush=True)
-        extract_tws(infile, outfile)
+        extract_tws(infile, outfile, prefetch, queue, pack)
     pass
 
 
@@ -25,114 +34,152 @@ def in2outfiles(infiles, outdir):
     return outfiles
 
 
-def extract_tws(infile, outfile):
+def read_tws(item):
+    '''storage components of one time step (prefetch loader)'''
+    infile, itim = item
+    fi = dataset(infile)
+    return [fi.variables[var][itim, ...] for var in ['SOIL_M', 'SNEQV', 'WA', 'ZWT']]
+
+
+def compute_tws(values):
+    '''output variables of one time step'''
+    sm, snw, gw, zwt = values
+    sm1m = np.average(sm, axis=0, weights=[0.1, 0.3, 0.6, 0.0])
+    sm2m = np.average(sm, axis=0, weights=[0.05, 0.15, 0.3, 0.5])
+    smc = sm2m * 2000.0
+    tws = smc + gw + snw
+    return {'TWS': tws, 'SMC': smc, 'SNW': snw, 'GW': gw,
+            'SOIL_M': np.ma.concatenate([sm, sm1m[np.newaxis], sm2m[np.newaxis]]),
+            'ZWT': zwt}
+
+
+def define_tws(fi, fo, packer):
+    '''attributes, dimensions, coordinates and variables of the TWS product'''
+    # global attributes
+    fo.Conventions = 'CF-1.8'
+    fo.title = 'NLDAS-NoahMP terrestrial water storage and its components'
+    fo.institution = 'Institute of Atmospheric Physics, Chinese Academy of Sciences'
+    fo.source = 'Noah-MP v3.6 driven by NLDAS-2'
+    fo.references = ''
+    fo.comment = ''
+    # dimensions
+    lat = fi.variables['south_north'][:]
+    lon = fi.variables['west_east'][:]
+    nlat = len(fi.dimensions['south_north'])
+    nlon = len(fi.dimensions['west_east'])
+    depth = np.array([0.05, 0.25, 0.7, 1.5, 0.5, 1.0])
+    depth_bnds = np.transpose(np.array([[0.0, 0.1, 0.4, 1.0, 0.0, 0.0],
+                                        [0.1, 0.4, 1.0, 2.0, 1.0, 2.0]]))
+    ndepth = len(depth)
+    fo.createDimension('time', None)
+    fo.createDimension('depth', ndepth)
+    fo.createDimension('lat', nlat)
+    fo.createDimension('lon', nlon)
+    fo.createDimension('bnd', 2)
+    # coordinates
+    fo.createVariable('time', 'f8', ('time',), zlib=True, complevel=6)
+    fo.variables['time'].units = fi.variables['time'].units
+    fo.variables['time'].standard_name = 'time'
+    fo.variables['time'].axis = 'T'
+    fo.createVariable('depth', 'f4', ('depth',), zlib=True, complevel=6)
+    fo.variables['depth'].units = 'm'
+    fo.variables['depth'].standard_name = 'depth'
+    fo.variables['depth'].positive = 'down'
+    fo.variables['depth'].axis = 'Z'
+    fo.variables['depth'].bounds = 'depth_bnds'
+    fo.createVariable('depth_bnds', 'f4', ('depth', 'bnd'),
+                      zlib=True, complevel=6)
+    fo.createVariable('lat', 'f8', ('lat',), zlib=True, complevel=6)
+    fo.variables['lat'].units = fi.variables['south_north'].units
+    fo.variables['lat'].standard_name = fi.variables['south_north'].standard_name
+    fo.variables['lat'].axis = 'Y'
+    fo.createVariable('lon', 'f8', ('lon',), zlib=True, complevel=6)
+    fo.variables['lon'].units = fi.variables['west_east'].units
+    fo.variables['lon'].standard_name = fi.variables['west_east'].standard_name
+    fo.variables['lon'].axis = 'X'
+    fo.variables['depth'][:] = depth
+    fo.variables['depth_bnds'][:] = depth_bnds
+    fo.variables['lat'][:] = lat
+    fo.variables['lon'][:] = lon
+    # model values
+    packer.create_variable(fo, 'TWS', ('time', 'lat', 'lon'),
+                           zlib=True, complevel=6)
+    fo.variables['TWS'].units = 'kg m-2'
+    fo.variables['TWS'].standard_name = 'land_water_amount'
+    fo.variables['TWS'].long_name = 'terrestrial water storage'
+    packer.create_variable(fo, 'SMC', ('time', 'lat', 'lon'),
+                           zlib=True, complevel=6)
+    fo.variables['SMC'].units = 'kg m-2'
+    fo.variables['SMC'].standard_name = 'mass_content_of_water_in_soil'
+    fo.variables['SMC'].long_name = 'soil moisture content'
+    packer.create_variable(fo, 'SNW', ('time', 'lat', 'lon'),
+                           zlib=True, complevel=6)
+    fo.variables['SNW'].units = 'kg m-2'
+    fo.variables['SNW'].standard_name = 'surface_snow_amount'
+    fo.variables['SNW'].long_name = 'snow water equivalent'
+    packer.create_variable(fo, 'GW', ('time', 'lat', 'lon'),
+                           zlib=True, complevel=6)
+    fo.variables['GW'].units = 'kg m-2'
+    fo.variables['GW'].long_name = 'groundwater storage'
+    packer.create_variable(fo, 'SOIL_M', ('time', 'depth', 'lat', 'lon'),
+                           zlib=True, complevel=6)
+    fo.variables['SOIL_M'].units = 'm3 m-3'
+    fo.variables['SOIL_M'].standard_name = 'volume_fraction_of_condensed_water_in_soil'
+    fo.variables['SOIL_M'].long_name = 'volumetric soil water content'
+    packer.create_variable(fo, 'ZWT', ('time', 'lat', 'lon'),
+                           zlib=True, complevel=6)
+    fo.variables['ZWT'].units = 'm'
+    fo.variables['ZWT'].standard_name = 'water_table_depth'
+    fo.variables['ZWT'].long_name = 'water table depth'
+
+
+def extract_tws(infile, outfile, prefetch=2, queue=8, pack=None):
+    packer = Packer(pack, VARIABLES)
+    writer = Writer(outfile, queue, maskandscale=False)
     with nc.Dataset(infile, 'r') as fi, \
-            nc.Dataset(outfile, 'w') as fo:
-        # global attributes
-        fo.Conventions = 'CF-1.8'
-        fo.title = 'NLDAS-NoahMP terrestrial water storage and its components'
-        fo.institution = 'Institute of Atmospheric Physics, Chinese Academy of Sciences'
-        fo.source = 'Noah-MP v3.6 driven by NLDAS-2'
-        fo.references = ''
-        fo.comment = ''
-        # dimensions
+            writer.define() as fo:
         tim = fi.variables['time'][:]
-        lat = fi.variables['south_north'][:]
-        lon = fi.variables['west_east'][:]
-        nlat = len(fi.dimensions['south_north'])
-        nlon = len(fi.dimensions['west_east'])
-        depth = np.array([0.05, 0.25, 0.7, 1.5, 0.5, 1.0])
-        depth_bnds = np.transpose(np.array([[0.0, 0.1, 0.4, 1.0, 0.0, 0.0],
-                                            [0.1, 0.4, 1.0, 2.0, 1.0, 2.0]]))
-        ndepth = len(depth)
-        fo.createDimension('time', None)
-        fo.createDimension('depth', ndepth)
-        fo.createDimension('lat', nlat)
-        fo.createDimension('lon', nlon)
-        fo.createDimension('bnd', 2)
-        # coordinates
-        fo.createVariable('time', 'f8', ('time',), zlib=True, complevel=6)
-        fo.variables['time'].units = fi.variables['time'].units
-        fo.variables['time'].standard_name = 'time'
-        fo.variables['time'].axis = 'T'
-        fo.createVariable('depth', 'f4', ('depth',), zlib=True, complevel=6)
-        fo.variables['depth'].units = 'm'
-        fo.variables['depth'].standard_name = 'depth'
-        fo.variables['depth'].positive = 'down'
-        fo.variables['depth'].axis = 'Z'
-        fo.variables['depth'].bounds = 'depth_bnds'
-        fo.createVariable('depth_bnds', 'f4', ('depth', 'bnd'),
-                          zlib=True, complevel=6)
-        fo.createVariable('lat', 'f8', ('lat',), zlib=True, complevel=6)
-        fo.variables['lat'].units = fi.variables['south_north'].units
-        fo.variables['lat'].standard_name = fi.variables['south_north'].standard_name
-        fo.variables['lat'].axis = 'Y'
-        fo.createVariable('lon', 'f8', ('lon',), zlib=True, complevel=6)
-        fo.variables['lon'].units = fi.variables['west_east'].units
-        fo.variables['lon'].standard_name = fi.variables['west_east'].standard_name
-        fo.variables['lon'].axis = 'X'
-        fo.variables['depth'][:] = depth
-        fo.variables['depth_bnds'][:] = depth_bnds
-        fo.variables['lat'][:] = lat
-        fo.variables['lon'][:] = lon
-        # model values
-        fo.createVariable('TWS', 'f4', ('time', 'lat', 'lon'),
-                          fill_value=float('nan'), zlib=True, complevel=6)
-        fo.variables['TWS'].units = 'kg m-2'
-        fo.variables['TWS'].standard_name = 'land_water_amount'
-        fo.variables['TWS'].long_name = 'terrestrial water storage'
-        fo.createVariable('SMC', 'f4', ('time', 'lat', 'lon'),
-                          fill_value=float('nan'), zlib=True, complevel=6)
-        fo.variables['SMC'].units = 'kg m-2'
-        fo.variables['SMC'].standard_name = 'mass_content_of_water_in_soil'
-        fo.variables['SMC'].long_name = 'soil moisture content'
-        fo.createVariable('SNW', 'f4', ('time', 'lat', 'lon'),
-                          fill_value=float('nan'), zlib=True, complevel=6)
-        fo.variables['SNW'].units = 'kg m-2'
-        fo.variables['SNW'].standard_name = 'surface_snow_amount'
-        fo.variables['SNW'].long_name = 'snow water equivalent'
-        fo.createVariable('GW', 'f4', ('time', 'lat', 'lon'),
-                          fill_value=float('nan'), zlib=True, complevel=6)
-        fo.variables['GW'].units = 'kg m-2'
-        fo.variables['GW'].long_name = 'groundwater storage'
-        fo.createVariable('SOIL_M', 'f4', ('time', 'depth', 'lat', 'lon'),
-                          fill_value=float('nan'), zlib=True, complevel=6)
-        fo.variables['SOIL_M'].units = 'm3 m-3'
-        fo.variables['SOIL_M'].standard_name = 'volume_fraction_of_condensed_water_in_soil'
-        fo.variables['SOIL_M'].long_name = 'volumetric soil water content'
-        fo.createVariable('ZWT', 'f4', ('time', 'lat', 'lon'),
-                          fill_value=float('nan'), zlib=True, complevel=6)
-        fo.variables['ZWT'].units = 'm'
-        fo.variables['ZWT'].standard_name = 'water_table_depth'
-        fo.variables['ZWT'].long_name = 'water table depth'
-        # write data
-        for itim, tim in enumerate(fi.variables['time'][:]):
-            fo.variables['time'][itim] = tim
-            sm = fi.variables['SOIL_M'][itim, :, :, :]
-            sm1m = np.average(sm, axis=0, weights=[0.1, 0.3, 0.6, 0.0])
-            sm2m = np.average(sm, axis=0, weights=[0.05, 0.15, 0.3, 0.5])
-            smc = sm2m * 2000.0
-            snw = fi.variables['SNEQV'][itim, :, :]
-            gw = fi.variables['WA'][itim, :, :]
-            zwt = fi.variables['ZWT'][itim, :, :, ]
-            tws = smc + gw + snw
-            fo.variables['TWS'][itim, :, :] = tws
-            fo.variables['SMC'][itim, :, :] = smc
-            fo.variables['SNW'][itim, :, :] = snw
-            fo.variables['GW'][itim, :, :] = gw
-            fo.variables['SOIL_M'][itim, 0:4, :, :] = sm
-            fo.variables['SOIL_M'][itim, 4, :, :] = sm1m
-            fo.variables['SOIL_M'][itim, 5, :, :] = sm2m
-            fo.variables['ZWT'][itim, :, :] = zwt
+        # packing needs the range of each variable first
+        if packer.needs_scan():
+            scan(packer, read_tws, compute_tws,
+                 [(infile, itim) for itim in range(len(tim))], prefetch)
+        define_tws(fi, fo, packer)
+    # write data, reading the next time steps in the background and
+    # compressing in the writer process
+    with writer:
+        reader = Prefetcher(read_tws, [(infile, itim) for itim in range(len(tim))],
+                            prefetch)
+        for (_, itim), values in reader:
+            writer.write('time', itim, tim[itim])
+            with noahmp_profile.stage('compute'):
+                outputs = compute_tws(values)
+            for var, v in outputs.items():
+                writer.write(var, itim, packer.pack(var, v))
+        reader.report()
+    writer.report()
+    packer.report()
     pass
 
 
-if __name__ == '__main__':
+def cli(argv=None):
+    '''command line; argv defaults to sys.argv[1:]'''
     parser = argparse.ArgumentParser(
         description='extract terrestrial water storage and its components.')
     parser.add_argument('indir', type=str,
-                        help='input directory')
+                        help='input directory, or a single CF file')
     parser.add_argument('outdir', type=str,
                         help='output directory')
-    args = parser.parse_args()
-    main(args.indir, args.outdir)
+    parser.add_argument('--prefetch', type=int, default=2,
+                        help='number of time steps read ahead in the background, 0 to disable (default: 2)')
+    parser.add_argument('--queue', type=int, default=8,
+                        help='number of pending writes queued for the background writer, 0 writes in the foreground (default: 8)')
+    parser.add_argument('--pack', nargs='*', metavar='VAR=PRECISION[:MIN:MAX]',
+                        help='store as int16 with scale_factor/add_offset; optional items override the default precision (and bounds) of variables')
+    noahmp_profile.add_arguments(parser)
+    args = parser.parse_args(argv)
+    noahmp_profile.setup(args)
+    main(args.indir, args.outdir, args.prefetch, args.queue, parse_spec(args.pack))
+    return
+
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# check that the forcing (LDASIN) files cover a Noah-MP case and its spinups
+
+import sys
+import os
+import os.path
+import glob
+import json
+import hashlib
+import datetime
+import argparse
+import concurrent.futures
+import f90nml
+
+NAMELIST = 'namelist.hrldas'
+CACHEDIR = os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'),
+                        'noahmp-tools')
+
+def stat(indir, names, nproc=16):
+    '''{file name: [size, mtime_ns]} of names in indir, stat-ing files in
+    parallel; files gone since are left out'''
+    def entry(name):
+        try:
+            st = os.stat(os.path.join(indir, name))
+        except FileNotFoundError:
+            return None
+        return [st.st_size, st.st_mtime_ns]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=nproc) as pool:
+        return {name: x for name, x in zip(names, pool.map(entry, names)) if x is not None}
+
+def scan(indir, nproc=16):
+    '''{LDASIN file name: [size, mtime_ns]} of indir'''
+    with os.scandir(indir) as it:
+        names = [entry.name for entry in it if '.LDASIN_DOMAIN' in entry.name]
+    return stat(indir, names, nproc)
+
+def index_file(indir):
+    '''per-user cache file of the listing of indir'''
+    key = hashlib.sha1(os.path.abspath(indir).encode('utf-8')).hexdigest()[:16]
+    return os.path.join(CACHEDIR, 'ldasin-' + key + '.json')
+
+def forcing_index(indir, nproc=16):
+    '''{LDASIN file name: size}
+
+    The listing of indir is cached in the user cache directory (never in
+    the shared forcing directory) until indir changes. Every listed file
+    is still stat-ed, since a file filled in or truncated later does not
+    change the directory.
+    '''
+    indexfile = index_file(indir)
+    mtime = os.stat(indir).st_mtime_ns
+    cached = None
+    try:
+        with open(indexfile, 'rt') as f:
+            index = json.load(f)
+        if index['indir'] == os.path.abspath(indir) and index['mtime_ns'] == mtime:
+            cached = index['files']
+    except (OSError, ValueError, KeyError):
+        pass
+    if cached is not None:
+        files = stat(indir, list(cached), nproc)
+    else:
+        files = scan(indir, nproc)
+    if files != cached:
+        try:
+            os.makedirs(CACHEDIR, exist_ok=True)
+            tmpfile = indexfile + '.' + str(os.getpid())
+            with open(tmpfile, 'wt') as f:
+                json.dump({'indir': os.path.abspath(indir), 'mtime_ns': mtime, 'files': files}, f)
+            os.replace(tmpfile, indexfile)
+        except OSError:
+            pass
+    return {name: x[0] for name, x in files.items()}
+
+def forcing_time(name):
+    '''time stamp of a YYYYMMDDHH.LDASIN_DOMAIN? file name, or None'''
+    try:
+        return datetime.datetime.strptime(name[0:10], '%Y%m%d%H')
+    except ValueError:
+        return None
+
+def forcing_times(files):
+    '''{time stamp: size} of YYYYMMDDHH.LDASIN_DOMAIN? files'''
+    return {forcing_time(name): size for name, size in files.items() if forcing_time(name) is not None}
+
+def case_window(dirname):
+    '''forcing directory, begin, end, and forcing time step of a case directory'''
+    nml = f90nml.read(os.path.join(dirname, NAMELIST))['noahlsm_offline']
+    dtbeg = datetime.datetime(nml['start_year'], nml['start_month'], nml['start_day'],
+                              nml['start_hour'], nml['start_min'])
+    dtend = dtbeg + datetime.timedelta(days=nml['kday'])
+    return (os.path.join(dirname, nml['indir']), dtbeg, dtend,
+            datetime.timedelta(seconds=nml.get('forcing_timestep', 3600)))
+
+def window_times(dtbeg, dtend, step):
+    '''forcing time stamps read by a run from dtbeg to dtend: both ends are
+    included, the last time step needs the forcing valid at dtend'''
+    times = []
+    dt = dtbeg
+    while dt <= dtend:
+        times.append(dt)
+        dt += step
+    return times
+
+def gaps(times, dtbeg, dtend, step):
+    '''[(first, last, number)] of missing or empty forcing in window_times'''
+    missing = []
+    for dt in window_times(dtbeg, dtend, step):
+        if times.get(dt, 0) <= 0:
+            if len(missing) > 0 and missing[-1][1] + step == dt:
+                missing[-1] = (missing[-1][0], dt, missing[-1][2] + 1)
+            else:
+                missing.append((dt, dt, 1))
+    return missing
+
+def main(caseroot, nproc=16):
+    '''report forcing gaps of caseroot and its spinups; True if fully covered'''
+    caseroot = os.path.abspath(caseroot)
+    indexes = {}
+    covered = True
+    for dirname in sorted(glob.glob(os.path.join(caseroot, 'spinup-*'))) + [caseroot]:
+        indir, dtbeg, dtend, step = case_window(dirname)
+        if indir not in indexes:
+            if not os.path.isdir(indir):
+                print('CHECK_FORCING: ' + dirname + ': no such directory ' + indir)
+                covered = False
+                continue
+            indexes[indir] = forcing_times(forcing_index(indir, nproc))
+        missing = gaps(indexes[indir], dtbeg, dtend, step)
+        nmissing = sum(x[2] for x in missing)
+        print('CHECK_FORCING: {0:s}: {1:s} - {2:s}, {3:d} missing'.format(
+            dirname, dtbeg.strftime('%Y-%m-%d %H'), dtend.strftime('%Y-%m-%d %H'), nmissing))
+        for first, last, number in missing:
+            print('    {0:s} - {1:s} ({2:d})'.format(
+                first.strftime('%Y-%m-%d %H'), last.strftime('%Y-%m-%d %H'), number))
+        covered = covered and nmissing == 0
+    return covered
+
+def cli(argv=None):
+    '''command line; argv defaults to sys.argv[1:]'''
+    parser = argparse.ArgumentParser(description='check forcing coverage of a Noah-MP case and its spinups')
+    parser.add_argument('caseroot', nargs='+', type=str,
+                        help='top-level directory of Noah-MP case')
+    parser.add_argument('-j', '--jobs', type=int, default=16,
+                        help='number of parallel stat calls (default: 16)')
+    args = parser.parse_args(argv)
+    ok = True
+    for caseroot in args.caseroot:
+        ok = main(caseroot, nproc=args.jobs) and ok
+    sys.exit(0 if ok else 1)
+    return
+
+if __name__ == '__main__':
+    cli()
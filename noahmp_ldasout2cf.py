@@ -7,11 +7,21 @@
 import sys
 import os
 import glob
+import time
 import datetime
 import argparse
+import functools
+import traceback
+import concurrent.futures
 import dateutil.parser
 import numpy as np
 import netCDF4 as nc
+import f90nml
+from noahmp_strip_output import strip_file
+from noahmp_prefetch import Prefetcher
+from noahmp_writer import Writer
+import noahmp_regrid
+import noahmp_profile
 np.seterr(invalid='ignore')
 
 
@@ -24,13 +34,25 @@ YDIM = 'south_north'
 YVAR = 'SOUTH_NORTH'
 ACCVARS = ['ACSNOW', 'ACSNOM', 'SFCRNOFF', 'UGDRNOFF']
 VALIDMIN = -1e10
+NAMELIST = 'namelist.hrldas'
 
 def datetime4name(filename):
     timestr = os.path.basename(filename).split('.')[0]
     return datetime.datetime.strptime(timestr, '%Y%m%d%H')
 
-def source_info(datadir, begtime, endtime):
-    allfiles = sorted(glob.glob(os.path.join(datadir, '*.LDASOUT_DOMAIN1')))
+def ldasout_name(dt, domain=1):
+    return dt.strftime('%Y%m%d%H') + '.LDASOUT_DOMAIN{0:d}'.format(domain)
+
+def scan_domains(datadir):
+    '''LDASOUT files of every domain in datadir, from a single directory scan'''
+    domains = {}
+    for f in sorted(glob.glob(os.path.join(datadir, '*.LDASOUT_DOMAIN[0-9]'))):
+        domains.setdefault(int(f[-1]), []).append(f)
+    return domains
+
+def source_info(datadir, begtime, endtime, domain=1, allfiles=None):
+    if allfiles is None:
+        allfiles = sorted(glob.glob(os.path.join(datadir, '*.LDASOUT_DOMAIN{0:d}'.format(domain))))
     files = [x for x in allfiles
              if datetime4name(x) >= begtime and datetime4name(x) < endtime]
     timestep = 0
@@ -46,17 +68,21 @@ def source_info(datadir, begtime, endtime):
             integrity = True
     return files, timestep, integrity
 
-def define_output(wrfinput, fi, fo):
-    # inquire spatial dimension from wrfinput
-    with nc.Dataset(wrfinput, 'r') as fwrf:
-        if fwrf.MAP_PROJ == 6:
-            lat2d = np.squeeze(fwrf.variables['XLAT'][:])
-            lon2d = np.squeeze(fwrf.variables['XLONG'][:])
-            lat = lat2d[:,0]
-            lon = lon2d[0,:]
-        else:
-            lat = None
-            lon = None
+def define_output(wrfinput, fi, fo, grid=None):
+    # inquire spatial dimension from wrfinput, or the (lat, lon) of the
+    # regular grid the output is regridded to
+    if grid is not None:
+        lat, lon = grid
+    else:
+        with nc.Dataset(wrfinput, 'r') as fwrf:
+            if fwrf.MAP_PROJ == 6:
+                lat2d = np.squeeze(fwrf.variables['XLAT'][:])
+                lon2d = np.squeeze(fwrf.variables['XLONG'][:])
+                lat = lat2d[:,0]
+                lon = lon2d[0,:]
+            else:
+                lat = None
+                lon = None
     # create Dimension
     dimset = set()
     for var in fi.variables:
@@ -66,6 +92,8 @@ def define_output(wrfinput, fi, fo):
     for dim in dimset:
         if dim == TDIM:
             fo.createDimension(dim, None)
+        elif grid is not None and dim in [YDIM, XDIM]:
+            fo.createDimension(dim, len(lat) if dim == YDIM else len(lon))
         else:
             fo.createDimension(dim, len(fi.dimensions[dim]))
     # create vars
@@ -107,7 +135,7 @@ def define_output(wrfinput, fi, fo):
             elif len(dims) == 1:
                 zdim = dims[0]
                 dims_n.insert(1, zdim)
-            if np.issubdtype(dtype, np.float):
+            if np.issubdtype(dtype, np.floating):
                 fo.createVariable(var, dtype, dims_n,
                                   zlib=True, complevel=6, fill_value=np.nan)
             else:
@@ -120,11 +148,11 @@ def define_output(wrfinput, fi, fo):
         else:                   # ACCVARS
             dtype = fi.variables[var].dtype
             dims = [x.lower() for x in fi.variables[var].dimensions]
-            if np.issubdtype(dtype, np.float):
-                fo.createVariable(var, dtype, dims_n,
+            if np.issubdtype(dtype, np.floating):
+                fo.createVariable(var, dtype, dims,
                                   zlib=True, complevel=6, fill_value=np.nan)
             else:
-                fo.createVariable(var, dtype, dims_n, zlib=True, complevel=6)
+                fo.createVariable(var, dtype, dims, zlib=True, complevel=6)
             for att in fi.variables[var].ncattrs():
                 attval = fi.variables[var].getncattr(att)
                 if att.lower() == 'units':
@@ -141,86 +169,377 @@ def define_output(wrfinput, fi, fo):
             fo.setncattr(att, fi.getncattr(att))
     return
 
-def copy_var(fi, fo, var, ind):
-    if var.lower() in [TDIM, XDIM, YDIM] \
-       or var.upper() in [TVAR, XVAR, YVAR] \
-       or var.upper() in ACCVARS:
-        return
+def skip_var(var):
+    '''coordinates and ACCVARS are not copied'''
+    return var.lower() in [TDIM, XDIM, YDIM] \
+        or var.upper() in [TVAR, XVAR, YVAR] \
+        or var.upper() in ACCVARS
+
+def read_var(fi, var):
     # mask invalid value
     fi.variables[var].set_auto_maskandscale(False)
-    fo.variables[var].set_auto_maskandscale(False)
-    v = fi.variables[var][:]
+    with noahmp_profile.stage('read'):
+        v = fi.variables[var][:]
 
-    if np.issubdtype(fi.variables[var].dtype, np.float):
-        v[v <= VALIDMIN] = np.nan
+    if np.issubdtype(fi.variables[var].dtype, np.floating):
+        with noahmp_profile.stage('mask'):
+            v[v <= VALIDMIN] = np.nan
 
     # swap dimension
     dims = [x.lower() for x in fi.variables[var].dimensions]
     zdim = set(dims) - set([TDIM, XDIM, YDIM])
     if len(zdim) == 1:
         zdim = zdim.pop()
-        v = np.swapaxes(v, dims.index(zdim), 1)
-    fo.variables[var][ind,...] = v
-    return
+        with noahmp_profile.stage('swap'):
+            v = np.swapaxes(v, dims.index(zdim), 1)
+    return v
 
-def acc2flx(fic, fip, fo, var, ind, ts):
-    if var.upper() not in ACCVARS:
+def copy_var(fi, fo, var, ind):
+    if skip_var(var):
         return
-    fic.variables[var].set_auto_maskandscale(False)
-    fip.variables[var].set_auto_maskandscale(False)
     fo.variables[var].set_auto_maskandscale(False)
-    vc = fic.variables[var][:]
-    vp = fip.variables[var][:]
-    vc[vc <= VALIDMIN] = np.nan
-    vp[vp <= VALIDMIN] = np.nan
-    fo.variables[var][ind,...] = (vc - vp) / ts
+    v = read_var(fi, var)
+    with noahmp_profile.stage('write.' + var):
+        fo.variables[var][ind,...] = v
+    noahmp_profile.count('written', var, v)
     return
 
-def main(wrfinput, datadir, outfile, begtime, endtime, partially=False):
-    files, timestep, integrity = source_info(datadir, begtime, endtime)
+def read_acc(fi, var):
+    fi.variables[var].set_auto_maskandscale(False)
+    with noahmp_profile.stage('read'):
+        v = fi.variables[var][:]
+    with noahmp_profile.stage('mask'):
+        v[v <= VALIDMIN] = np.nan
+    return v
+
+def acc2flx(accs, ts):
+    '''fluxes (N, ...) between N+1 consecutive accumulator slices (N+1, ...)
+
+    A negative difference means the accumulator was reset (model restart)
+    within the step; the flux is then the accumulation since the reset.
+    '''
+    flx = np.diff(accs, axis=0)
+    reset = flx < 0
+    flx[reset] = accs[1:][reset]
+    return flx / ts
+
+def regrid(regridder, fi, var, v):
+    '''v of var on the output grid'''
+    dims = [x.lower() for x in fi.variables[var].dimensions]
+    if regridder is None or YDIM not in dims or XDIM not in dims:
+        return v
+    with noahmp_profile.stage('regrid'):
+        return regridder.apply(v)
+
+def read_ldasout(filename, weights=None):
+    '''copied variables and accumulators of an LDASOUT file (prefetch loader)'''
+    regridder = noahmp_regrid.load(weights) if weights is not None else None
+    with nc.Dataset(filename, 'r') as fi:
+        values = {var: regrid(regridder, fi, var, read_var(fi, var))
+                  for var in fi.variables if not skip_var(var)}
+        accs = {var: regrid(regridder, fi, var, read_acc(fi, var)) for var in ACCVARS}
+    return values, accs
+
+def main(wrfinput, datadir, outfile, begtime, endtime, partially=False,
+         prefetch=2, queue=8, domain=1, allfiles=None,
+         grid=None, method='bilinear', weightsdir=None, block=24):
+    with noahmp_profile.stage('source_info'):
+        files, timestep, integrity = source_info(datadir, begtime, endtime, domain, allfiles)
     if (not integrity) and (not partially):
         print('not enough files (try --partially)')
         sys.exit(1)
-    with nc.Dataset(outfile, 'w') as fo:
-        for ifile in range(len(files)):
-            print(files[ifile])
-            with nc.Dataset(files[ifile], 'r') as fi:
-                if ifile == 0:
-                    define_output(wrfinput, fi, fo)
-                fo.variables[TDIM][ifile] = nc.date2num(datetime4name(files[ifile]),
-                                                        fo.variables[TDIM].units)
-                for var in fi.variables:
-                    if var.upper() in ACCVARS:
-                        continue
-                    copy_var(fi, fo, var, ifile)
-        print('acc to flux')
-        for ifile in reversed(range(1,len(files))):
-            with nc.Dataset(files[ifile], 'r') as fic, \
-                 nc.Dataset(files[ifile-1], 'r') as fip:
+    block = max(block, 1)
+    weights = None
+    regridder = None
+    if grid is not None:
+        weights = noahmp_regrid.weights_file(wrfinput, grid[0], grid[1], method,
+                                             weightsdir or os.path.dirname(os.path.abspath(outfile)))
+        regridder = noahmp_regrid.load(weights)
+    writer = Writer(outfile, queue, maskandscale=False)
+    with noahmp_profile.stage('define'), nc.Dataset(files[0], 'r') as fi, writer.define() as fo:
+        define_output(wrfinput, fi, fo, grid)
+    # read file N+1 while file N is compressed and written; accumulators
+    # are differenced in blocks on the way
+    with writer:
+        reader = Prefetcher(functools.partial(read_ldasout, weights=weights), files, prefetch)
+        accs = []               # accumulators of the block, from the file before it
+        flx1 = {}               # fluxes of the second file
+        for ifile, (f, (values, accc)) in enumerate(reader):
+            print(f)
+            writer.write(TDIM, ifile, nc.date2num(datetime4name(f), timeunits))
+            for var, v in values.items():
+                writer.write(var, ifile, v)
+            if ifile == 0:
+                acc0 = accc
+            accs.append(accc)
+            # fluxes of up to `block` files in one vectorized difference
+            if len(accs) > block or (ifile == len(files) - 1 and len(accs) > 1):
+                ind = slice(ifile - len(accs) + 2, ifile + 1)
                 for var in ACCVARS:
-                    acc2flx(fic, fip, fo, var, ifile, timestep)
+                    with noahmp_profile.stage('acc2flx'):
+                        flx = acc2flx(np.concatenate([x[var] for x in accs]), timestep)
+                    writer.write(var, ind, flx)
+                    if ind.start == 1:
+                        flx1[var] = flx[0]
+                accs = accs[-1:]
+        reader.report()
         startfile = os.path.join(datadir,
-                                 (datetime4name(files[0]) - datetime.timedelta(seconds=timestep)).strftime('%Y%m%d%H') + '.LDASOUT_DOMAIN1')
+                                 ldasout_name(datetime4name(files[0]) - datetime.timedelta(seconds=timestep), domain))
         if os.path.exists(startfile):
-            with nc.Dataset(files[0], 'r') as fic, \
-                 nc.Dataset(startfile, 'r') as fip:
+            with nc.Dataset(startfile, 'r') as fip:
                 for var in ACCVARS:
-                    acc2flx(fic, fip, fo, var, 0, timestep)
+                    accp = regrid(regridder, fip, var, read_acc(fip, var))
+                    with noahmp_profile.stage('acc2flx'):
+                        flx = acc2flx(np.concatenate([accp, acc0[var]]), timestep)[0]
+                    writer.write(var, 0, flx)
         else:
             for var in ACCVARS:
-                fo.variables[var][0,...] = fo.variables[var][1,...]
+                writer.write(var, 0, flx1[var])
+    writer.report()
     return
 
-if __name__ == '__main__':
+def finished_files(datadir, begtime, endtime, settle, domain=1):
+    '''LDASOUT files in [begtime, endtime) the model has finished writing
+
+    A file is finished once a later output exists, or once it has not
+    been modified for `settle` seconds (the model has stopped).
+    '''
+    allfiles = sorted(glob.glob(os.path.join(datadir, '*.LDASOUT_DOMAIN{0:d}'.format(domain))))
+    files = [x for x in allfiles
+             if datetime4name(x) >= begtime and datetime4name(x) < endtime]
+    if len(files) > 0 and files[-1] == allfiles[-1] \
+       and time.time() - os.path.getmtime(files[-1]) < settle:
+        files = files[:-1]
+    return files
+
+def nominal_timestep(datadir, domain=1):
+    '''seconds between outputs: OUTPUT_TIMESTEP of the namelist in datadir,
+    else the step between its first two outputs; 0 while unknown'''
+    namelist = os.path.join(datadir, NAMELIST)
+    if os.path.isfile(namelist):
+        nml = f90nml.read(namelist).get('noahlsm_offline', {})
+        if nml.get('output_timestep'):
+            return float(nml['output_timestep'])
+    allfiles = sorted(glob.glob(os.path.join(datadir, '*.LDASOUT_DOMAIN{0:d}'.format(domain))))
+    if len(allfiles) > 1:
+        return (datetime4name(allfiles[1]) - datetime4name(allfiles[0])).total_seconds()
+    return 0
+
+def watch(wrfinput, datadir, outfile, begtime, endtime, strip=False,
+          interval=60.0, settle=600.0, timeout=7200.0, domain=1, partially=False):
+    '''convert LDASOUT files to outfile while the model is still writing
+    them; True if no output of [begtime, endtime) is missing
+
+    The output is written to outfile.part and renamed to outfile at the
+    end; if outputs are missing it is renamed only with partially.
+    '''
+    ifile = 0
+    accp = None                 # accumulators of the previous file
+    dt0 = None
+    dtp = None
+    timestep = 0                # nominal step between outputs
+    flx0 = False                # fluxes of the first output written
+    integrity = True
+    idle = time.time()
+    partfile = outfile + '.part'
+    try:
+        with nc.Dataset(partfile, 'w') as fo:
+            while True:
+                if timestep <= 0:
+                    timestep = nominal_timestep(datadir, domain)
+                files = finished_files(datadir, begtime, endtime, settle, domain)
+                if ifile >= len(files):
+                    if dtp is not None and timestep > 0 \
+                       and (endtime - dtp).total_seconds() <= timestep:
+                        break
+                    if time.time() - idle > timeout:
+                        print('no new files for {0:.0f} seconds, giving up'.format(timeout))
+                        print('missing outputs after ' + (dtp.isoformat() if dtp is not None else begtime.isoformat()))
+                        integrity = False
+                        break
+                    time.sleep(interval)
+                    continue
+                idle = time.time()
+                for f in files[ifile:]:
+                    print(f, flush=True)
+                    if strip:
+                        strip_file(f)
+                    dtc = datetime4name(f)
+                    with nc.Dataset(f, 'r') as fi:
+                        if ifile == 0:
+                            define_output(wrfinput, fi, fo)
+                        fo.variables[TDIM][ifile] = nc.date2num(dtc, fo.variables[TDIM].units)
+                        for var in fi.variables:
+                            if var.upper() in ACCVARS:
+                                continue
+                            copy_var(fi, fo, var, ifile)
+                        accc = {var: read_acc(fi, var) for var in ACCVARS}
+                    for var in ACCVARS:
+                        fo.variables[var].set_auto_maskandscale(False)
+                    if ifile == 0:
+                        dt0 = dtc
+                    else:
+                        step = (dtc - dtp).total_seconds()
+                        if timestep <= 0:
+                            timestep = step
+                        if step > timestep:
+                            print('missing outputs between {0:s} and {1:s}'.format(dtp.isoformat(), dtc.isoformat()))
+                            integrity = False
+                        for var in ACCVARS:
+                            fo.variables[var][ifile,...] = acc2flx(np.concatenate([accp[var], accc[var]]), step)[0]
+                    if not flx0 and timestep > 0:
+                        # fluxes of the first output: from the output before it,
+                        # else those of the second output
+                        startfile = os.path.join(datadir,
+                                                 ldasout_name(dt0 - datetime.timedelta(seconds=timestep), domain))
+                        acc0 = accc if ifile == 0 else accp
+                        if os.path.exists(startfile):
+                            with nc.Dataset(startfile, 'r') as fip:
+                                for var in ACCVARS:
+                                    fo.variables[var][0,...] = acc2flx(np.concatenate([read_acc(fip, var), acc0[var]]), timestep)[0]
+                            flx0 = True
+                        elif ifile > 0:
+                            for var in ACCVARS:
+                                fo.variables[var][0,...] = fo.variables[var][1,...]
+                            flx0 = True
+                    accp, dtp = accc, dtc
+                    ifile += 1
+                    fo.sync()
+            if dt0 is not None and (dt0 - begtime).total_seconds() >= max(timestep, 1):
+                print('missing outputs before ' + dt0.isoformat())
+                integrity = False
+            if ifile > 0 and not flx0:
+                print('no fluxes of accumulated variables at ' + dt0.isoformat() + ' (no earlier output)')
+    except BaseException:
+        if os.path.exists(partfile):
+            os.remove(partfile)
+        raise
+    if integrity or partially:
+        os.replace(partfile, outfile)
+    else:
+        print('incomplete output left in ' + partfile + ' (try --partially)')
+    return integrity
+
+def convert_domain(kwargs):
+    '''main() of one domain in a pool worker; True on success'''
+    try:
+        main(**kwargs)
+    except SystemExit:
+        return False
+    except Exception:
+        print('domain {0:d}:\n'.format(kwargs['domain']) + traceback.format_exc(), flush=True)
+        return False
+    return True
+
+def main_domains(wrfinput, datadir, outfile, begtime, endtime, partially=False,
+                 prefetch=2, queue=8, domains=None, nproc=None,
+                 grid=None, method='bilinear', weightsdir=None, block=24):
+    '''convert every domain (or `domains`) concurrently
+
+    wrfinput and outfile are patterns like wrfinput_d{domain:02d}.
+    '''
+    allfiles = scan_domains(datadir)
+    if domains is None:
+        domains = sorted(allfiles)
+    jobs = {}
+    with concurrent.futures.ProcessPoolExecutor(max_workers=nproc) as pool:
+        for domain in domains:
+            if domain not in allfiles:
+                print('no LDASOUT files of domain {0:d}'.format(domain))
+                jobs[domain] = None
+                continue
+            kwargs = dict(wrfinput=wrfinput.format(domain=domain), datadir=datadir,
+                          outfile=outfile.format(domain=domain),
+                          begtime=begtime, endtime=endtime, partially=partially,
+                          prefetch=prefetch, queue=queue, domain=domain,
+                          allfiles=allfiles[domain],
+                          grid=grid, method=method, weightsdir=weightsdir, block=block)
+            jobs[domain] = pool.submit(convert_domain, kwargs)
+        failed = []
+        for domain in domains:
+            try:
+                ok = jobs[domain] is not None and jobs[domain].result()
+            except Exception:   # the worker process died
+                print('domain {0:d}:\n'.format(domain) + traceback.format_exc(), flush=True)
+                ok = False
+            if not ok:
+                failed.append(domain)
+    for domain in failed:
+        print('domain {0:d} failed'.format(domain))
+    return len(failed) == 0
+
+def cli(argv=None):
+    '''command line; argv defaults to sys.argv[1:]'''
     parser = argparse.ArgumentParser(description='convert NoahMP outputs to single CF-compatible file')
-    parser.add_argument('wrfinput')
+    parser.add_argument('wrfinput', help='wrfinput file, or a pattern like wrfinput_d{domain:02d} to convert every domain')
     parser.add_argument('datadir', help='root directory of raw NoahMP outputs')
-    parser.add_argument('outfile', help='CF-compaible output file')
+    parser.add_argument('outfile', help='CF-compaible output file, or a pattern like out_d{domain:02d}.nc')
     parser.add_argument('begtime', help='inclusive')
     parser.add_argument('endtime', help='exclusive')
-    parser.add_argument('--partially', action='store_true')
-    args = parser.parse_args()
-    main(args.wrfinput, args.datadir, args.outfile,
-         dateutil.parser.parse(args.begtime),
-         dateutil.parser.parse(args.endtime),
-         args.partially)
+    parser.add_argument('--partially', action='store_true',
+                        help='convert (and exit 0) even if outputs of the period are missing')
+    parser.add_argument('--prefetch', type=int, default=2,
+                        help='number of files read ahead in the background, 0 to disable (default: 2)')
+    parser.add_argument('--queue', type=int, default=8,
+                        help='number of pending writes queued for the background writer, 0 writes in the foreground (default: 8)')
+    parser.add_argument('--block', type=int, default=24,
+                        help='number of time steps of accumulators differenced at once (default: 24)')
+    parser.add_argument('-d', '--domain', type=int, nargs='+',
+                        help='domains to convert (default: 1, or every domain found with patterns)')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='number of domains converted concurrently (default: number of CPUs)')
+    parser.add_argument('--grid', type=str, metavar='LAT0,LAT1,LON0,LON1,DLAT[,DLON]',
+                        help='regrid to this regular lat/lon grid (cell centres, inclusive)')
+    parser.add_argument('--regrid-method', choices=noahmp_regrid.METHODS, default='bilinear',
+                        help='bilinear interpolation, or average of the source cells in each target cell (default: bilinear)')
+    parser.add_argument('--weights-dir', type=str,
+                        help='directory of cached regridding weights (default: directory of outfile)')
+    parser.add_argument('--watch', action='store_true',
+                        help='convert files as the running model finishes them')
+    parser.add_argument('--strip', action='store_true',
+                        help='with --watch, strip each file (noahmp_strip_output) before conversion')
+    parser.add_argument('--interval', type=float, default=60.0,
+                        help='with --watch, seconds between directory scans (default: 60)')
+    parser.add_argument('--settle', type=float, default=600.0,
+                        help='with --watch, seconds after which the newest unmodified file is finished (default: 600)')
+    parser.add_argument('--timeout', type=float, default=7200.0,
+                        help='with --watch, give up after seconds without new files (default: 7200)')
+    noahmp_profile.add_arguments(parser)
+    args = parser.parse_args(argv)
+    noahmp_profile.setup(args)
+    begtime = dateutil.parser.parse(args.begtime)
+    endtime = dateutil.parser.parse(args.endtime)
+    grid = noahmp_regrid.parse_grid(args.grid) if args.grid is not None else None
+    patterns = '{domain' in args.wrfinput and '{domain' in args.outfile
+    if not patterns and ('{domain' in args.wrfinput or '{domain' in args.outfile):
+        parser.error('both wrfinput and outfile need a {domain} pattern')
+    if args.watch and grid is not None:
+        parser.error('--grid is not supported with --watch')
+    if args.watch:
+        domain = args.domain[0] if args.domain is not None else 1
+        if not watch(args.wrfinput.format(domain=domain), args.datadir,
+                     args.outfile.format(domain=domain), begtime, endtime,
+                     strip=args.strip, interval=args.interval,
+                     settle=args.settle, timeout=args.timeout, domain=domain,
+                     partially=args.partially) \
+           and not args.partially:
+            sys.exit(1)
+    elif patterns or (args.domain is not None and len(args.domain) > 1):
+        if not patterns:
+            parser.error('several domains need {domain} patterns for wrfinput and outfile')
+        if not main_domains(args.wrfinput, args.datadir, args.outfile, begtime, endtime,
+                            args.partially, args.prefetch, args.queue,
+                            domains=args.domain, nproc=args.jobs, grid=grid,
+                            method=args.regrid_method, weightsdir=args.weights_dir,
+                            block=args.block):
+            sys.exit(1)
+    else:
+        main(args.wrfinput, args.datadir, args.outfile, begtime, endtime,
+             args.partially, args.prefetch, args.queue,
+             domain=args.domain[0] if args.domain is not None else 1,
+             grid=grid, method=args.regrid_method, weightsdir=args.weights_dir,
+             block=args.block)
+    return
+
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# lazy view of a directory of NoahMP outputs as a single dataset along time
+
+import os
+import glob
+import bisect
+import argparse
+import collections
+import dateutil.parser
+import numpy as np
+import netCDF4 as nc
+from noahmp_ldasout2cf import datetime4name, VALIDMIN
+
+class LDASOUTDataset(object):
+    '''*.LDASOUT_DOMAIN? files of a directory as one dataset along Time
+
+    Files are opened on access only, and at most `maxopen` of them are
+    kept open (least recently used ones are closed first):
+
+        with LDASOUTDataset(datadir) as ds:
+            sm = ds['SOIL_M'][ds.time_slice(begtime, endtime), :, j, i]
+    '''
+    def __init__(self, datadir, domain=1, begtime=None, endtime=None, maxopen=16):
+        files = sorted(glob.glob(os.path.join(datadir, '*.LDASOUT_DOMAIN{0:d}'.format(domain))))
+        self.files = [x for x in files
+                      if (begtime is None or datetime4name(x) >= begtime)
+                      and (endtime is None or datetime4name(x) < endtime)]
+        if len(self.files) == 0:
+            raise IOError('no LDASOUT files under ' + datadir)
+        self.times = [datetime4name(x) for x in self.files]
+        self.maxopen = maxopen
+        self.handles = collections.OrderedDict()
+        fi = self.dataset(0)
+        self.variables = list(fi.variables)
+        self.dimensions = {dim: len(fi.dimensions[dim]) for dim in fi.dimensions}
+
+    def dataset(self, ifile):
+        if ifile in self.handles:
+            self.handles.move_to_end(ifile)
+        else:
+            if len(self.handles) >= self.maxopen:
+                self.handles.popitem(last=False)[1].close()
+            self.handles[ifile] = nc.Dataset(self.files[ifile], 'r')
+        return self.handles[ifile]
+
+    def time_slice(self, begtime=None, endtime=None):
+        '''slice of the time axis covering [begtime, endtime)'''
+        return slice(bisect.bisect_left(self.times, begtime) if begtime is not None else None,
+                     bisect.bisect_left(self.times, endtime) if endtime is not None else None)
+
+    def __getitem__(self, var):
+        if var not in self.variables:
+            raise KeyError(var)
+        return LDASOUTVariable(self, var)
+
+    def __len__(self):
+        return len(self.files)
+
+    def close(self):
+        while len(self.handles) > 0:
+            self.handles.popitem()[1].close()
+        return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+        return
+
+class LDASOUTVariable(object):
+    '''a variable of LDASOUTDataset; values <= VALIDMIN are masked with NaN'''
+    def __init__(self, ds, name):
+        self.ds = ds
+        self.name = name
+        vi = ds.dataset(0).variables[name]
+        self.dimensions = vi.dimensions
+        self.dtype = vi.dtype
+        self.timed = len(vi.dimensions) > 0 and vi.dimensions[0] == 'Time'
+        self.shape = ((len(ds),) + vi.shape[1:]) if self.timed else vi.shape
+
+    def read(self, ifile, key):
+        vi = self.ds.dataset(ifile).variables[self.name]
+        vi.set_auto_maskandscale(False)
+        v = np.array(vi[key])
+        if np.issubdtype(v.dtype, np.floating):
+            v[v <= VALIDMIN] = np.nan
+        return v
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        if not self.timed:
+            return self.read(0, key)
+        if key[0] is Ellipsis:
+            key = (slice(None),) + key
+        ifiles = np.arange(len(self.ds))[key[0]]
+        if np.ndim(ifiles) == 0:
+            return self.read(int(ifiles), (0,) + key[1:])
+        if len(ifiles) == 0:
+            return np.empty((0,) + self.read(0, (0,) + key[1:]).shape, dtype=self.dtype)
+        return np.stack([self.read(int(ifile), (0,) + key[1:]) for ifile in ifiles])
+
+def cli(argv=None):
+    '''command line; argv defaults to sys.argv[1:]'''
+    parser = argparse.ArgumentParser(description='print the time series of a NoahMP output variable at a grid cell')
+    parser.add_argument('datadir', help='root directory of raw NoahMP outputs')
+    parser.add_argument('var', help='variable name, e.g. SOIL_M')
+    parser.add_argument('j', type=int, help='south_north index')
+    parser.add_argument('i', type=int, help='west_east index')
+    parser.add_argument('-b', '--begtime', help='inclusive')
+    parser.add_argument('-e', '--endtime', help='exclusive')
+    parser.add_argument('-d', '--domain', type=int, default=1)
+    args = parser.parse_args(argv)
+    begtime = dateutil.parser.parse(args.begtime) if args.begtime is not None else None
+    endtime = dateutil.parser.parse(args.endtime) if args.endtime is not None else None
+    with LDASOUTDataset(args.datadir, domain=args.domain,
+                        begtime=begtime, endtime=endtime) as ds:
+        v = ds[args.var]
+        key = tuple(args.j if x == 'south_north' else args.i if x == 'west_east' else slice(None)
+                    for x in v.dimensions)
+        for dt, value in zip(ds.times, v[key]):
+            print(dt.strftime('%Y-%m-%d %H:%M'), ' '.join(str(x) for x in np.atleast_1d(value)))
+    return
+
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# stitch per-tile Noah-MP outputs (LDASOUT, RESTART) into full-domain files
+
+import os
+import os.path
+import glob
+import argparse
+import netCDF4 as nc
+import f90nml
+
+NAMELIST = 'namelist.hrldas'
+XDIM = 'west_east'
+YDIM = 'south_north'
+
+def tiledirs(dirname):
+    return sorted(glob.glob(os.path.join(dirname, 'tile-[0-9][0-9][0-9]')))
+
+def tile_window(tiledir):
+    '''(xstart, xend, ystart, yend) of a tile, 1-based and inclusive'''
+    nml = f90nml.read(os.path.join(tiledir, NAMELIST))
+    return (nml['noahlsm_offline']['xstart'], nml['noahlsm_offline']['xend'],
+            nml['noahlsm_offline']['ystart'], nml['noahlsm_offline']['yend'])
+
+def tile_outputs(tiledir):
+    files = glob.glob(os.path.join(tiledir, '*.LDASOUT_DOMAIN[0-9]')) \
+        + glob.glob(os.path.join(tiledir, 'RESTART.*_DOMAIN[0-9]'))
+    return sorted(os.path.basename(x) for x in files)
+
+def merge_file(tiles, windows, outfile):
+    xoff = min(w[0] for w in windows)
+    yoff = min(w[2] for w in windows)
+    nx = max(w[1] for w in windows) - xoff + 1
+    ny = max(w[3] for w in windows) - yoff + 1
+    tmpfile = outfile + '.merging'
+    fis = [nc.Dataset(x, 'r') for x in tiles]
+    try:
+        with nc.Dataset(tmpfile, 'w', format=fis[0].data_model) as fo:
+            fi = fis[0]
+            for dim in fi.dimensions:
+                if fi.dimensions[dim].isunlimited():
+                    fo.createDimension(dim, None)
+                elif dim == XDIM:
+                    fo.createDimension(dim, nx)
+                elif dim == YDIM:
+                    fo.createDimension(dim, ny)
+                else:
+                    fo.createDimension(dim, len(fi.dimensions[dim]))
+            for att in fi.ncattrs():
+                fo.setncattr(att, fi.getncattr(att))
+            if 'WEST-EAST_GRID_DIMENSION' in fi.ncattrs():
+                fo.setncattr('WEST-EAST_GRID_DIMENSION', nx + 1)
+            if 'SOUTH-NORTH_GRID_DIMENSION' in fi.ncattrs():
+                fo.setncattr('SOUTH-NORTH_GRID_DIMENSION', ny + 1)
+            for var in fi.variables:
+                vi = fi.variables[var]
+                filters = vi.filters() or {}
+                fill_value = vi.getncattr('_FillValue') if '_FillValue' in vi.ncattrs() else None
+                fo.createVariable(var, vi.dtype, vi.dimensions,
+                                  zlib=filters.get('zlib', False),
+                                  complevel=filters.get('complevel', 4),
+                                  shuffle=filters.get('shuffle', True),
+                                  fill_value=fill_value)
+                for att in vi.ncattrs():
+                    if att == '_FillValue':
+                        continue
+                    fo.variables[var].setncattr(att, vi.getncattr(att))
+                fo.variables[var].set_auto_maskandscale(False)
+                if XDIM in vi.dimensions and YDIM in vi.dimensions:
+                    ix = vi.dimensions.index(XDIM)
+                    iy = vi.dimensions.index(YDIM)
+                    for ft, (xs, xe, ys, ye) in zip(fis, windows):
+                        ft.variables[var].set_auto_maskandscale(False)
+                        ind = [slice(None)] * len(vi.dimensions)
+                        ind[ix] = slice(xs - xoff, xe - xoff + 1)
+                        ind[iy] = slice(ys - yoff, ye - yoff + 1)
+                        fo.variables[var][tuple(ind)] = ft.variables[var][:]
+                else:
+                    vi.set_auto_maskandscale(False)
+                    fo.variables[var][:] = vi[:]
+    except Exception:
+        if os.path.exists(tmpfile):
+            os.remove(tmpfile)
+        raise
+    finally:
+        for f in fis:
+            f.close()
+    os.replace(tmpfile, outfile)
+    return
+
+def merge_tiles(dirname, outdir=None, remove=False):
+    '''merge outputs of dirname/tile-* into outdir (default: dirname)'''
+    dirname = os.path.abspath(dirname)
+    if outdir is None:
+        outdir = dirname
+    tdirs = tiledirs(dirname)
+    if len(tdirs) == 0:
+        print('no tiles under ' + dirname)
+        return
+    windows = [tile_window(x) for x in tdirs]
+    names = set(tile_outputs(tdirs[0]))
+    for tdir in tdirs[1:]:
+        names.intersection_update(tile_outputs(tdir))
+    for name in sorted(names):
+        outfile = os.path.join(outdir, name)
+        tiles = [os.path.join(x, name) for x in tdirs]
+        if os.path.exists(outfile) \
+           and os.path.getmtime(outfile) >= max(os.path.getmtime(x) for x in tiles):
+            continue
+        print('MERGE_TILES: ' + outfile)
+        merge_file(tiles, windows, outfile)
+        if remove:
+            for x in tiles:
+                os.remove(x)
+    return
+
+def cli(argv=None):
+    '''command line; argv defaults to sys.argv[1:]'''
+    parser = argparse.ArgumentParser(description='stitch per-tile Noah-MP outputs into full-domain files')
+    parser.add_argument('dir', nargs='+', type=str,
+                        help='case directories containing tile-* subdirectories')
+    parser.add_argument('-o', '--outdir', type=str,
+                        help='output directory (default: the case directory)')
+    parser.add_argument('--remove', action='store_true',
+                        help='remove per-tile files after merging')
+    args = parser.parse_args(argv)
+    for d in args.dir:
+        merge_tiles(d, outdir=args.outdir, remove=args.remove)
+    return
+
+if __name__ == '__main__':
+    cli()
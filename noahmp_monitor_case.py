@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# monitor throughput of a running Noah-MP case
+
+import sys
+import os
+import os.path
+import time
+import datetime
+import threading
+import argparse
+import f90nml
+
+NAMELIST = 'namelist.hrldas'
+
+def datetime4name(filename):
+    '''time stamp of YYYYMMDDHH.LDASOUT_DOMAIN? or RESTART.YYYYMMDDHH_DOMAIN?'''
+    basename = os.path.basename(filename)
+    if basename.startswith('RESTART.'):
+        timestr = basename[8:18]
+    else:
+        timestr = basename.split('.')[0]
+    return datetime.datetime.strptime(timestr, '%Y%m%d%H')
+
+def case_period(dirname):
+    '''output directory, begin and end time of the case in dirname'''
+    nml = f90nml.read(os.path.join(dirname, NAMELIST))
+    outdir = nml['noahlsm_offline'].get('outdir', '.')
+    outdir = os.path.join(dirname, outdir)
+    dtbeg = datetime.datetime(nml['noahlsm_offline']['start_year'],
+                              nml['noahlsm_offline']['start_month'],
+                              nml['noahlsm_offline']['start_day'],
+                              nml['noahlsm_offline']['start_hour'],
+                              nml['noahlsm_offline']['start_min'])
+    dtend = dtbeg + datetime.timedelta(days=nml['noahlsm_offline']['kday'])
+    return outdir, dtbeg, dtend
+
+def latest_output(outdir):
+    '''latest time stamp of LDASOUT and RESTART files in outdir'''
+    latest = None
+    if not os.path.isdir(outdir):
+        return latest
+    with os.scandir(outdir) as it:
+        for entry in it:
+            if '.LDASOUT_DOMAIN' not in entry.name \
+               and not entry.name.startswith('RESTART.'):
+                continue
+            try:
+                dt = datetime4name(entry.name)
+            except ValueError:
+                continue
+            if latest is None or dt > latest:
+                latest = dt
+    return latest
+
+class CaseMonitor(threading.Thread):
+    '''report simulated days per wall-clock hour, ETA, and stalls
+
+    The monitor only lists OUTDIR once every `interval` seconds from a
+    daemon thread; the model process itself is never touched.
+    '''
+    def __init__(self, dirname, interval=60.0, stall=1800.0, stream=sys.stdout):
+        super().__init__(daemon=True)
+        self.dirname = os.path.abspath(dirname)
+        self.interval = interval
+        self.stall = stall
+        self.stream = stream
+        self._stop_event = threading.Event()
+
+    def report(self, msg):
+        print('MONITOR: ' + msg, file=self.stream, flush=True)
+
+    def run(self):
+        outdir, dtbeg, dtend = case_period(self.dirname)
+        total = (dtend - dtbeg).total_seconds()
+        wall0 = time.time()
+        sim0 = max(latest_output(outdir) or dtbeg, dtbeg)
+        simlast, walllast = sim0, wall0
+        stalled = False
+        while not self._stop_event.wait(self.interval):
+            now = time.time()
+            sim = latest_output(outdir)
+            if sim is None or sim <= simlast:
+                if now - walllast >= self.stall and not stalled:
+                    stalled = True
+                    self.report('{0:s} no new output since {1:s} for {2:.2f} hours (stalled?)'.format(
+                        self.dirname, simlast.strftime('%Y-%m-%d %H:%M'),
+                        (now - walllast) / 3600.0))
+                continue
+            stalled = False
+            simlast, walllast = sim, now
+            done = (sim - dtbeg).total_seconds()
+            rate = (sim - sim0).total_seconds() / 86400.0 / ((now - wall0) / 3600.0)
+            if rate > 0:
+                left = (dtend - sim).total_seconds() / 86400.0 / rate
+                eta = datetime.datetime.now() + datetime.timedelta(hours=left)
+                etastr = '{0:s} ({1:.2f} hours)'.format(eta.strftime('%Y-%m-%d %H:%M'), left)
+            else:
+                etastr = 'unknown'
+            self.report('{0:s} {1:s} ({2:.1f}%), {3:.2f} simulated days/hour, ETA {4:s}'.format(
+                self.dirname, sim.strftime('%Y-%m-%d %H:%M'),
+                100.0 * done / total if total > 0 else 100.0, rate, etastr))
+            if sim >= dtend:
+                break
+        return
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+        return
+
+def main(dirname, interval=60.0, stall=1800.0):
+    monitor = CaseMonitor(dirname, interval=interval, stall=stall)
+    monitor.start()
+    try:
+        while monitor.is_alive():
+            monitor.join(1.0)
+    except KeyboardInterrupt:
+        monitor.stop()
+    return
+
+def cli(argv=None):
+    '''command line; argv defaults to sys.argv[1:]'''
+    parser = argparse.ArgumentParser(description='monitor throughput of a running Noah-MP case')
+    parser.add_argument('dirname', type=str,
+                        help='directory of a running Noah-MP case (caseroot or spinup-*)')
+    parser.add_argument('-i', '--interval', type=float, default=60.0,
+                        help='seconds between reports (default: 60)')
+    parser.add_argument('-s', '--stall', type=float, default=1800.0,
+                        help='seconds without new output before reporting a stall (default: 1800)')
+    args = parser.parse_args(argv)
+    if not os.path.isfile(os.path.join(args.dirname, NAMELIST)):
+        print('Error: directory (' + args.dirname + ') is not a valid case directory!')
+        sys.exit(1)
+    main(args.dirname, interval=args.interval, stall=args.stall)
+    return
+
+if __name__ == '__main__':
+    cli()
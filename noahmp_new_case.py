@@ -5,18 +5,116 @@
 
 # author: Hui ZHENG
 
+import sys
 import os.path
+import re
+import csv
 import string
 import shutil
+import threading
+import concurrent.futures
+import netCDF4 as nc
+import noahmp_check_forcing
 
 NOAHMP_NML = 'namelist.hrldas.template'
 NOAHMP_TBLS = ['GENPARM.TBL', 'MPTABLE.TBL', 'SOILPARM.TBL', 'VEGPARM.TBL']
 NOAHMP_EXE = 'noahmp_hrldas.exe'
+NCLOCK = threading.Lock()       # netCDF-C is not thread-safe
+
+def set_namelist_option(nml, name, value):
+    '''set (and uncomment) option `name` in the text of a namelist'''
+    if isinstance(value, bool):
+        value = '.true.' if value else '.false.'
+    elif isinstance(value, str):
+        value = "'" + value + "'"
+    line = ' {0:s} = {1}'.format(name, value)
+    pattern = re.compile(r'^[ \t]*!?[ \t]*' + re.escape(name) + r'[ \t]*=.*$',
+                         re.IGNORECASE | re.MULTILINE)
+    if pattern.search(nml) is not None:
+        return pattern.sub(lambda m: line, nml, count=1)
+    return re.sub(r'^/', lambda m: line + '\n/', nml, count=1, flags=re.MULTILINE)
+
+def namelist_value(text):
+    '''namelist value of a string from a table: number, logical (True/False),
+    or string'''
+    for conv in (int, float):
+        try:
+            return conv(text)
+        except ValueError:
+            pass
+    if text.strip().lower() in ('.true.', '.t.', 't'):
+        return True
+    if text.strip().lower() in ('.false.', '.f.', 'f'):
+        return False
+    return text.strip("'\"")
+
+def write_namelist(filename, nml, overrides=None):
+    if overrides:
+        for name, value in overrides.items():
+            nml = set_namelist_option(nml, name, value)
+    with open(filename, 'wt') as f:
+        f.write(nml)
+    return
+
+def install(src, dst, link=False):
+    '''copy src to dst, or hardlink it (falling back to a copy, e.g. across file systems)'''
+    if link:
+        if os.path.lexists(dst):
+            os.remove(dst)
+        try:
+            os.link(src, dst)
+            return
+        except OSError:
+            pass
+    shutil.copy(src, dst)
+    return
+
+def load_template(modelroot, namelist_template=None):
+    if namelist_template is None:
+        namelist_template = os.path.join(modelroot, NOAHMP_NML)
+    if not os.path.isfile(namelist_template):
+        print('file (' + namelist_template + ') does not exist!')
+        return None
+    with open(namelist_template, 'rt') as f:
+        return string.Template(f.read())
+
+def tile_windows(nx, ny, ntiles):
+    '''split the domain into ntiles row bands: [(xstart, xend, ystart, yend), ...]'''
+    ntiles = min(ntiles, ny)
+    bounds = [(ny * itile) // ntiles for itile in range(ntiles + 1)]
+    return [(1, nx, bounds[itile] + 1, bounds[itile + 1]) for itile in range(ntiles)]
+
+def make_tiles(dirname, ntiles, nx, ny):
+    '''create dirname/tile-NNN, each running a window of the domain in dirname'''
+    with open(os.path.join(dirname, 'namelist.hrldas'), 'rt') as f:
+        namelist = f.read()
+    resfile = re.search(r"^[ \t]*RESTART_FILENAME_REQUESTED[ \t]*=[ \t]*'(.*)'",
+                        namelist, re.IGNORECASE | re.MULTILINE)
+    for itile, (xs, xe, ys, ye) in enumerate(tile_windows(nx, ny, ntiles)):
+        fold = os.path.join(dirname, 'tile-{0:03d}'.format(itile+1))
+        os.makedirs(fold, exist_ok=True)
+        for f in NOAHMP_TBLS + [NOAHMP_EXE]:
+            fabs = os.path.join(fold, f)
+            if os.path.isfile(fabs): os.remove(fabs)
+            os.symlink(os.path.join(dirname, f), fabs)
+        nml = set_namelist_option(namelist, 'OUTDIR', fold)
+        nml = set_namelist_option(nml, 'XSTART', xs)
+        nml = set_namelist_option(nml, 'XEND', xe)
+        nml = set_namelist_option(nml, 'YSTART', ys)
+        nml = set_namelist_option(nml, 'YEND', ye)
+        if resfile is not None:
+            # tiles read the full-domain restart of the parent directory
+            nml = set_namelist_option(nml, 'RESTART_FILENAME_REQUESTED',
+                                      os.path.join(dirname, resfile.group(1)))
+        with open(os.path.join(fold, 'namelist.hrldas'), 'wt') as f:
+            f.write(nml)
+    return
 
 def main(modelroot=None,
          caseroot='unknown_case',
          dtbeg_s=None, dtbeg=None, dtend=None, nloop=0,
-         namelist_template=None, forcing=None, wrfinput=None):
+         namelist_template=None, forcing=None, wrfinput=None, ntiles=0,
+         namelist=None, link=False, overrides=None):
     if (modelroot is None) or (dtbeg is None) or (dtend is None):
         return
     caseroot = os.path.abspath(caseroot)
@@ -31,15 +129,11 @@ def main(modelroot=None,
     os.makedirs(caseroot, exist_ok=True)
     os.makedirs(forcing, exist_ok=True)
 
-    if namelist_template is None:
-        namelist_template = os.path.join(modelroot, NOAHMP_NML)
-    if not os.path.isfile(namelist_template):
-        print('file (' + namelist_template + ') does not exist!')
-        return
-
     # load namelist
-    with open(namelist_template, 'rt') as f:
-        namelist = string.Template(f.read())
+    if namelist is None:
+        namelist = load_template(modelroot, namelist_template)
+        if namelist is None:
+            return
 
     # have spinup
     if (dtbeg_s is not None) and (dtbeg_s < dtbeg):
@@ -50,8 +144,8 @@ def main(modelroot=None,
     
     # run
     for f in NOAHMP_TBLS + [NOAHMP_EXE, ]:
-        shutil.copy(os.path.join(modelroot, f),
-                    os.path.join(caseroot, f))
+        install(os.path.join(modelroot, f),
+                os.path.join(caseroot, f), link=link)
     if havespinup:
         resfile = 'RESTART.' + dtbeg.strftime('%Y%m%d%H') + '_DOMAIN1'
         nml = namelist.safe_substitute(START_YEAR=dtbeg.year,
@@ -76,8 +170,7 @@ def main(modelroot=None,
                                        OUTDIR=caseroot,
                                        WRFINPUT=wrfinput,
                                        RESON='!')
-    with open(os.path.join(caseroot, 'namelist.hrldas'), 'wt') as f:
-        f.write(nml)
+    write_namelist(os.path.join(caseroot, 'namelist.hrldas'), nml, overrides)
 
     # spinup
     havespinup = False
@@ -114,15 +207,68 @@ def main(modelroot=None,
                                                WRFINPUT=wrfinput,
                                                RESON='',
                                                RESFILE=resfile)
-            with open(os.path.join(fold, 'namelist.hrldas'), 'wt') as f:
-                f.write(nml)
+            write_namelist(os.path.join(fold, 'namelist.hrldas'), nml, overrides)
+
+    # spatial tiles
+    if ntiles > 1:
+        if not os.path.isfile(wrfinput):
+            print('file (' + wrfinput + ') does not exist! (required by --ntiles)')
+            return
+        with NCLOCK, nc.Dataset(wrfinput, 'r') as fwrf:
+            nx = len(fwrf.dimensions['west_east'])
+            ny = len(fwrf.dimensions['south_north'])
+        make_tiles(caseroot, ntiles, nx, ny)
+        if havespinup:
+            for iloop in range(nloop):
+                make_tiles(os.path.join(caseroot, 'spinup-{0:03d}'.format(iloop+1)),
+                           ntiles, nx, ny)
     return
 
+BATCH_COLUMNS = ['caseroot', 'begtime', 'endtime', 'begtimespinup', 'nloop',
+                 'forcing', 'wrfinput', 'ntiles']
+
+def batch(table, modelroot=None, namelist_template=None, nworkers=8, link=True):
+    '''create the cases listed in a CSV table concurrently
+
+    Columns are BATCH_COLUMNS (empty cells take the defaults of main);
+    any other column is a namelist option overriding the template.
+    Returns the case roots created.
+    '''
+    namelist = load_template(modelroot, namelist_template)
+    if namelist is None:
+        return []
+    members = []
+    with open(table, 'rt', newline='') as f:
+        for row in csv.DictReader(f):
+            row = {k.strip(): v.strip() for k, v in row.items() if v is not None and v.strip()}
+            members.append(dict(
+                modelroot=modelroot,
+                caseroot=row['caseroot'],
+                dtbeg_s=dateutil.parser.parse(row['begtimespinup']) if 'begtimespinup' in row else None,
+                dtbeg=dateutil.parser.parse(row['begtime']),
+                dtend=dateutil.parser.parse(row['endtime']),
+                nloop=int(row.get('nloop', 1)),
+                forcing=row.get('forcing'),
+                wrfinput=row.get('wrfinput'),
+                ntiles=int(row.get('ntiles', 0)),
+                namelist=namelist,
+                link=link,
+                overrides={k.upper(): namelist_value(v) for k, v in row.items()
+                           if k not in BATCH_COLUMNS}))
+    with concurrent.futures.ThreadPoolExecutor(max_workers=nworkers) as pool:
+        futures = {pool.submit(main, **member): member['caseroot'] for member in members}
+        for future in concurrent.futures.as_completed(futures):
+            future.result()
+            print(futures[future], flush=True)
+    return [member['caseroot'] for member in members]
+
 import argparse
 import dateutil.parser
-if __name__ == '__main__':
+
+def cli(argv=None):
+    '''command line; argv defaults to sys.argv[1:]'''
     parser = argparse.ArgumentParser(description='Create Noah-MP case.')
-    parser.add_argument('caseroot', type=str,
+    parser.add_argument('caseroot', type=str, nargs='?',
                         default=os.getcwd(), help='case root directory')
     parser.add_argument('-m', '--modelroot', type=str,
                         default=os.path.join(os.path.dirname(os.path.realpath(__file__)), 'noahmp'),
@@ -133,17 +279,41 @@ if __name__ == '__main__':
                         help='top-level directory under which the forcing files are stored. (default: CASEROOT/ldasin)')
     parser.add_argument('-i', '--wrfinput', type=str,
                         help='location of wrfinput file. (default: CASEROOT/wrfinput_d01)')
-    parser.add_argument('-b', '--begtime', required=True,
+    parser.add_argument('-b', '--begtime',
                         help='start date and time', type=str)
-    parser.add_argument('-e', '--endtime', required=True,
+    parser.add_argument('-e', '--endtime',
                         help='end date and time (exclusive)', type=str)
     parser.add_argument('-bs', '--begtimespinup',
                         help='start date and time of spinup', type=str)
     parser.add_argument('-l', '--nloop',
                         help='number of spinup loops (default: 0 or 1 for no spinup)',
                         default=1, type=int)
-    args = parser.parse_args()
+    parser.add_argument('-t', '--ntiles',
+                        help='number of spatial tiles run concurrently (default: 0, no tiling)',
+                        default=0, type=int)
+    parser.add_argument('--link', action='store_true',
+                        help='hardlink executable and tables from MODELROOT instead of copying (default in --batch mode)')
+    parser.add_argument('--batch', type=str,
+                        help='CSV table of ensemble members (columns: ' + ', '.join(BATCH_COLUMNS)
+                        + ', and namelist options to override); creates all cases concurrently')
+    parser.add_argument('-j', '--jobs', type=int, default=8,
+                        help='number of cases created concurrently in --batch mode (default: 8)')
+    parser.add_argument('-c', '--check-forcing', action='store_true',
+                        help='check that the forcing files cover the case and its spinups (each case with --batch)')
+    args = parser.parse_args(argv)
 
+    if args.batch is not None:
+        caseroots = batch(args.batch, modelroot=args.modelroot, namelist_template=args.namelist,
+                          nworkers=args.jobs, link=True)
+        if args.check_forcing:
+            covered = True
+            for caseroot in caseroots:
+                covered = noahmp_check_forcing.main(caseroot) and covered
+            if not covered:
+                sys.exit(1)
+        sys.exit(0)
+    if args.begtime is None or args.endtime is None:
+        parser.error('the following arguments are required: -b/--begtime, -e/--endtime')
     main(modelroot=args.modelroot,
          caseroot=args.caseroot,
          dtbeg_s=dateutil.parser.parse(args.begtimespinup) if args.begtimespinup is not None else None,
@@ -152,5 +322,12 @@ if __name__ == '__main__':
          nloop=args.nloop,
          namelist_template=args.namelist,
          forcing=args.forcing,
-         wrfinput=args.wrfinput)
+         wrfinput=args.wrfinput,
+         ntiles=args.ntiles,
+         link=args.link)
+    if args.check_forcing and not noahmp_check_forcing.main(args.caseroot):
+        sys.exit(1)
+    return
 
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# int16 packing (scale_factor/add_offset) of CF products
+
+import numpy as np
+from noahmp_prefetch import Prefetcher
+
+FILLVALUE = -32768
+NPACK = 32766                   # packed values lie in [-NPACK, NPACK]
+
+# default precision and physical bounds (None: from a prepass) of packed
+# variables, in the units of the products
+PRECISION = {
+    'ET': (1e-8, None, None),           # kg m-2 s-1
+    'ETRAN': (1e-8, None, None),
+    'ECAN': (1e-8, None, None),
+    'EDIR': (1e-8, None, None),
+    'RUNOFF': (1e-8, None, None),
+    'SFCRNOFF': (1e-8, None, None),
+    'UGDRNOFF': (1e-8, None, None),
+    'TWS': (0.01, None, None),          # kg m-2
+    'SMC': (0.05, None, None),
+    'SNW': (0.05, None, None),
+    'GW': (0.1, None, None),
+    'SOIL_M': (2e-5, 0.0, 1.0),         # m3 m-3
+    'ZWT': (0.001, None, None),         # m
+    'SWU': (0.05, 0.0, 1400.0),         # W m-2
+    'LWU': (0.05, 0.0, 1000.0),
+}
+
+def parse_spec(items):
+    '''PRECISION updated by VAR=PRECISION[:MIN:MAX] items; None disables packing'''
+    if items is None:
+        return None
+    spec = dict(PRECISION)
+    for item in items:
+        try:
+            var, value = item.split('=')
+            fields = [float(x) for x in value.split(':')]
+        except ValueError:
+            raise ValueError('bad packing spec (VAR=PRECISION[:MIN:MAX]): ' + item)
+        if len(fields) == 1:
+            spec[var] = (fields[0], None, None)
+        elif len(fields) == 3:
+            spec[var] = tuple(fields)
+        else:
+            raise ValueError('bad packing spec (VAR=PRECISION[:MIN:MAX]): ' + item)
+    return spec
+
+class Packer(object):
+    '''int16 storage of the variables of `variables` listed in spec
+
+    scale_factor is the requested precision, widened (with a warning)
+    when [min, max] does not fit into int16; add_offset centres the
+    range. Unpacked values are within scale_factor / 2 of the originals
+    inside [min, max]; values outside the configured bounds are clipped
+    (and counted). Unpacked variables stay float32 with a NaN fill.
+    '''
+    def __init__(self, spec, variables):
+        spec = spec or {}
+        self.spec = {var: spec[var] for var in variables if var in spec}
+        self.bounds = {}        # var: [min, max] seen in the prepass
+        self.params = {}        # var: (scale_factor, add_offset)
+        self.clipped = {}
+
+    def needs_scan(self):
+        return any(vmin is None or vmax is None for _, vmin, vmax in self.spec.values())
+
+    def scan(self, var, v):
+        if var not in self.spec:
+            return
+        v = np.ma.filled(np.ma.asarray(v, dtype='f8'), np.nan)
+        if not np.any(np.isfinite(v)):
+            return
+        vmin, vmax = np.nanmin(v), np.nanmax(v)
+        if var in self.bounds:
+            vmin = min(vmin, self.bounds[var][0])
+            vmax = max(vmax, self.bounds[var][1])
+        self.bounds[var] = [vmin, vmax]
+        return
+
+    def parameters(self, var):
+        if var in self.params:
+            return self.params[var]
+        precision, vmin, vmax = self.spec[var]
+        if vmin is None or vmax is None:
+            vmin, vmax = self.bounds.get(var, [0.0, 0.0])
+        scale = precision
+        if vmax - vmin > 2 * NPACK * precision:
+            scale = (vmax - vmin) / (2 * NPACK)
+            print('PACK: warning: {0:s} range [{1:g}, {2:g}] needs precision {3:g} (requested {4:g})'.format(
+                var, vmin, vmax, scale, precision))
+        # stored as float32: pack with the values readers will see
+        scale = float(np.float32(scale))
+        offset = float(np.float32((vmax + vmin) / 2))
+        self.params[var] = (scale, offset)
+        print('PACK: {0:s} int16, scale_factor {1:g}, add_offset {2:g}, max error {3:g}'.format(
+            var, scale, offset, scale / 2))
+        return self.params[var]
+
+    def create_variable(self, fo, var, dims, **kwargs):
+        if var not in self.spec:
+            return fo.createVariable(var, 'f4', dims, fill_value=float('nan'), **kwargs)
+        scale, offset = self.parameters(var)
+        vo = fo.createVariable(var, 'i2', dims, fill_value=FILLVALUE, **kwargs)
+        vo.scale_factor = np.float32(scale)
+        vo.add_offset = np.float32(offset)
+        return vo
+
+    def pack(self, var, v):
+        '''values as stored: int16 for packed variables, NaN-filled float32 otherwise
+
+        Write them with auto mask and scale disabled.
+        '''
+        if var not in self.spec:
+            return np.ma.filled(np.ma.asarray(v, dtype='f4'), np.nan)
+        scale, offset = self.parameters(var)
+        q = np.round((np.ma.filled(np.ma.asarray(v, dtype='f8'), np.nan) - offset) / scale)
+        invalid = ~np.isfinite(q)
+        outside = ~invalid & ((q < -NPACK) | (q > NPACK))
+        if np.any(outside):
+            self.clipped[var] = self.clipped.get(var, 0) + int(np.count_nonzero(outside))
+            q = np.clip(q, -NPACK, NPACK)
+        q[invalid] = FILLVALUE
+        return q.astype('i2')
+
+    def report(self):
+        for var, n in sorted(self.clipped.items()):
+            lo, hi = [self.params[var][1] + x * NPACK * self.params[var][0] for x in (-1, 1)]
+            print('PACK: warning: {0:d} values of {1:s} outside [{2:g}, {3:g}] clipped'.format(
+                n, var, lo, hi))
+        return
+
+def scan(packer, load, compute, items, prefetch=2):
+    '''streaming min/max prepass over compute(load(item)) for all items'''
+    reader = Prefetcher(load, items, prefetch)
+    for _, values in reader:
+        for var, v in compute(values).items():
+            packer.scan(var, v)
+    return
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# read-ahead (double-buffering) of the per-file loops
+
+import time
+import collections
+import concurrent.futures
+import netCDF4 as nc
+import noahmp_profile
+
+MAXOPEN = 4
+_datasets = collections.OrderedDict()
+
+def dataset(filename):
+    '''read-only dataset kept open in the calling (reader) process'''
+    if filename in _datasets:
+        _datasets.move_to_end(filename)
+    else:
+        if len(_datasets) >= MAXOPEN:
+            _datasets.popitem(last=False)[1].close()
+        _datasets[filename] = nc.Dataset(filename, 'r')
+    return _datasets[filename]
+
+def close_datasets():
+    '''close the datasets kept open by dataset(): at the end of a run, so
+    that none survive between --serve commands, and in forked children,
+    which must not share the handles of their parent'''
+    while len(_datasets) > 0:
+        _datasets.popitem(last=False)[1].close()
+    return
+
+def init_reader():
+    '''initializer of reader processes'''
+    close_datasets()
+    noahmp_profile.reset()
+    return
+
+def timed(load, item, collect=False):
+    '''(load(item), seconds, and with collect the stages profiled in the reader process)'''
+    start = time.time()
+    data = load(item)
+    return data, time.time() - start, noahmp_profile.collect() if collect else None
+
+class Prefetcher(object):
+    '''yield (item, load(item)), loading up to `depth` items ahead
+
+    Loads run in one background reader process (netCDF-C is not
+    thread-safe), so reading item N+1 overlaps with processing item N.
+    `load` must be a module-level function; depth 0 loads in the
+    foreground.
+    '''
+    def __init__(self, load, items, depth=2):
+        self.load = load
+        self.items = list(items)
+        self.depth = depth
+        self.name = getattr(load, '__name__', None) or getattr(load, 'func', load).__name__
+        self.loadtime = 0.0     # seconds spent loading
+        self.waittime = 0.0     # seconds the consumer waited for loads
+
+    def __iter__(self):
+        try:
+            yield from self.iterate()
+        finally:
+            close_datasets()
+        return
+
+    def iterate(self):
+        if self.depth <= 0:
+            for item in self.items:
+                data, seconds, _ = timed(self.load, item)
+                self.loadtime += seconds
+                self.waittime += seconds
+                noahmp_profile.count('read', self.name, data)
+                yield item, data
+            self.profile()
+            return
+        with concurrent.futures.ProcessPoolExecutor(max_workers=1,
+                                                    initializer=init_reader) as pool:
+            items = iter(self.items)
+            queue = collections.deque()
+            collect = noahmp_profile.enabled()
+            for item in items:
+                queue.append((item, pool.submit(timed, self.load, item, collect)))
+                if len(queue) >= self.depth:
+                    break
+            while len(queue) > 0:
+                item, future = queue.popleft()
+                start = time.time()
+                data, seconds, stages = future.result()
+                self.waittime += time.time() - start
+                self.loadtime += seconds
+                noahmp_profile.merge(stages)
+                noahmp_profile.count('read', self.name, data)
+                for nextitem in items:
+                    queue.append((nextitem, pool.submit(timed, self.load, nextitem, collect)))
+                    break
+                yield item, data
+        self.profile()
+        return
+
+    def profile(self):
+        noahmp_profile.add('prefetch.load', self.loadtime, len(self.items))
+        noahmp_profile.add('prefetch.wait', self.waittime, len(self.items))
+        return
+
+    def overlap(self):
+        '''fraction of the load time hidden behind processing'''
+        if self.loadtime <= 0:
+            return 0.0
+        return max(1.0 - self.waittime / self.loadtime, 0.0)
+
+    def report(self):
+        print('PREFETCH: {0:d} items, {1:.2f} s loading, {2:.2f} s waiting, {3:.0f}% overlap (depth {4:d})'.format(
+            len(self.items), self.loadtime, self.waittime, 100.0 * self.overlap(), self.depth),
+            flush=True)
+        return
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# per-stage timers and byte counts of the tools (--profile, --metrics-json)
+#
+#     with noahmp_profile.stage('read'):
+#         v = fi.variables[var][:]
+#     noahmp_profile.count('read', var, v)
+#
+# Both return at once while profiling is off. Stages timed in a reader or
+# writer process are sent back with its results (see collect/merge).
+
+import os
+import sys
+import json
+import time
+import atexit
+
+_enabled = False
+_stages = {}                    # name: [calls, seconds]
+_bytes = {}                     # 'read'/'written': {variable: bytes}
+_options = None
+_command = None                 # (tool, arguments) being profiled
+_start = None
+_cprofile = None
+
+class _Null(object):
+    def __enter__(self):
+        return self
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+_NULL = _Null()
+
+class _Stage(object):
+    __slots__ = ('name', 'start')
+    def __init__(self, name):
+        self.name = name
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+    def __exit__(self, exc_type, exc_value, traceback):
+        add(self.name, time.perf_counter() - self.start)
+        return False
+
+def enabled():
+    return _enabled
+
+def stage(name):
+    '''context timing one pass through a stage'''
+    if not _enabled:
+        return _NULL
+    return _Stage(name)
+
+def add(name, seconds, calls=1):
+    if not _enabled:
+        return
+    total = _stages.setdefault(name, [0, 0.0])
+    total[0] += calls
+    total[1] += seconds
+    return
+
+def count(direction, name, value):
+    '''bytes of the arrays in value ('read' or 'written'), per variable where
+    value is a dict keyed by variable, else under name'''
+    if not _enabled:
+        return
+    if isinstance(value, dict):
+        for var, v in value.items():
+            count(direction, var, v)
+    elif isinstance(value, (list, tuple)):
+        for v in value:
+            count(direction, name, v)
+    else:
+        counts = _bytes.setdefault(direction, {})
+        counts[name] = counts.get(name, 0) + getattr(value, 'nbytes', 0)
+    return
+
+def reset():
+    '''forget the stages inherited by a forked reader or writer process'''
+    global _stages, _bytes
+    _stages, _bytes = {}, {}
+    return
+
+def collect():
+    '''stage timers and byte counts since the last collect, for merge() in
+    the parent process; None while profiling is off'''
+    global _stages, _bytes
+    if not _enabled:
+        return None
+    collected = (_stages, _bytes)
+    _stages, _bytes = {}, {}
+    return collected
+
+def merge(collected):
+    if collected is None or not _enabled:
+        return
+    stages, counts = collected
+    for name, (calls, seconds) in stages.items():
+        add(name, seconds, calls)
+    for direction, values in counts.items():
+        for var, n in values.items():
+            _bytes.setdefault(direction, {})
+            _bytes[direction][var] = _bytes[direction].get(var, 0) + n
+    return
+
+def add_arguments(parser):
+    group = parser.add_argument_group('profiling')
+    group.add_argument('--profile', action='store_true',
+                       help='print per-stage timers and bytes read/written per variable at exit')
+    group.add_argument('--metrics-json', type=str, default=None, metavar='FILE',
+                       help='write the profile to FILE as JSON at exit')
+    group.add_argument('--cprofile', type=str, default=None, metavar='FILE',
+                       help='also run cProfile and dump its stats to FILE (see python -m pstats)')
+    group.add_argument('--tracemalloc', action='store_true',
+                       help='also trace memory allocations (peak and top allocation sites)')
+    return
+
+def setup(args):
+    '''start profiling if any profiling option is given; the profile is
+    reported at exit'''
+    global _enabled, _options, _command, _start, _cprofile
+    if not (args.profile or args.metrics_json or args.cprofile or args.tracemalloc):
+        return
+    reset()
+    _enabled = True
+    _options = args
+    _command = (os.path.basename(sys.argv[0]), sys.argv[1:])
+    _start = (time.perf_counter(), time.process_time())
+    if args.tracemalloc:
+        import tracemalloc
+        tracemalloc.start(10)
+    if args.cprofile:
+        import cProfile
+        _cprofile = cProfile.Profile()
+        _cprofile.enable()
+    atexit.register(finish)
+    return
+
+def peak_rss():
+    '''peak resident set size (MiB) of this process and its waited-for children'''
+    try:
+        import resource
+    except ImportError:
+        return None
+    scale = 2**20 if sys.platform == 'darwin' else 2**10
+    return max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss) / scale
+
+def metrics():
+    result = {'tool': _command[0], 'argv': _command[1],
+              'wall': time.perf_counter() - _start[0],
+              'cpu': time.process_time() - _start[1],
+              'peak_rss_mb': peak_rss(),
+              'stages': {name: {'calls': calls, 'seconds': seconds}
+                         for name, (calls, seconds) in _stages.items()},
+              'bytes': _bytes}
+    if _options.tracemalloc:
+        import tracemalloc
+        current, peak = tracemalloc.get_traced_memory()
+        top = tracemalloc.take_snapshot().statistics('lineno')[0:10]
+        result['tracemalloc'] = {
+            'current_mb': current / 2**20, 'peak_mb': peak / 2**20,
+            'top': [{'where': '{0:s}:{1:d}'.format(x.traceback[0].filename, x.traceback[0].lineno),
+                     'size_mb': x.size / 2**20, 'count': x.count} for x in top]}
+    return result
+
+def report(result):
+    print('PROFILE: {0:s} {1:.2f} s wall, {2:.2f} s cpu, peak RSS {3:.0f} MiB'.format(
+        result['tool'], result['wall'], result['cpu'], result['peak_rss_mb'] or 0.0))
+    for name, total in sorted(result['stages'].items(), key=lambda x: -x[1]['seconds']):
+        print('PROFILE: {0:<24s}{1:>9.3f} s {2:>8d} calls'.format(name, total['seconds'], total['calls']))
+    for direction, values in sorted(result['bytes'].items()):
+        for var, n in sorted(values.items(), key=lambda x: -x[1]):
+            print('PROFILE: {0:<8s}{1:<16s}{2:>11.2f} MiB'.format(direction, var, n / 2**20))
+    if 'tracemalloc' in result:
+        print('PROFILE: traced memory peak {0:.1f} MiB'.format(result['tracemalloc']['peak_mb']))
+        for x in result['tracemalloc']['top']:
+            print('PROFILE: {0:>9.2f} MiB {1:s}'.format(x['size_mb'], x['where']))
+    sys.stdout.flush()
+    return
+
+def finish():
+    '''stop profiling and report (registered with atexit by setup, called
+    after every command by noahmp-tools --serve)'''
+    global _enabled, _cprofile
+    if not _enabled:
+        return
+    if _cprofile is not None:
+        _cprofile.disable()
+        _cprofile.dump_stats(_options.cprofile)
+        print('PROFILE: cProfile stats -> ' + _options.cprofile)
+        _cprofile = None
+    result = metrics()
+    _enabled = False
+    if _options.profile:
+        report(result)
+    if _options.metrics_json:
+        with open(_options.metrics_json, 'w') as f:
+            json.dump(result, f, indent=1)
+    reset()
+    return
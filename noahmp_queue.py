@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# persistent local queue of Noah-MP case pipelines
+#   new_case -> run_case -> strip -> cf -> extract
+
+import sys
+import os
+import os.path
+import time
+import json
+import sqlite3
+import subprocess
+import argparse
+import concurrent.futures
+
+QUEUE_DB = 'noahmp_queue.sqlite'
+STAGES = ['new_case', 'run_case', 'strip', 'cf', 'extract']
+EXTRACTS = ['et', 'runoff', 'tws']
+TOOLDIR = os.path.dirname(os.path.realpath(__file__))
+
+def connect(db):
+    con = sqlite3.connect(db, timeout=60.0)
+    con.execute('''CREATE TABLE IF NOT EXISTS cases (
+                     caseroot TEXT PRIMARY KEY,
+                     config TEXT NOT NULL,
+                     stage TEXT NOT NULL,
+                     status TEXT NOT NULL,
+                     added REAL NOT NULL,
+                     updated REAL NOT NULL)''')
+    con.execute('''CREATE TABLE IF NOT EXISTS stages (
+                     caseroot TEXT NOT NULL,
+                     stage TEXT NOT NULL,
+                     started REAL NOT NULL,
+                     finished REAL,
+                     status TEXT NOT NULL)''')
+    con.commit()
+    return con
+
+def tool(name):
+    return [sys.executable, os.path.join(TOOLDIR, name)]
+
+def stage_commands(stage, caseroot, config):
+    '''commands of a stage, or [] if the case is not configured for it'''
+    if stage == 'new_case':
+        if config.get('begtime') is None:
+            return []
+        cmd = tool('noahmp_new_case.py') + [caseroot,
+                                             '-b', config['begtime'],
+                                             '-e', config['endtime']]
+        for key, opt in (('modelroot', '-m'), ('namelist', '-n'),
+                         ('forcing', '-f'), ('wrfinput', '-i'),
+                         ('begtimespinup', '-bs'), ('nloop', '-l'),
+                         ('ntiles', '-t')):
+            if config.get(key) is not None:
+                cmd += [opt, str(config[key])]
+        return [cmd]
+    elif stage == 'run_case':
+        # never --fresh: run_resume_skip decides to run, resume, or skip
+        return [tool('noahmp_run_case.py') + [caseroot]]
+    elif stage == 'strip':
+        return [tool('noahmp_strip_output.py') + [caseroot]] if config.get('strip') else []
+    elif stage == 'cf':
+        if config.get('cf') is None:
+            return []
+        wrfinput = config.get('wrfinput') or os.path.join(caseroot, 'wrfinput_d01')
+        return [tool('noahmp_ldasout2cf.py') + [wrfinput, caseroot, config['cf'],
+                                                config['begtime'], config['endtime']]]
+    elif stage == 'extract':
+        if config.get('cf') is None or config.get('extract') is None:
+            return []
+        # only this case's CF file: others may share its directory
+        return [tool('extract_' + x + '.py') + [config['cf'], config['extract']]
+                for x in EXTRACTS]
+    return []
+
+def process_case(db, caseroot):
+    '''run the remaining stages of one case; True on success'''
+    con = connect(db)
+    config, stage = con.execute('SELECT config, stage FROM cases WHERE caseroot = ?',
+                                (caseroot,)).fetchone()
+    config = json.loads(config)
+    with con:
+        con.execute("UPDATE cases SET status = 'running', updated = ? WHERE caseroot = ?",
+                    (time.time(), caseroot))
+    for istage in range(STAGES.index(stage), len(STAGES)):
+        stage = STAGES[istage]
+        with con:
+            con.execute('UPDATE cases SET stage = ?, updated = ? WHERE caseroot = ?',
+                        (stage, time.time(), caseroot))
+        cmds = stage_commands(stage, caseroot, config)
+        if len(cmds) == 0:
+            continue
+        print('QUEUE: ' + caseroot + ' ' + stage, flush=True)
+        with con:
+            rowid = con.execute("INSERT INTO stages VALUES (?, ?, ?, NULL, 'running')",
+                                (caseroot, stage, time.time())).lastrowid
+        status = 'done'
+        os.makedirs(caseroot, exist_ok=True)
+        if stage == 'extract':
+            os.makedirs(config['extract'], exist_ok=True)
+        logfile = os.path.join(caseroot, 'noahmp_queue.' + stage + '.log')
+        with open(logfile, 'at') as log:
+            for cmd in cmds:
+                if subprocess.call(cmd, stdout=log, stderr=subprocess.STDOUT) != 0:
+                    status = 'failed'
+                    break
+        with con:
+            con.execute('UPDATE stages SET finished = ?, status = ? WHERE rowid = ?',
+                        (time.time(), status, rowid))
+        if status == 'failed':
+            with con:
+                con.execute("UPDATE cases SET status = 'failed', updated = ? WHERE caseroot = ?",
+                            (time.time(), caseroot))
+            print('QUEUE: ' + caseroot + ' ' + stage + ' failed (see ' + logfile + ')', flush=True)
+            con.close()
+            return False
+    with con:
+        con.execute("UPDATE cases SET stage = ?, status = 'done', updated = ? WHERE caseroot = ?",
+                    (STAGES[-1], time.time(), caseroot))
+    con.close()
+    return True
+
+def add(db, caseroot, config):
+    caseroot = os.path.abspath(caseroot)
+    for key in ('forcing', 'wrfinput', 'modelroot', 'namelist', 'cf', 'extract'):
+        if config.get(key) is not None:
+            config[key] = os.path.abspath(config[key])
+    stage = STAGES[0] if config.get('begtime') is not None else STAGES[1]
+    with connect(db) as con:
+        con.execute("INSERT OR REPLACE INTO cases VALUES (?, ?, ?, 'pending', ?, ?)",
+                    (caseroot, json.dumps(config), stage, time.time(), time.time()))
+    return
+
+def run(db, workers=1, retry=False):
+    with connect(db) as con:
+        # a previous dispatcher died (e.g. node failure): pick up where it left off
+        con.execute("UPDATE cases SET status = 'pending' WHERE status = 'running'")
+        con.execute("UPDATE stages SET status = 'interrupted' WHERE status = 'running'")
+        if retry:
+            con.execute("UPDATE cases SET status = 'pending' WHERE status = 'failed'")
+        caseroots = [x[0] for x in con.execute(
+            "SELECT caseroot FROM cases WHERE status = 'pending' ORDER BY added")]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(process_case, db, x): x for x in caseroots}
+        for future in concurrent.futures.as_completed(futures):
+            future.result()
+    return
+
+def status(db):
+    with connect(db) as con:
+        for caseroot, stage, state in con.execute(
+                'SELECT caseroot, stage, status FROM cases ORDER BY added'):
+            print('{0:s} {1:s} {2:s}'.format(caseroot, stage, state))
+        print('stage     runs  failed  mean(s)  total(h)')
+        for stage in STAGES:
+            runs, failed, mean, total = con.execute(
+                "SELECT COUNT(*), SUM(status = 'failed'), AVG(finished - started), "
+                'SUM(finished - started) FROM stages WHERE stage = ? AND finished IS NOT NULL',
+                (stage,)).fetchone()
+            print('{0:8s} {1:5d} {2:7d} {3:8.1f} {4:9.2f}'.format(
+                stage, runs, failed or 0, mean or 0.0, (total or 0.0) / 3600.0))
+    return
+
+def reset(db, caseroot, stage):
+    with connect(db) as con:
+        con.execute("UPDATE cases SET stage = ?, status = 'pending', updated = ? WHERE caseroot = ?",
+                    (stage, time.time(), os.path.abspath(caseroot)))
+    return
+
+def cli(argv=None):
+    '''command line; argv defaults to sys.argv[1:]'''
+    parser = argparse.ArgumentParser(description='persistent local queue of Noah-MP case pipelines')
+    parser.add_argument('--db', type=str, default=QUEUE_DB,
+                        help='SQLite state store (default: ' + QUEUE_DB + ')')
+    subparsers = parser.add_subparsers(dest='command')
+    parser_add = subparsers.add_parser('add', help='add (or replace) a case')
+    parser_add.add_argument('caseroot', type=str)
+    parser_add.add_argument('-b', '--begtime', type=str,
+                            help='start date and time (omit for an existing case)')
+    parser_add.add_argument('-e', '--endtime', type=str,
+                            help='end date and time (exclusive)')
+    parser_add.add_argument('-bs', '--begtimespinup', type=str)
+    parser_add.add_argument('-l', '--nloop', type=int)
+    parser_add.add_argument('-t', '--ntiles', type=int)
+    parser_add.add_argument('-m', '--modelroot', type=str)
+    parser_add.add_argument('-n', '--namelist', type=str)
+    parser_add.add_argument('-f', '--forcing', type=str)
+    parser_add.add_argument('-i', '--wrfinput', type=str)
+    parser_add.add_argument('--strip', action='store_true',
+                            help='strip LDASOUT files after the run')
+    parser_add.add_argument('--cf', type=str,
+                            help='CF-compatible output file (requires --begtime/--endtime)')
+    parser_add.add_argument('--extract', type=str,
+                            help='output directory of extract_{' + ','.join(EXTRACTS) + '}, '
+                            'run on the --cf file')
+    parser_run = subparsers.add_parser('run', help='run all pending cases')
+    parser_run.add_argument('-w', '--workers', type=int, default=1,
+                            help='number of cases processed concurrently (default: 1)')
+    parser_run.add_argument('--retry', action='store_true',
+                            help='also retry failed cases from the failed stage')
+    subparsers.add_parser('status', help='show case states and per-stage timings')
+    parser_reset = subparsers.add_parser('reset', help='restart a case from a stage')
+    parser_reset.add_argument('caseroot', type=str)
+    parser_reset.add_argument('-s', '--stage', choices=STAGES, default=STAGES[1])
+    args = parser.parse_args(argv)
+    if args.command is None:    # add_subparsers(required=) needs Python 3.7
+        parser.error('a command is required')
+    if args.command == 'add' and args.cf is not None \
+       and (args.begtime is None or args.endtime is None):
+        parser.error('--cf requires --begtime and --endtime')
+    if args.command == 'add':
+        add(args.db, args.caseroot,
+            {key: getattr(args, key)
+             for key in ('begtime', 'endtime', 'begtimespinup', 'nloop', 'ntiles',
+                         'modelroot', 'namelist', 'forcing', 'wrfinput',
+                         'strip', 'cf', 'extract')})
+    elif args.command == 'run':
+        run(args.db, workers=args.workers, retry=args.retry)
+    elif args.command == 'status':
+        status(args.db)
+    elif args.command == 'reset':
+        reset(args.db, args.caseroot, args.stage)
+    return
+
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# rechunk a CF-compatible NoahMP file into a pixel-major (time series) layout
+
+import os
+import time
+import argparse
+import tempfile
+import numpy as np
+import netCDF4 as nc
+import noahmp_profile
+
+MEMORY = 1024**3                # bytes
+
+def spatial(var):
+    '''(time, ..., y, x) variables are rechunked, everything else is copied'''
+    return len(var.dimensions) >= 3 and var.dimensions[0].lower() == 'time'
+
+def define_output(fi, fo, tchunk, ychunk, xchunk):
+    fo.setncatts({att: fi.getncattr(att) for att in fi.ncattrs()})
+    for dim in fi.dimensions:
+        fo.createDimension(dim, None if fi.dimensions[dim].isunlimited()
+                           else len(fi.dimensions[dim]))
+    for var in fi.variables:
+        vi = fi.variables[var]
+        filters = vi.filters() or {}
+        attrs = {att: vi.getncattr(att) for att in vi.ncattrs()}
+        if spatial(vi):
+            chunksizes = [min(tchunk, max(vi.shape[0], 1))] + [1] * (vi.ndim - 3) \
+                + [min(ychunk, vi.shape[-2]), min(xchunk, vi.shape[-1])]
+        else:
+            chunksizes = None
+        fo.createVariable(var, vi.dtype, vi.dimensions,
+                          zlib=filters.get('zlib', True),
+                          complevel=filters.get('complevel', 6),
+                          shuffle=filters.get('shuffle', True),
+                          chunksizes=chunksizes,
+                          fill_value=attrs.pop('_FillValue', None))
+        fo.variables[var].setncatts(attrs)
+    return
+
+def rechunk_var(vi, vo, ychunk, xchunk, memory, tmpdir):
+    '''out-of-core two-pass shuffle of one (time, ..., y, x) variable
+
+    pass 1 reads time blocks of whole fields into a scratch file laid out
+    by y-bands; pass 2 reads (all times) x (band) x (x-block) bricks of
+    the scratch and writes them as whole output chunks.
+    '''
+    vi.set_auto_maskandscale(False)
+    vo.set_auto_maskandscale(False)
+    nt, ny, nx = vi.shape[0], vi.shape[-2], vi.shape[-1]
+    itemsize = vi.dtype.itemsize
+    nband = (ny + ychunk - 1) // ychunk
+    tblock = max(memory // (ny * nx * itemsize), 1)
+    xblock = max(memory // (nt * ychunk * xchunk * itemsize), 1) * xchunk
+    with tempfile.NamedTemporaryFile(dir=tmpdir) as tmp:
+        scratch = np.memmap(tmp, dtype=vi.dtype, mode='w+',
+                            shape=(nband, nt, ychunk, nx))
+        for zind in np.ndindex(*vi.shape[1:-2]):
+            # pass 1: time-major reads
+            for t0 in range(0, nt, tblock):
+                t1 = min(t0 + tblock, nt)
+                with noahmp_profile.stage('read'):
+                    v = vi[(slice(t0, t1),) + zind]
+                noahmp_profile.count('read', vi.name, v)
+                with noahmp_profile.stage('scratch'):
+                    for iband in range(nband):
+                        y0, y1 = iband * ychunk, min((iband + 1) * ychunk, ny)
+                        scratch[iband, t0:t1, 0:y1-y0, :] = v[:, y0:y1, :]
+            # pass 2: pixel-major writes
+            for iband in range(nband):
+                y0, y1 = iband * ychunk, min((iband + 1) * ychunk, ny)
+                for x0 in range(0, nx, xblock):
+                    x1 = min(x0 + xblock, nx)
+                    brick = scratch[iband, :, 0:y1-y0, x0:x1]
+                    with noahmp_profile.stage('write'):
+                        vo[(slice(None),) + zind + (slice(y0, y1), slice(x0, x1))] = brick
+                    noahmp_profile.count('written', vo.name, brick)
+        del scratch
+    return
+
+def rechunk(infile, outfile, tchunk=8784, ychunk=16, xchunk=16,
+            memory=MEMORY, tmpdir=None):
+    with nc.Dataset(infile, 'r') as fi, \
+         nc.Dataset(outfile, 'w', format=fi.data_model) as fo:
+        with noahmp_profile.stage('define'):
+            define_output(fi, fo, tchunk, ychunk, xchunk)
+        for var in fi.variables:
+            print(var, flush=True)
+            vi = fi.variables[var]
+            if spatial(vi) and vi.shape[0] > 0:
+                rechunk_var(vi, fo.variables[var], ychunk, xchunk, memory, tmpdir)
+            else:
+                vi.set_auto_maskandscale(False)
+                fo.variables[var].set_auto_maskandscale(False)
+                with noahmp_profile.stage('copy'):
+                    fo.variables[var][:] = vi[:]
+        with noahmp_profile.stage('close'):
+            fo.sync()
+    return
+
+def benchmark(infile, outfile, var=None, npixel=10):
+    '''seconds to read single-pixel time series from infile and outfile'''
+    with nc.Dataset(infile, 'r') as fi:
+        if var is None:
+            var = [x for x in fi.variables if spatial(fi.variables[x])][0]
+        shape = fi.variables[var].shape
+    rng = np.random.default_rng(0)
+    pixels = [(rng.integers(shape[-2]), rng.integers(shape[-1])) for _ in range(npixel)]
+    print('benchmark: {0:s} {1:s}, {2:d} single-pixel time series'.format(var, str(shape), npixel))
+    for f in (infile, outfile):
+        start = time.time()
+        for j, i in pixels:
+            # reopen: no chunk cache carried over between pixels
+            with nc.Dataset(f, 'r') as fi:
+                fi.variables[var][(slice(None),) + (0,) * (len(shape) - 3) + (j, i)]
+        print('{0:s}: {1:.3f} s/pixel'.format(f, (time.time() - start) / npixel))
+    return
+
+def cli(argv=None):
+    '''command line; argv defaults to sys.argv[1:]'''
+    parser = argparse.ArgumentParser(description='rechunk a CF-compatible file into a pixel-major (time series) layout')
+    parser.add_argument('infile', help='CF-compatible file (time-major)')
+    parser.add_argument('outfile', help='rechunked file')
+    parser.add_argument('-t', '--time-chunk', type=int, default=8784,
+                        help='chunk length along time (default: 8784)')
+    parser.add_argument('-s', '--space-chunk', type=int, default=16,
+                        help='chunk length along y and x (default: 16)')
+    parser.add_argument('-m', '--memory', type=float, default=MEMORY / 1024**2,
+                        help='memory budget in MiB (default: 1024)')
+    parser.add_argument('--tmpdir', type=str,
+                        help='directory of the scratch file (default: system temporary directory)')
+    parser.add_argument('--benchmark', nargs='?', const='', default=None, metavar='VAR',
+                        help='compare single-pixel reads of VAR (default: first rechunked variable)')
+    noahmp_profile.add_arguments(parser)
+    args = parser.parse_args(argv)
+    noahmp_profile.setup(args)
+    rechunk(args.infile, args.outfile, tchunk=args.time_chunk,
+            ychunk=args.space_chunk, xchunk=args.space_chunk,
+            memory=int(args.memory * 1024**2), tmpdir=args.tmpdir)
+    if args.benchmark is not None:
+        benchmark(args.infile, args.outfile, var=args.benchmark or None)
+    return
+
+if __name__ == '__main__':
+    cli()
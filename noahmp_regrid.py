@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# regridding from the (curvilinear) WRF grid to a regular lat/lon grid
+
+import os
+import hashlib
+import argparse
+import tempfile
+import functools
+import numpy as np
+import netCDF4 as nc
+
+METHODS = ['bilinear', 'average']
+
+def parse_grid(text):
+    '''cell centres (lat, lon) of LAT0,LAT1,LON0,LON1,DLAT[,DLON] (inclusive)'''
+    fields = [float(x) for x in text.split(',')]
+    if len(fields) not in (5, 6):
+        raise ValueError('bad grid (LAT0,LAT1,LON0,LON1,DLAT[,DLON]): ' + text)
+    lat0, lat1, lon0, lon1, dlat = fields[0:5]
+    dlon = fields[5] if len(fields) == 6 else dlat
+    lat = lat0 + dlat * np.arange(int(round((lat1 - lat0) / dlat)) + 1)
+    lon = lon0 + dlon * np.arange(int(round((lon1 - lon0) / dlon)) + 1)
+    return lat, lon
+
+def edges(centres):
+    mid = (centres[1:] + centres[:-1]) / 2
+    return np.concatenate([[centres[0] - (mid[0] - centres[0])], mid,
+                           [centres[-1] + (centres[-1] - mid[-1])]])
+
+def bilinear_weights(xlat, xlong, lat, lon):
+    '''(rows, cols, weights) of bilinear interpolation within the source quads
+
+    Every source quad is matched with the target points inside its
+    bounding box; the quad coordinates (s, t) of those points are found
+    by Newton iterations of the inverse bilinear mapping.
+    '''
+    ny, nx = xlat.shape
+    jj, ii = np.meshgrid(np.arange(ny - 1), np.arange(nx - 1), indexing='ij')
+    corners = [(jj, ii), (jj, ii + 1), (jj + 1, ii), (jj + 1, ii + 1)]
+    qlat = np.stack([xlat[c] for c in corners]).reshape(4, -1).astype('f8')
+    qlon = np.stack([xlong[c] for c in corners]).reshape(4, -1).astype('f8')
+    # target points in the bounding box of each quad
+    j0 = np.searchsorted(lat, qlat.min(axis=0), 'left')
+    j1 = np.searchsorted(lat, qlat.max(axis=0), 'right')
+    i0 = np.searchsorted(lon, qlon.min(axis=0), 'left')
+    i1 = np.searchsorted(lon, qlon.max(axis=0), 'right')
+    nj, ni = np.maximum(j1 - j0, 0), np.maximum(i1 - i0, 0)
+    count = nj * ni
+    q = np.repeat(np.arange(len(count)), count)
+    k = np.arange(len(q)) - np.repeat(np.cumsum(count) - count, count)
+    tj = j0[q] + k // ni[q]
+    ti = i0[q] + k % ni[q]
+    # p = a + b s + c t + d s t
+    px, py = lon[ti], lat[tj]
+    ax, ay = qlon[0, q], qlat[0, q]
+    bx, by = qlon[1, q] - ax, qlat[1, q] - ay
+    cx, cy = qlon[2, q] - ax, qlat[2, q] - ay
+    dx, dy = qlon[3, q] - qlon[1, q] - qlon[2, q] + ax, qlat[3, q] - qlat[1, q] - qlat[2, q] + ay
+    s = np.full(len(q), 0.5)
+    t = np.full(len(q), 0.5)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for _ in range(10):
+            fx = ax + bx * s + cx * t + dx * s * t - px
+            fy = ay + by * s + cy * t + dy * s * t - py
+            j00, j01 = bx + dx * t, cx + dx * s
+            j10, j11 = by + dy * t, cy + dy * s
+            det = j00 * j11 - j01 * j10
+            s = s - (j11 * fx - j01 * fy) / det
+            t = t - (j00 * fy - j10 * fx) / det
+    eps = 1e-6
+    inside = np.isfinite(s) & np.isfinite(t) \
+        & (s >= -eps) & (s <= 1 + eps) & (t >= -eps) & (t <= 1 + eps)
+    # points on shared edges: keep the first quad
+    target = (tj * len(lon) + ti)[inside]
+    target, first = np.unique(target, return_index=True)
+    q, s, t = q[inside][first], np.clip(s[inside][first], 0, 1), np.clip(t[inside][first], 0, 1)
+    qj, qi = q // (nx - 1), q % (nx - 1)
+    rows = np.repeat(target, 4)
+    cols = np.stack([qj * nx + qi, qj * nx + qi + 1,
+                     (qj + 1) * nx + qi, (qj + 1) * nx + qi + 1], axis=1).ravel()
+    weights = np.stack([(1 - s) * (1 - t), s * (1 - t), (1 - s) * t, s * t], axis=1).ravel()
+    return rows, cols, weights
+
+def average_weights(xlat, xlong, lat, lon):
+    '''(rows, cols, weights) averaging the source cells centred in each target cell'''
+    j = np.searchsorted(edges(lat), xlat.ravel()) - 1
+    i = np.searchsorted(edges(lon), xlong.ravel()) - 1
+    inside = (j >= 0) & (j < len(lat)) & (i >= 0) & (i < len(lon))
+    rows = (j * len(lon) + i)[inside]
+    cols = np.arange(xlat.size)[inside]
+    return rows, cols, np.ones(len(rows))
+
+class Regridder(object):
+    '''sparse (CSR-like) weights from the source grid to a regular grid
+
+    apply() works on (..., south_north, west_east) arrays. NaN sources
+    are left out and the remaining weights renormalized; target cells
+    without valid sources are NaN. Integer fields take the source with
+    the largest weight.
+    '''
+    def __init__(self, shape, targets, starts, cols, weights, nearest):
+        self.shape = tuple(shape)
+        self.targets = targets          # target cells with weights
+        self.starts = starts            # first entry of each target cell
+        self.cols = cols                # source cells
+        self.weights = weights
+        self.nearest = nearest          # source of largest weight per target cell
+
+    @classmethod
+    def build(cls, xlat, xlong, lat, lon, method='bilinear'):
+        if method == 'bilinear':
+            rows, cols, weights = bilinear_weights(xlat, xlong, lat, lon)
+        else:
+            rows, cols, weights = average_weights(xlat, xlong, lat, lon)
+        order = np.lexsort((-weights, rows))
+        rows, cols, weights = rows[order], cols[order], weights[order]
+        targets, starts = np.unique(rows, return_index=True)
+        return cls((len(lat), len(lon)), targets, starts, cols, weights, cols[starts])
+
+    def save(self, filename):
+        fd, tmpname = tempfile.mkstemp(suffix='.npz', dir=os.path.dirname(os.path.abspath(filename)))
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, shape=self.shape, targets=self.targets, starts=self.starts,
+                     cols=self.cols, weights=self.weights, nearest=self.nearest)
+        os.replace(tmpname, filename)
+        return
+
+    def apply(self, v):
+        v = np.asarray(v)
+        lead = v.shape[:-2]
+        src = v.reshape((-1, v.shape[-2] * v.shape[-1]))
+        size = self.shape[0] * self.shape[1]
+        if np.issubdtype(v.dtype, np.integer):
+            out = np.full((src.shape[0], size), nc.default_fillvals[v.dtype.str[1:]], dtype=v.dtype)
+            out[:, self.targets] = src[:, self.nearest]
+        else:
+            out = np.full((src.shape[0], size), np.nan, dtype=v.dtype)
+            if len(self.targets) > 0:
+                x = src[:, self.cols]
+                valid = np.isfinite(x)
+                num = np.add.reduceat(np.where(valid, x * self.weights, 0.0), self.starts, axis=1)
+                den = np.add.reduceat(np.where(valid, self.weights, 0.0), self.starts, axis=1)
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    out[:, self.targets] = num / den
+        return out.reshape(lead + self.shape)
+
+@functools.lru_cache(maxsize=4)
+def load(filename):
+    with np.load(filename) as f:
+        return Regridder(**{x: f[x] for x in f.files})
+
+def weights_file(wrfinput, lat, lon, method='bilinear', cachedir=None):
+    '''cached weights for wrfinput -> (lat, lon), computed on first use
+
+    The cache file is keyed by a hash of XLAT/XLONG, the target grid and
+    the method.
+    '''
+    with nc.Dataset(wrfinput, 'r') as fwrf:
+        xlat = np.squeeze(fwrf.variables['XLAT'][:]).astype('f8')
+        xlong = np.squeeze(fwrf.variables['XLONG'][:]).astype('f8')
+    key = hashlib.sha1()
+    key.update(xlat.tobytes())
+    key.update(xlong.tobytes())
+    key.update(np.asarray(lat, dtype='f8').tobytes())
+    key.update(np.asarray(lon, dtype='f8').tobytes())
+    key.update(method.encode('ascii'))
+    filename = os.path.join(cachedir or '.', 'regrid-' + key.hexdigest()[0:16] + '.npz')
+    if not os.path.isfile(filename):
+        print('computing {0:s} weights -> {1:s}'.format(method, filename), flush=True)
+        Regridder.build(xlat, xlong, lat, lon, method).save(filename)
+    return filename
+
+def cli(argv=None):
+    '''command line; argv defaults to sys.argv[1:]'''
+    parser = argparse.ArgumentParser(description='precompute regridding weights from a wrfinput grid to a regular lat/lon grid')
+    parser.add_argument('wrfinput')
+    parser.add_argument('grid', help='LAT0,LAT1,LON0,LON1,DLAT[,DLON] (cell centres, inclusive)')
+    parser.add_argument('-m', '--method', choices=METHODS, default='bilinear')
+    parser.add_argument('--weights-dir', type=str, default='.',
+                        help='directory of cached weights (default: .)')
+    args = parser.parse_args(argv)
+    lat, lon = parse_grid(args.grid)
+    print(weights_file(args.wrfinput, lat, lon, args.method, args.weights_dir))
+    return
+
+if __name__ == '__main__':
+    cli()
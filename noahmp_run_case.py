@@ -10,28 +10,211 @@ import glob
 import subprocess
 import shutil
 import datetime
+import time
+import json
+import resource
+import concurrent.futures
 import netCDF4 as nc
 import f90nml
+from noahmp_monitor_case import CaseMonitor, case_period
+from noahmp_merge_tiles import tiledirs, merge_tiles
+from noahmp_stage_forcing import ForcingStager
 
 NOAHMP_EXE = 'noahmp_hrldas.exe'
 NAMELIST = 'namelist.hrldas'
+RUNLOG = 'noahmp_runs.jsonl'
 
-def run(dirname):
+def proc_io():
+    '''I/O counters (/proc/self/io) of this process and its waited-for children'''
+    counters = {}
+    try:
+        with open('/proc/self/io', 'rt') as f:
+            for line in f:
+                key, val = line.split(':')
+                counters[key.strip()] = int(val)
+    except (OSError, ValueError):
+        pass
+    return counters
+
+def wait(proc):
+    '''wait for proc, returning (exit status, resource usage of proc alone)'''
+    _, status, rusage = os.wait4(proc.pid, 0)
+    proc.returncode = -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status)
+    return proc.returncode, rusage
+
+def maxrss_kb(rusage):
+    '''peak RSS in KiB (ru_maxrss is in bytes on macOS)'''
+    return rusage.ru_maxrss // 1024 if sys.platform == 'darwin' else rusage.ru_maxrss
+
+def record_run(runlog, dirname, period, status, wall, ru0, ru1, io0, io1, maxrss=None):
+    '''append resource usage of one model execution to runlog; maxrss is the
+    peak RSS (KiB) of the model process, or the largest of its tiles'''
+    record = {'dirname': dirname,
+              'start': datetime.datetime.fromtimestamp(time.time() - wall).isoformat(timespec='seconds'),
+              'status': status,
+              'wall_seconds': round(wall, 3),
+              'user_seconds': round(ru1.ru_utime - ru0.ru_utime, 3),
+              'system_seconds': round(ru1.ru_stime - ru0.ru_stime, 3),
+              'maxrss_kb': maxrss,
+              'sim_begin': period[1].isoformat(),
+              'sim_end': period[2].isoformat(),
+              'sim_days': (period[2] - period[1]).total_seconds() / 86400.0}
+    for key in ('rchar', 'wchar', 'read_bytes', 'write_bytes'):
+        if key in io0 and key in io1:
+            record[key] = io1[key] - io0[key]
+    with open(runlog, 'at') as f:
+        f.write(json.dumps(record) + '\n')
+    return
+
+def run_tiles(dirname, usage=None):
+    '''run all tiles of dirname concurrently, then merge their outputs;
+    usage['maxrss_kb'] is set to the largest peak RSS of the tiles'''
+    procs = []
+    for tdir in tiledirs(dirname):
+        log = open(os.path.join(tdir, NOAHMP_EXE + '.log'), 'wt')
+        procs.append((tdir, log,
+                      subprocess.Popen([os.path.join(tdir, NOAHMP_EXE),], cwd=tdir,
+                                       stdout=log, stderr=subprocess.STDOUT,
+                                       universal_newlines=True)))
+    failed = None
+    for tdir, log, proc in procs:
+        retcode, rusage = wait(proc)
+        log.close()
+        if usage is not None:
+            usage['maxrss_kb'] = max(usage.get('maxrss_kb', 0), maxrss_kb(rusage))
+        if retcode != 0 and failed is None:
+            failed = subprocess.CalledProcessError(retcode, proc.args)
+            print('RUN_TILE: ' + tdir + ' failed (see ' + log.name + ')')
+    if failed is not None:
+        raise failed
+    merge_tiles(dirname)
+    return
+
+def swap_indir(dirname, indir):
+    '''point INDIR of dirname to indir, keeping the original namelist'''
+    namelist = os.path.join(dirname, NAMELIST)
+    namelist_bak = namelist + '-orig-before-stage'
+    os.rename(namelist, namelist_bak)
+    nml = f90nml.read(namelist_bak)
+    nml['noahlsm_offline']['indir'] = indir
+    nml.write(namelist)
+    return
+
+def restore_indir(dirname):
+    namelist = os.path.join(dirname, NAMELIST)
+    namelist_bak = namelist + '-orig-before-stage'
+    if os.path.isfile(namelist_bak):
+        os.replace(namelist_bak, namelist)
+    return
+
+def run(dirname, monitor=0, runlog=None, indir=None):
     curdir = os.getcwd()
     exefile = os.path.join(dirname, NOAHMP_EXE)
     os.chdir(dirname)
-    subprocess.check_call([exefile,], stdout=sys.stdout, stderr=sys.stderr,
-                          universal_newlines=True)
+    tiles = tiledirs(dirname)
+    if indir is not None:
+        for d in [dirname] + tiles:
+            restore_indir(d)
+            swap_indir(d, indir)
+    if monitor > 0:
+        casemonitor = CaseMonitor(tiles[0] if tiles else dirname, interval=monitor)
+        casemonitor.start()
+    if runlog is not None:
+        period = case_period(dirname)
+        ru0 = resource.getrusage(resource.RUSAGE_CHILDREN)
+        io0 = proc_io()
+        wall0 = time.time()
+    status = 0
+    usage = {}
+    try:
+        if tiles:
+            run_tiles(dirname, usage)
+        else:
+            proc = subprocess.Popen([exefile,], stdout=sys.stdout, stderr=sys.stderr,
+                                    universal_newlines=True)
+            retcode, rusage = wait(proc)
+            usage['maxrss_kb'] = maxrss_kb(rusage)
+            if retcode != 0:
+                raise subprocess.CalledProcessError(retcode, proc.args)
+    except subprocess.CalledProcessError as e:
+        status = e.returncode
+        raise
+    except OSError:
+        status = -1
+        raise
+    finally:
+        if indir is not None:
+            for d in [dirname] + tiles:
+                restore_indir(d)
+        if monitor > 0:
+            casemonitor.stop()
+        if runlog is not None:
+            record_run(runlog, dirname, period, status, time.time() - wall0,
+                       ru0, resource.getrusage(resource.RUSAGE_CHILDREN),
+                       io0, proc_io(), usage.get('maxrss_kb'))
     os.chdir(curdir)
     return
 
-def run_resume_skip(dirname):
+def restart_signature(resfile):
+    '''format, size, and variable shapes of a known-good restart'''
+    with nc.Dataset(resfile, 'r') as f:
+        return (f.file_format, os.path.getsize(resfile),
+                {var: f.variables[var].shape for var in f.variables})
+
+def check_restart(resfile, signature=None):
+    '''None if resfile looks complete, otherwise the reason why not'''
+    try:
+        with nc.Dataset(resfile, 'r') as f:
+            if signature is not None:
+                fmt, size, shapes = signature
+                for var, shape in shapes.items():
+                    if var not in f.variables:
+                        return 'missing variable ' + var
+                    if f.variables[var].shape != shape:
+                        return 'shape of ' + var + ' is ' + str(f.variables[var].shape)
+                if f.file_format == fmt and fmt.startswith('NETCDF3') \
+                   and os.path.getsize(resfile) != size:
+                    return 'size is {0:d} bytes (expected {1:d})'.format(
+                        os.path.getsize(resfile), size)
+            if not f.file_format.startswith('NETCDF3'):
+                # the last chunk of every variable is written last
+                for var in f.variables:
+                    if f.variables[var].size > 0:
+                        f.variables[var][(-1,) * f.variables[var].ndim]
+    except (OSError, RuntimeError, IndexError, ValueError) as e:
+        return str(e)
+    return None
+
+def newest_valid_restart(resfiles, reference=None, nproc=None):
+    '''newest restart passing check_restart, and [(corrupt restart, reason)]
+
+    Candidates are checked newest first, nproc at a time in parallel.
+    '''
+    if nproc is None:
+        nproc = min(os.cpu_count() or 1, 8)
+    signature = None
+    if reference is not None and check_restart(reference) is None:
+        signature = restart_signature(reference)
+    candidates = sorted(resfiles, reverse=True)
+    corrupt = []
+    with concurrent.futures.ProcessPoolExecutor(max_workers=nproc) as pool:
+        for ibeg in range(0, len(candidates), nproc):
+            batch = candidates[ibeg:ibeg+nproc]
+            errors = list(pool.map(check_restart, batch, [signature] * len(batch)))
+            corrupt.extend((f, e) for f, e in zip(batch, errors) if e is not None)
+            valid = [f for f, e in zip(batch, errors) if e is None]
+            if len(valid) > 0:
+                return valid[0], corrupt
+    return None, corrupt
+
+def run_resume_skip(dirname, monitor=0, runlog=None, indir=None):
     '''run, resume, or skip'''
     curdir = os.getcwd()
     os.chdir(dirname)
     resume = False
     namelist = os.path.join(dirname, NAMELIST)
     namelist_bak = namelist + '-orig-before-resume'
+    restore_indir(dirname)
     if os.path.isfile(namelist_bak):
         os.remove(namelist)
         os.rename(namelist_bak, namelist)
@@ -47,29 +230,41 @@ def run_resume_skip(dirname):
     resfiles = sorted(glob.glob(os.path.join(dirname, 'RESTART.*_DOMAIN[0-9]')))
     resfile_nml = nml['noahlsm_offline'].get('restart_filename_requested')
     resfile_nml = os.path.abspath(resfile_nml) if resfile_nml is not None else resfile_nml
-    if len(resfiles) == 0:
+    resfile = None
+    if len(resfiles) > 0:
+        if resfile_nml is not None and os.path.isfile(resfile_nml):
+            reference = resfile_nml
+        else:
+            reference = resfiles[0]
+        resfile, corrupt = newest_valid_restart(resfiles, reference)
+        for f, reason in corrupt:
+            print('RUN_CASE: corrupt restart ' + f + ' (' + reason + ')')
+    if resfile is None:
         # run
         resume = False
     else:
         # skip, run, resume
-        if dt_end == datetime.datetime.strptime(os.path.basename(resfiles[-1])[8:18], '%Y%m%d%H'):
+        resfile = os.path.abspath(resfile)
+        if dt_end == datetime.datetime.strptime(os.path.basename(resfile)[8:18], '%Y%m%d%H'):
             # skip
             return False
-        elif (len(resfiles) == 1) and resfile_nml == os.path.abspath(resfiles[0]):
+        elif resfile_nml == resfile:
             # run
             resume = False
+        elif tiledirs(dirname):
+            # tiles read the restart named in their own namelists: rerun
+            resume = False
         else:
             # resume
             resume = True
     # resume or run
     if not resume:
         # 1. fresh case
-        run(dirname)
+        run(dirname, monitor=monitor, runlog=runlog, indir=indir)
     else:
         # 2. resume and run
         # prepare namelist
         os.rename(namelist, namelist_bak)
-        resfile = os.path.abspath(resfiles[max(len(resfiles) - 1, 0)])
         dt_res = datetime.datetime.strptime(os.path.basename(resfile)[8:18], '%Y%m%d%H')
         kday = (dt_end - dt_res).days
         nml['noahlsm_offline']['start_year'] = dt_res.year
@@ -81,7 +276,7 @@ def run_resume_skip(dirname):
         nml['noahlsm_offline']['kday'] = kday
         nml.write(namelist)
         # run
-        run(dirname)
+        run(dirname, monitor=monitor, runlog=runlog, indir=indir)
         # finish
         os.remove(namelist)
         os.rename(namelist_bak, namelist)
@@ -113,44 +308,61 @@ def process_restart(predir, curdir):
         f.variables['Times'][0,:] = nc.stringtoarr(curbeg.strftime('%Y-%m-%d_%H:%M:%S'), 19)
     return
 
-def main(caseroot, fresh=True):
+def main(caseroot, fresh=True, monitor=0, stagedir=None, stagejobs=8):
     caseroot = os.path.abspath(caseroot)
+    runlog = os.path.join(caseroot, RUNLOG)
     predir = None
     curdir = None
     # find out spinups
     print(caseroot)
     spinupdirs = glob.glob(os.path.join(caseroot,'spinup-*'))
+    rundirs = sorted(spinupdirs) + [caseroot]
 
+    stager = ForcingStager(stagedir, nproc=stagejobs) if stagedir is not None else None
     hasresume = False
-    # run spinups
-    for dirname in sorted(spinupdirs):
-        print('RUN_CASE: ' + dirname)
-        predir, curdir = curdir, dirname
-        process_restart(predir, curdir)
-        if fresh or hasresume:
-            run(curdir)
-        else:
-            hasresume = run_resume_skip(curdir)
-    
-    # run case
-    print('RUN_CASE: ' + caseroot)
-    predir, curdir = curdir, caseroot
-    process_restart(predir, curdir)
-    if fresh or hasresume:
-        run(curdir)
-    else:
-        run_resume_skip(curdir)
+    try:
+        # run spinups, then case
+        for irun, dirname in enumerate(rundirs):
+            print('RUN_CASE: ' + dirname)
+            predir, curdir = curdir, dirname
+            process_restart(predir, curdir)
+            indir = None
+            if stager is not None:
+                indir = stager.stage(curdir)
+                if irun + 1 < len(rundirs):
+                    stager.prefetch(rundirs[irun+1])
+            if fresh or hasresume:
+                run(curdir, monitor=monitor, runlog=runlog, indir=indir)
+            else:
+                hasresume = run_resume_skip(curdir, monitor=monitor, runlog=runlog, indir=indir)
+            if stager is not None and irun + 1 < len(rundirs):
+                stager.release(keep=rundirs[irun+1])
+    finally:
+        if stager is not None:
+            stager.cleanup()
     pass
 
 import argparse
-if __name__ == '__main__':
+def cli(argv=None):
+    '''command line; argv defaults to sys.argv[1:]'''
     parser = argparse.ArgumentParser(description='run Noah-MP case')
     parser.add_argument('caseroot', type=str,
                         help='top-level directory of Noah-MP case')
     parser.add_argument('-f', '--fresh', default=False,
                         action="store_true", help='treat as a fresh case')
-    args = parser.parse_args()
+    parser.add_argument('-m', '--monitor', type=float, default=0,
+                        help='report throughput and ETA every MONITOR seconds (default: 0, off)')
+    parser.add_argument('-s', '--stage-dir', type=str,
+                        help='stage the forcing of each run to this node-local scratch directory')
+    parser.add_argument('-j', '--stage-jobs', type=int, default=8,
+                        help='number of parallel copies when staging forcing (default: 8)')
+    args = parser.parse_args(argv)
     if not os.path.isdir(args.caseroot):
         print('Error: directory (' + args.caseroot + ') is not a valid caseroot!')
         sys.exit(1)
-    main(args.caseroot, fresh=args.fresh)
+    main(args.caseroot, fresh=args.fresh, monitor=args.monitor,
+         stagedir=args.stage_dir, stagejobs=args.stage_jobs)
+    return
+
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# summarize resource usage recorded by noahmp_run_case.py
+
+import sys
+import os.path
+import json
+import argparse
+
+RUNLOG = 'noahmp_runs.jsonl'
+
+def read_runlog(caseroot):
+    records = []
+    runlog = os.path.join(caseroot, RUNLOG)
+    if not os.path.isfile(runlog):
+        return records
+    with open(runlog, 'rt') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                records.append(json.loads(line))
+    return records
+
+def summarize(records):
+    summary = {'runs': len(records),
+               'failed': sum(1 for r in records if r['status'] != 0),
+               'wall_hours': sum(r['wall_seconds'] for r in records) / 3600.0,
+               'cpu_hours': sum(r['user_seconds'] + r['system_seconds'] for r in records) / 3600.0,
+               'maxrss_gb': max((r['maxrss_kb'] or 0 for r in records), default=0) / 1024.0**2,
+               'read_gb': sum(r.get('read_bytes', 0) for r in records) / 1024.0**3,
+               'write_gb': sum(r.get('write_bytes', 0) for r in records) / 1024.0**3,
+               'sim_days': sum(r['sim_days'] for r in records if r['status'] == 0)}
+    # throughput of the successful runs only
+    wall_ok = sum(r['wall_seconds'] for r in records if r['status'] == 0) / 3600.0
+    cpu_ok = sum(r['user_seconds'] + r['system_seconds']
+                 for r in records if r['status'] == 0) / 3600.0
+    if summary['sim_days'] > 0:
+        summary['sim_days_per_wall_hour'] = summary['sim_days'] / wall_ok if wall_ok > 0 else None
+        summary['wall_hours_per_sim_year'] = wall_ok / summary['sim_days'] * 365.0
+        summary['cpu_hours_per_sim_year'] = cpu_ok / summary['sim_days'] * 365.0
+    return summary
+
+def print_summary(name, summary):
+    print('{0:s}: {1:d} runs ({2:d} failed), {3:.2f} wall hours, {4:.2f} cpu hours, '
+          'max RSS {5:.2f} GB, read {6:.2f} GB, write {7:.2f} GB, {8:.1f} simulated days'.format(
+              name, summary['runs'], summary['failed'], summary['wall_hours'],
+              summary['cpu_hours'], summary['maxrss_gb'], summary['read_gb'],
+              summary['write_gb'], summary['sim_days']))
+    if 'wall_hours_per_sim_year' in summary:
+        print('    {0:.2f} wall hours / simulated year, {1:.2f} cpu hours / simulated year'.format(
+            summary['wall_hours_per_sim_year'], summary['cpu_hours_per_sim_year']))
+    return
+
+def main(caseroots, asjson=False):
+    allrecords = []
+    summaries = {}
+    for caseroot in caseroots:
+        records = read_runlog(caseroot)
+        if len(records) == 0:
+            print('no ' + RUNLOG + ' under ' + caseroot, file=sys.stderr)
+            continue
+        allrecords.extend(records)
+        summaries[caseroot] = summarize(records)
+    summaries['TOTAL'] = summarize(allrecords)
+    if asjson:
+        print(json.dumps(summaries, indent=1))
+    else:
+        for name, summary in summaries.items():
+            print_summary(name, summary)
+    return
+
+def cli(argv=None):
+    '''command line; argv defaults to sys.argv[1:]'''
+    parser = argparse.ArgumentParser(description='summarize resource usage of Noah-MP runs')
+    parser.add_argument('caseroot', nargs='+', type=str,
+                        help='top-level directories of Noah-MP cases')
+    parser.add_argument('--json', action='store_true',
+                        help='print machine-readable summary')
+    args = parser.parse_args(argv)
+    main(args.caseroot, asjson=args.json)
+    return
+
+if __name__ == '__main__':
+    cli()
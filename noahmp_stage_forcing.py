@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# stage the forcing (LDASIN) window of Noah-MP case directories to local scratch
+
+import os
+import os.path
+import glob
+import shutil
+import tempfile
+import argparse
+import threading
+import concurrent.futures
+from noahmp_check_forcing import case_window, forcing_index, forcing_time, window_times
+
+class ForcingStager(object):
+    '''copy the forcing window of case directories into a scratch directory
+
+    stage() copies in the foreground; prefetch() copies the window of the
+    next directory in a background thread while the current one runs.
+    '''
+    def __init__(self, scratch, nproc=8):
+        os.makedirs(scratch, exist_ok=True)
+        self.stagedir = tempfile.mkdtemp(prefix='noahmp-forcing-', dir=scratch)
+        self.nproc = nproc
+        self.prefetcher = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self.futures = {}
+        self.lock = threading.Lock()
+
+    def window(self, dirname):
+        '''forcing directory and LDASIN file names used by a case directory'''
+        indir, dtbeg, dtend, step = case_window(dirname)
+        wanted = set(window_times(dtbeg, dtend, step))
+        names = [name for name in forcing_index(indir) if forcing_time(name) in wanted]
+        return indir, sorted(names)
+
+    def copy(self, dirname, verbose):
+        indir, names = self.window(dirname)
+        def copy1(name):
+            src = os.path.join(indir, name)
+            dst = os.path.join(self.stagedir, name)
+            if not os.path.isfile(dst) or os.path.getsize(dst) != os.path.getsize(src):
+                shutil.copyfile(src, dst + '.part')
+                os.replace(dst + '.part', dst)
+            return
+        ndone = 0
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.nproc) as pool:
+            for _ in pool.map(copy1, names):
+                ndone += 1
+                if verbose and (ndone == len(names) or ndone % max(len(names) // 10, 1) == 0):
+                    print('STAGE_FORCING: {0:3.0f}% ({1:d}/{2:d} files)'.format(
+                        100.0 * ndone / len(names), ndone, len(names)), flush=True)
+        return self.stagedir
+
+    def prefetch(self, dirname):
+        with self.lock:
+            if dirname not in self.futures:
+                self.futures[dirname] = self.prefetcher.submit(self.copy, dirname, False)
+        return
+
+    def stage(self, dirname):
+        '''staged forcing directory for dirname, waiting for any prefetch'''
+        with self.lock:
+            future = self.futures.pop(dirname, None)
+        if future is not None:
+            future.result()
+        # copy (with progress), or fill in anything the prefetch missed
+        return self.copy(dirname, future is None)
+
+    def release(self, keep=None):
+        '''remove staged files not used by the case directory `keep`'''
+        names = set(self.window(keep)[1]) if keep is not None else set()
+        for f in glob.glob(os.path.join(self.stagedir, '*.LDASIN_DOMAIN*')):
+            if f.endswith('.part'):
+                continue        # being prefetched
+            if os.path.basename(f) not in names:
+                os.remove(f)
+        return
+
+    def cleanup(self):
+        self.prefetcher.shutdown(wait=True)
+        shutil.rmtree(self.stagedir, ignore_errors=True)
+        return
+
+def cli(argv=None):
+    '''command line; argv defaults to sys.argv[1:]'''
+    parser = argparse.ArgumentParser(description='stage the forcing window of Noah-MP case directories to local scratch')
+    parser.add_argument('dir', nargs='+', type=str,
+                        help='case directories (caseroot or spinup-*)')
+    parser.add_argument('-s', '--scratch', type=str, required=True,
+                        help='node-local scratch directory')
+    parser.add_argument('-j', '--jobs', type=int, default=8,
+                        help='number of parallel copies (default: 8)')
+    args = parser.parse_args(argv)
+    stager = ForcingStager(args.scratch, nproc=args.jobs)
+    for d in args.dir:
+        stager.stage(os.path.abspath(d))
+    stager.prefetcher.shutdown()
+    print(stager.stagedir)
+    return
+
+if __name__ == '__main__':
+    cli()
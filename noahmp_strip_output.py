@@ -4,29 +4,98 @@
 # delete useless variables, permute dimensions
 
 import os
+import stat
 import glob
-import subprocess
 import argparse
 import tempfile
+import concurrent.futures
+import numpy as np
+import netCDF4 as nc
 
+DROPVARS = ['BBXY', 'SATPSIXY', 'SATDKXY', 'MAXSMCXY', 'REFSMCXY', 'WLTSMCXY']
+DIMORDER = ['Time', 'snow_layers', 'soil_layers_stag', 'south_north', 'west_east']
 
-def strip_output(directory):
+def permute(dims):
+    '''dimensions in DIMORDER fill the slots they occupy in that order, others stay (ncpdq -a)'''
+    listed = iter([x for x in DIMORDER if x in dims])
+    return tuple(next(listed) if x in DIMORDER else x for x in dims)
+
+def stripped(fi):
+    '''True if fi is already in the form strip_file writes'''
+    return fi.data_model == 'NETCDF4_CLASSIC' \
+        and all(var not in DROPVARS and permute(fi.variables[var].dimensions) == fi.variables[var].dimensions
+                for var in fi.variables)
+
+def strip_file(f):
+    '''drop DROPVARS and permute to DIMORDER in one pass, replacing f
+    atomically; False if f was already stripped (and left untouched)'''
+    with nc.Dataset(f, 'r') as fi:
+        if stripped(fi):
+            return False
+    fd, tmpname = tempfile.mkstemp(prefix='.' + os.path.basename(f) + '.',
+                                   dir=os.path.dirname(os.path.abspath(f)))
+    os.close(fd)
+    try:
+        with nc.Dataset(f, 'r') as fi, \
+             nc.Dataset(tmpname, 'w', format='NETCDF4_CLASSIC') as fo:
+            fo.setncatts({att: fi.getncattr(att) for att in fi.ncattrs()})
+            for dim in fi.dimensions:
+                fo.createDimension(dim, None if fi.dimensions[dim].isunlimited()
+                                   else len(fi.dimensions[dim]))
+            for var in fi.variables:
+                if var in DROPVARS:
+                    continue
+                vi = fi.variables[var]
+                vi.set_auto_maskandscale(False)
+                dims = permute(vi.dimensions)
+                filters = vi.filters() or {}
+                attrs = {att: vi.getncattr(att) for att in vi.ncattrs()}
+                chunking = vi.chunking()
+                if chunking == 'contiguous' or chunking is None:
+                    chunksizes = None
+                else:
+                    chunksizes = [chunking[vi.dimensions.index(x)] for x in dims]
+                vo = fo.createVariable(var, vi.dtype, dims,
+                                       zlib=filters.get('zlib', False),
+                                       complevel=filters.get('complevel', 4),
+                                       shuffle=filters.get('shuffle', True),
+                                       chunksizes=chunksizes,
+                                       fill_value=attrs.pop('_FillValue', None))
+                vo.setncatts(attrs)
+                vo.set_auto_maskandscale(False)
+                v = vi[:]
+                if dims != vi.dimensions:
+                    v = np.transpose(v, [vi.dimensions.index(x) for x in dims])
+                vo[:] = v
+        os.chmod(tmpname, stat.S_IMODE(os.stat(f).st_mode))
+        os.replace(tmpname, f)
+    except BaseException:
+        os.remove(tmpname)
+        raise
+    return True
+
+def strip_output(directory, nproc=None):
     files = glob.glob(os.path.join(directory, '*.LDASOUT_DOMAIN[0-9]'))
-    for f in files:
-        print(f)
-        with tempfile.NamedTemporaryFile() as tmp:
-            subprocess.call(['ncks', '-O', '--fl_fmt=netcdf4_classic', '-h', '-x', '-v', 'BBXY,SATPSIXY,SATDKXY,MAXSMCXY,REFSMCXY,WLTSMCXY', f, tmp.name])
-            subprocess.call(['ncpdq', '-O', '--fl_fmt=netcdf4_classic', '-h', '-a', 'Time,snow_layers,soil_layers_stag,south_north,west_east', tmp.name, f])
+    with concurrent.futures.ProcessPoolExecutor(max_workers=nproc) as pool:
+        for f, changed in zip(files, pool.map(strip_file, files)):
+            print(f if changed else f + ' (already stripped)')
     return
 
-def main(dirs):
+def main(dirs, nproc=None):
     for d in dirs:
-        strip_output(d)
+        strip_output(d, nproc)
     return
 
 
-if __name__ == '__main__':
+def cli(argv=None):
+    '''command line; argv defaults to sys.argv[1:]'''
     parser = argparse.ArgumentParser(description='strip useless variables, permute dimensions')
     parser.add_argument('dir', nargs='+', type=str)
-    args = parser.parse_args()
-    main(args.dir)
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='number of files processed in parallel (default: number of CPUs)')
+    args = parser.parse_args(argv)
+    main(args.dir, args.jobs)
+    return
+
+if __name__ == '__main__':
+    cli()
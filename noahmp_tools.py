@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# single entry point of the tools: noahmp-tools COMMAND [ARGS]
+#
+# The dispatcher imports only the module of the command that runs and
+# calls its cli(argv). The tool modules themselves still import numpy,
+# netCDF4, f90nml, etc. at the top, so a command pays for its own
+# module's imports; what is saved is importing every other tool, and
+# --help. --serve runs many command lines in one warm interpreter,
+# paying the imports once.
+
+import sys
+import time
+import shlex
+import importlib
+import argparse
+import traceback
+
+# command: (module, summary)
+COMMANDS = {
+    'new-case': ('noahmp_new_case', 'create a Noah-MP case'),
+    'run-case': ('noahmp_run_case', 'run a Noah-MP case'),
+    'check-forcing': ('noahmp_check_forcing', 'check forcing coverage of a case and its spinups'),
+    'stage-forcing': ('noahmp_stage_forcing', 'stage the forcing window of cases to local scratch'),
+    'monitor-case': ('noahmp_monitor_case', 'monitor throughput of a running case'),
+    'merge-tiles': ('noahmp_merge_tiles', 'stitch per-tile outputs into full-domain files'),
+    'run-summary': ('noahmp_run_summary', 'summarize resource usage of runs'),
+    'queue': ('noahmp_queue', 'persistent local queue of case pipelines'),
+    'strip-output': ('noahmp_strip_output', 'strip useless variables from outputs'),
+    'ldasout2cf': ('noahmp_ldasout2cf', 'convert outputs to a CF-compatible file'),
+    'ldasout-dataset': ('noahmp_ldasout_dataset', 'print the time series of a variable at a grid cell'),
+    'rechunk': ('noahmp_rechunk', 'rechunk a CF file into a time series layout'),
+    'regrid': ('noahmp_regrid', 'precompute regridding weights to a lat/lon grid'),
+    'extract-et': ('extract_et', 'extract evapotranspiration and its components'),
+    'extract-runoff': ('extract_runoff', 'extract runoff components'),
+    'extract-tws': ('extract_tws', 'extract terrestrial water storage and its components'),
+    'extract-rad': ('extract_rad', 'extract upward shortwave and longwave radiation'),
+    'extract-budget': ('extract_budget', 'extract ET, runoff and TWS and check the water budget'),
+    'render-quicklook': ('render_quicklook', 'render quicklook PNG maps of CF outputs'),
+    'towrf': ('noahmp_towrf', 'copy land state from a restart file to wrfinput files'),
+    'wrfinput-nc4tonc3sub': ('wrfinput_nc4tonc3sub', 'subset and convert a wrfinput file'),
+    'ungrib-princeton': ('ungrib_princeton', 'convert Princeton forcing to WPS intermediate files'),
+    'rgb2cpt': ('rgb2cpt', 'convert an NCL *.rgb palette to GMT *.cpt'),
+}
+
+def run(argv):
+    '''run one command line [COMMAND, ARGS...] in this interpreter, returning its exit status'''
+    if len(argv) == 0 or argv[0] not in COMMANDS:
+        print('unknown command: ' + (argv[0] if len(argv) > 0 else '') + ' (see noahmp-tools --help)',
+              file=sys.stderr)
+        return 2
+    module = COMMANDS[argv[0]][0]
+    saved = sys.argv
+    sys.argv = [module] + list(argv[1:])
+    try:
+        # imported as itself, not as __main__, so that its functions
+        # pickle for process pools under the spawn start method too
+        status = importlib.import_module(module).cli(list(argv[1:])) or 0
+    except SystemExit as e:
+        if e.code is None or isinstance(e.code, int):
+            status = e.code or 0
+        else:
+            print(e.code, file=sys.stderr)
+            status = 1
+    finally:
+        sys.argv = saved
+        # the profile of this command, not of the whole --serve session
+        if 'noahmp_profile' in sys.modules:
+            sys.modules['noahmp_profile'].finish()
+    return status
+
+def serve(commandfile):
+    '''run the command lines of a file ('-': stdin) one after another; blank
+    lines and lines starting with # are skipped'''
+    f = sys.stdin if commandfile == '-' else open(commandfile, 'r')
+    ncommand, nfailed = 0, 0
+    t0 = time.time()
+    try:
+        for line in f:
+            argv = shlex.split(line, comments=True)
+            if len(argv) == 0:
+                continue
+            t1 = time.time()
+            try:
+                status = run(argv)
+            except Exception:
+                traceback.print_exc()
+                status = 1
+            ncommand += 1
+            nfailed += status != 0
+            print('SERVE: {0:s} -> {1:d} ({2:.3f} s)'.format(' '.join(argv), status, time.time() - t1),
+                  flush=True)
+    finally:
+        if f is not sys.stdin:
+            f.close()
+    print('SERVE: {0:d} commands, {1:d} failed, {2:.3f} s'.format(ncommand, nfailed, time.time() - t0))
+    return 1 if nfailed > 0 else 0
+
+def main(argv=None):
+    epilog = 'commands:\n' + '\n'.join('  {0:<22s}{1:s}'.format(command, summary)
+                                       for command, (_, summary) in COMMANDS.items())
+    parser = argparse.ArgumentParser(prog='noahmp-tools', description='Noah-MP case and output tools',
+                                     epilog=epilog, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--serve', type=str, default=None, metavar='FILE',
+                        help="run the command lines of FILE ('-': stdin) in this interpreter")
+    parser.add_argument('command', nargs='?', choices=list(COMMANDS), metavar='COMMAND',
+                        help='command to run')
+    parser.add_argument('args', nargs=argparse.REMAINDER,
+                        help='arguments of the command (see noahmp-tools COMMAND --help)')
+    args = parser.parse_args(argv)
+    if args.serve is not None:
+        if args.command is not None:
+            parser.error('--serve takes its commands from FILE')
+        return serve(args.serve)
+    if args.command is None:
+        parser.print_help()
+        return 2
+    return run([args.command] + args.args)
+
+if __name__ == '__main__':
+    sys.exit(main())
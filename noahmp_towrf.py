@@ -6,8 +6,17 @@
 
 from __future__ import absolute_import, unicode_literals, division
 
+import os
+import hashlib
+import tempfile
+import concurrent.futures
 import numpy as np
 import netCDF4 as nc
+import noahmp_profile
+try:
+    from scipy.spatial import cKDTree
+except ImportError:
+    cKDTree = None
 
 nmp2wrf_3d = {'SOIL_T':'TSLB',
               'SNOW_T':'TSNO',
@@ -47,36 +56,160 @@ nmp2wrf_2d = {'QSNOW':'QSNOWXY',
               'RIVERCONDXY':'RIVERCOND',
               'PEXPXY':'PEXP'}
 ABSMAX = 1.0e20
+REFVAR = 'SMC'                  # its top layer tells valid (land) source cells
+CHUNK = 2**24                   # distances computed at once without scipy
+
+def fallback(vi, vo):
+    '''vi, or vo where vi is missing (NaN or beyond ABSMAX)'''
+    with np.errstate(invalid='ignore'):
+        mask = np.logical_or(abs(vi) >= ABSMAX, np.isnan(vi))
+    return np.where(mask, vo, vi)
 
 def main(nmpfile, wrffile):
     with nc.Dataset(nmpfile, 'r') as fi, \
          nc.Dataset(wrffile, 'r+') as fo:
         for varnamei, varnameo in nmp2wrf_2d.items():
             print(varnamei, varnameo)
-            vi = fi.variables[varnamei][:]
-            vo = fo.variables[varnameo][:]
-            with np.errstate(invalid='ignore'):
-                mask = np.logical_or(abs(vi) >= ABSMAX, np.isnan(vi))
-            v = np.where(mask, vo, vi)
-            fo.variables[varnameo][:] = v[:]
+            with noahmp_profile.stage('read'):
+                vi = fi.variables[varnamei][:]
+                vo = fo.variables[varnameo][:]
+            noahmp_profile.count('read', varnamei, vi)
+            v = fallback(vi, vo)
+            with noahmp_profile.stage('write'):
+                fo.variables[varnameo][:] = v[:]
+            noahmp_profile.count('written', varnameo, v)
         for varnamei, varnameo in nmp2wrf_3d.items():
             print(varnamei, varnameo)
-            vi = fi.variables[varnamei][:]
+            with noahmp_profile.stage('read'):
+                vi = fi.variables[varnamei][:]
+                vo = fo.variables[varnameo][:]
+            noahmp_profile.count('read', varnamei, vi)
             vi = np.swapaxes(vi, 1, 2)
+            v = fallback(vi, vo)
+            with noahmp_profile.stage('write'):
+                fo.variables[varnameo][:] = v[:]
+            noahmp_profile.count('written', varnameo, v)
+        fo.variables['FNDSNOWH'][:] = 1
+    return
+
+def read_grid(filename):
+    '''(XLAT, XLONG) of a wrfinput/geo_em file'''
+    with nc.Dataset(filename, 'r') as f:
+        lat = f.variables['XLAT' if 'XLAT' in f.variables else 'XLAT_M'][:]
+        lon = f.variables['XLONG' if 'XLONG' in f.variables else 'XLONG_M'][:]
+    return np.squeeze(np.ma.filled(lat, np.nan)).astype('f8'), np.squeeze(np.ma.filled(lon, np.nan)).astype('f8')
+
+def xyz(lat, lon):
+    '''points on the unit sphere'''
+    lat, lon = np.deg2rad(lat.ravel()), np.deg2rad(lon.ravel())
+    return np.stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)], axis=1)
+
+def nearest(src, dst):
+    '''index of the nearest src point of every dst point'''
+    if cKDTree is not None:
+        return cKDTree(src).query(dst)[1]
+    index = np.empty(len(dst), dtype='i8')
+    step = max(CHUNK // max(len(src), 1), 1)
+    for i0 in range(0, len(dst), step):
+        d = dst[i0:i0+step]
+        index[i0:i0+step] = np.argmax(d @ src.T, axis=1)   # largest cosine
+    return index
+
+def remap_index(srcgrid, valid, wrffile, cachedir=None):
+    '''(target, source) flat indices filling the land cells of wrffile from
+    their nearest valid Noah-MP cells, cached by a hash of both grids'''
+    lat, lon = read_grid(wrffile)
+    with nc.Dataset(wrffile, 'r') as f:
+        land = np.squeeze(np.ma.filled(f.variables['LANDMASK'][:], 0)) > 0.5 if 'LANDMASK' in f.variables \
+            else np.ones(lat.shape, dtype=bool)
+    key = hashlib.sha1()
+    for x in (srcgrid[0], srcgrid[1], valid, lat, lon, land):
+        key.update(np.ascontiguousarray(x).tobytes())
+    cachedir = cachedir or os.path.dirname(os.path.abspath(wrffile))
+    filename = os.path.join(cachedir, 'towrf-' + key.hexdigest()[0:16] + '.npz')
+    if os.path.isfile(filename):
+        with np.load(filename) as f:
+            return f['target'], f['source']
+    print('computing nearest valid neighbours -> ' + filename, flush=True)
+    candidates = np.flatnonzero(valid.ravel())
+    target = np.flatnonzero(land.ravel())
+    source = candidates[nearest(xyz(srcgrid[0], srcgrid[1])[candidates],
+                                xyz(lat, lon)[target])]
+    fd, tmpname = tempfile.mkstemp(suffix='.npz', dir=cachedir)
+    with os.fdopen(fd, 'wb') as f:
+        np.savez(f, target=target, source=source)
+    os.replace(tmpname, filename)
+    return target, source
+
+def read_source(nmpfile):
+    '''the transferred Noah-MP variables, in the WRF dimension order'''
+    values = {}
+    with nc.Dataset(nmpfile, 'r') as fi:
+        for varnamei in nmp2wrf_2d:
+            values[varnamei] = fi.variables[varnamei][:]
+        for varnamei in nmp2wrf_3d:
+            values[varnamei] = np.swapaxes(fi.variables[varnamei][:], 1, 2)
+    return values
+
+def transfer(wrffile, values, index=None):
+    '''write values to wrffile, remapped through index=(target, source) if given'''
+    with nc.Dataset(wrffile, 'r+') as fo:
+        for varnamei, varnameo in list(nmp2wrf_2d.items()) + list(nmp2wrf_3d.items()):
+            vi = values[varnamei]
             vo = fo.variables[varnameo][:]
-            with np.errstate(invalid='ignore'):
-                mask = np.logical_or(abs(vi) >= ABSMAX, np.isnan(vi))
-            v = np.where(mask, vo, vi)
-            fo.variables[varnameo][:] = v[:]
+            if index is not None:
+                v = np.full(vo.shape, np.nan)
+                v.reshape(vo.shape[:-2] + (-1,))[..., index[0]] = \
+                    np.ma.filled(np.ma.asarray(vi, dtype='f8'), np.nan).reshape(vi.shape[:-2] + (-1,))[..., index[1]]
+                vi = v
+            fo.variables[varnameo][:] = fallback(vi, vo)
         fo.variables['FNDSNOWH'][:] = 1
+    return wrffile
+
+def main_batch(nmpfile, wrffiles, nmpgrid=None, cachedir=None, nproc=None):
+    '''transfer one Noah-MP state to many wrfinput files, on other grids if nmpgrid is given'''
+    with noahmp_profile.stage('read'):
+        values = read_source(nmpfile)
+    noahmp_profile.count('read', nmpfile, values)
+    index = {}
+    if nmpgrid is not None:
+        srcgrid = read_grid(nmpgrid)
+        with np.errstate(invalid='ignore'):
+            ref = np.ma.filled(np.ma.asarray(values[REFVAR], dtype='f8'), np.nan)[0, 0]
+            valid = np.isfinite(ref) & (abs(ref) < ABSMAX)
+        for wrffile in wrffiles:
+            with noahmp_profile.stage('remap_index'):
+                index[wrffile] = remap_index(srcgrid, valid, wrffile, cachedir)
+    with noahmp_profile.stage('transfer'), \
+         concurrent.futures.ProcessPoolExecutor(max_workers=nproc) as pool:
+        futures = [pool.submit(transfer, wrffile, values, index.get(wrffile))
+                   for wrffile in wrffiles]
+        for future in futures:
+            print(future.result(), flush=True)
     return
 
 import argparse
-if __name__ == '__main__':
+def cli(argv=None):
+    '''command line; argv defaults to sys.argv[1:]'''
     parser = argparse.ArgumentParser(description='Copy land state from Noah-MP output to WRF.')
     parser.add_argument('nmpfile', type=str,
                         help='Noah-MP Restart file')
-    parser.add_argument('wrffile', type=str,
-                        help='WRF input file')
-    args = parser.parse_args()
-    main(args.nmpfile, args.wrffile)
+    parser.add_argument('wrffile', type=str, nargs='+',
+                        help='WRF input file(s)')
+    parser.add_argument('-g', '--nmp-grid', type=str, default=None,
+                        help='wrfinput/geo_em file of the Noah-MP grid; remaps to each WRF grid by nearest valid neighbour')
+    parser.add_argument('--cache-dir', type=str, default=None,
+                        help='directory of cached remap indices (default: directory of each WRF input file)')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='number of WRF input files written in parallel (default: number of CPUs)')
+    noahmp_profile.add_arguments(parser)
+    args = parser.parse_args(argv)
+    noahmp_profile.setup(args)
+    if len(args.wrffile) == 1 and args.nmp_grid is None:
+        main(args.nmpfile, args.wrffile[0])
+    else:
+        main_batch(args.nmpfile, args.wrffile, args.nmp_grid, args.cache_dir, args.jobs)
+    return
+
+if __name__ == '__main__':
+    cli()
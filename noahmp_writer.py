@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# compressed writes of an output file in a background process
+
+import os
+import time
+import queue
+import contextlib
+import multiprocessing
+import netCDF4 as nc
+import noahmp_profile
+
+def serve(partfile, pending, maskandscale, result=None):
+    '''writer process: apply (var, index, value) writes until None, then
+    send the profiled stages to result'''
+    noahmp_profile.reset()
+    with nc.Dataset(partfile, 'a') as fo:
+        fo.set_auto_maskandscale(maskandscale)
+        while True:
+            item = pending.get()
+            if item is None:
+                break
+            var, index, value = item
+            with noahmp_profile.stage('write.' + var):
+                fo.variables[var][index] = value
+        with noahmp_profile.stage('write.flush'):
+            fo.sync()
+    if result is not None:
+        result.send(noahmp_profile.collect())
+        result.close()
+    return
+
+class Writer(object):
+    '''write an output file through a background process
+
+    The file is built as outfile + '.part' and renamed to outfile only
+    after every write succeeded; on any failure the part file is removed.
+
+        writer = Writer(outfile, depth=8)
+        with writer.define() as fo:
+            ...                         # dimensions, variables, attributes
+        with writer:
+            writer.write(var, index, value)
+
+    At most `depth` writes are pending; write() blocks beyond that
+    (backpressure). depth 0 writes in the foreground.
+    '''
+    def __init__(self, outfile, depth=8, maskandscale=True):
+        self.outfile = outfile
+        self.partfile = outfile + '.part'
+        self.depth = depth
+        self.maskandscale = maskandscale
+        self.process = None
+        self.pending = None
+        self.result = None      # stages profiled in the writer process
+        self.fo = None
+        self.nwrite = 0
+        self.waittime = 0.0     # seconds write() and close() were blocked
+
+    @contextlib.contextmanager
+    def define(self, **kwargs):
+        '''the part file, open in this process for defining its contents'''
+        try:
+            with nc.Dataset(self.partfile, 'w', **kwargs) as fo:
+                yield fo
+        except BaseException:
+            self.abort()
+            raise
+
+    def start(self):
+        if self.depth <= 0:
+            self.fo = nc.Dataset(self.partfile, 'a')
+            self.fo.set_auto_maskandscale(self.maskandscale)
+            return
+        self.pending = multiprocessing.Queue(maxsize=self.depth)
+        sender = None
+        if noahmp_profile.enabled():
+            self.result, sender = multiprocessing.Pipe(duplex=False)
+        self.process = multiprocessing.Process(target=serve,
+                                               args=(self.partfile, self.pending,
+                                                     self.maskandscale, sender))
+        self.process.start()
+        if sender is not None:
+            sender.close()
+        return
+
+    def write(self, var, index, value):
+        if self.fo is None and self.process is None:
+            self.start()
+        self.nwrite += 1
+        noahmp_profile.count('written', var, value)
+        start = time.time()
+        if self.fo is not None:
+            with noahmp_profile.stage('write.' + var):
+                self.fo.variables[var][index] = value
+        else:
+            self.put((var, index, value))
+        self.waittime += time.time() - start
+        return
+
+    def put(self, item):
+        while True:
+            try:
+                self.pending.put(item, timeout=1.0)
+                return
+            except queue.Full:
+                if not self.process.is_alive():
+                    raise IOError('writer process of ' + self.outfile + ' died')
+
+    def close(self):
+        '''flush all pending writes and move the part file into place'''
+        if self.fo is None and self.process is None:
+            self.start()
+        start = time.time()
+        if self.fo is not None:
+            with noahmp_profile.stage('write.flush'):
+                self.fo.close()
+            self.fo = None
+        else:
+            self.put(None)
+            if self.result is not None:
+                try:
+                    noahmp_profile.merge(self.result.recv())
+                except EOFError:
+                    pass
+                self.result.close()
+                self.result = None
+            self.process.join()
+            if self.process.exitcode != 0:
+                # drops the writes the dead process left in the queue
+                self.abort()
+                raise IOError('writer process of ' + self.outfile + ' failed')
+            self.pending.close()
+            self.process = None
+            # foreground writes are already timed per variable
+            noahmp_profile.add('write.blocked', self.waittime + time.time() - start, self.nwrite)
+        self.waittime += time.time() - start
+        os.replace(self.partfile, self.outfile)
+        return
+
+    def abort(self):
+        '''drop pending writes and remove the part file'''
+        if self.fo is not None:
+            self.fo.close()
+            self.fo = None
+        if self.process is not None:
+            self.process.terminate()
+            self.process.join()
+            self.pending.cancel_join_thread()
+            self.pending.close()
+            self.process = None
+        if os.path.exists(self.partfile):
+            os.remove(self.partfile)
+        return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return
+
+    def report(self):
+        print('WRITER: {0:d} writes, {1:.2f} s blocked (queue depth {2:d})'.format(
+            self.nwrite, self.waittime, self.depth), flush=True)
+        return
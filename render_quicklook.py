@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# quicklook PNG maps of CF outputs (e.g. et.*.nc, tws.*.nc) with NCL *.rgb
+# palettes, one image per time step
+
+import os
+import time
+import zlib
+import struct
+import argparse
+import concurrent.futures
+import numpy as np
+import netCDF4 as nc
+from noahmp_prefetch import dataset, close_datasets
+import noahmp_profile
+from rgb2cpt import readrgb, rgbcolormap
+
+MISSING = (255, 255, 255)       # colour of NaN/masked cells
+ABSMAX = 1.0e20                 # larger values are missing
+
+def palette(rgbfile):
+    '''(ncolors, 3) uint8 colours of an NCL *.rgb palette (0-1 or 0-255 values)'''
+    if not rgbfile.endswith('.rgb'):
+        rgbfile = rgbfile + '.rgb'
+    colors = np.array(rgbcolormap(readrgb(rgbfile))).T
+    if colors.max() <= 1.0:
+        colors = colors * 255
+    return np.clip(np.round(colors), 0, 255).astype('u1')
+
+def lookup(colors, vmin, vmax):
+    '''(lut, bounds): len(colors) equal bins over [vmin, vmax] and the missing colour last'''
+    bounds = np.linspace(vmin, vmax, len(colors) + 1)[1:-1]
+    lut = np.concatenate([colors, np.array([MISSING], dtype='u1')])
+    return lut, bounds
+
+def colorize(v, lut, bounds):
+    '''(ny, nx, 3) uint8 image of v, north up'''
+    index = np.digitize(v, bounds)
+    index[~np.isfinite(v)] = len(lut) - 1
+    return lut.take(index, axis=0)
+
+def write_png(filename, image):
+    '''8-bit RGB PNG of an (ny, nx, 3) uint8 array'''
+    def chunk(tag, data):
+        return struct.pack('>I', len(data)) + tag + data \
+            + struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff)
+    ny, nx = image.shape[0:2]
+    raw = np.zeros((ny, 1 + 3 * nx), dtype='u1')        # filter type 0 per row
+    raw[:, 1:] = image.reshape(ny, 3 * nx)
+    tmpname = filename + '.part'
+    with open(tmpname, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n')
+        f.write(chunk(b'IHDR', struct.pack('>IIBBBBB', nx, ny, 8, 2, 0, 0, 0)))
+        f.write(chunk(b'IDAT', zlib.compress(raw.tobytes(), 6)))
+        f.write(chunk(b'IEND', b''))
+    os.replace(tmpname, filename)
+    return
+
+def read_frame(infile, var, itim):
+    '''values of one time step, north up, NaN where missing'''
+    fi = dataset(infile)
+    v = np.ma.filled(np.ma.asarray(fi.variables[var][itim, ...], dtype='f8'), np.nan)
+    with np.errstate(invalid='ignore'):
+        v[abs(v) >= ABSMAX] = np.nan
+    y = ycoord(fi, fi.variables[var])
+    if y is not None and y[0] < y[-1]:
+        v = v[::-1, :]
+    return v
+
+def ycoord(fi, var):
+    '''values of the Y coordinate of var: the coordinate variable with
+    axis='Y' or standard_name='latitude', else that of the second-to-last
+    dimension (None if it has none)'''
+    coords = [fi.variables[x] for x in var.dimensions if x in fi.variables]
+    for coord in coords:
+        if getattr(coord, 'axis', '') == 'Y' or getattr(coord, 'standard_name', '') == 'latitude':
+            return coord[:]
+    if var.dimensions[-2] in fi.variables:
+        return fi.variables[var.dimensions[-2]][:]
+    return None
+
+def frame_range(item):
+    '''(min, max) of one time step (NaN when all missing)'''
+    infile, var, itim = item
+    v = read_frame(infile, var, itim)
+    if not np.any(np.isfinite(v)):
+        return np.nan, np.nan
+    return np.nanmin(v), np.nanmax(v)
+
+def render(task):
+    '''write the PNG of one time step'''
+    (infile, var, itim), outfile, lut, bounds, zoom = task
+    image = colorize(read_frame(infile, var, itim), lut, bounds)
+    if zoom > 1:
+        image = np.repeat(np.repeat(image, zoom, axis=0), zoom, axis=1)
+    write_png(outfile, image)
+    return outfile
+
+def frames(infiles, var, outdir):
+    '''[((infile, var, itim), outfile)] of all time steps'''
+    items = []
+    for infile in infiles:
+        with nc.Dataset(infile, 'r') as fi:
+            tim = fi.variables['time']
+            dates = nc.num2date(tim[:], tim.units, only_use_cftime_datetimes=False)
+        for itim, date in enumerate(dates):
+            outfile = os.path.join(outdir, '{0:s}.{1:s}.png'.format(var, date.strftime('%Y%m%d%H%M')))
+            items.append(((infile, var, itim), outfile))
+    return items
+
+def main(infiles, var, rgbfile, outdir, vrange=None, zoom=1, nproc=None, overwrite=False):
+    colors = palette(rgbfile)
+    with noahmp_profile.stage('frames'):
+        items = frames(infiles, var, outdir)
+    os.makedirs(outdir, exist_ok=True)
+    t0 = time.time()
+    with concurrent.futures.ProcessPoolExecutor(max_workers=nproc, initializer=close_datasets) as pool:
+        chunksize = max(len(items) // (4 * (nproc or os.cpu_count() or 1)), 1)
+        if vrange is None:
+            with noahmp_profile.stage('range'):
+                ranges = np.array(list(pool.map(frame_range, [item for item, _ in items],
+                                                chunksize=chunksize)))
+            if not np.any(np.isfinite(ranges)):
+                print('no valid values of ' + var)
+                return
+            vrange = np.nanmin(ranges[:, 0]), np.nanmax(ranges[:, 1])
+            print('range of {0:s}: {1:g} {2:g}'.format(var, vrange[0], vrange[1]), flush=True)
+        lut, bounds = lookup(colors, vrange[0], vrange[1])
+        tasks = [(item, outfile, lut, bounds, zoom) for item, outfile in items
+                 if overwrite or not os.path.isfile(outfile)]
+        with noahmp_profile.stage('render'):
+            for outfile in pool.map(render, tasks, chunksize=chunksize):
+                pass
+    elapsed = time.time() - t0
+    print('QUICKLOOK: {0:d} frames in {1:.1f} s ({2:.0f} frames/min), {3:d} existing skipped'.format(
+        len(tasks), elapsed, 60 * len(tasks) / max(elapsed, 1e-9), len(items) - len(tasks)))
+    return
+
+def cli(argv=None):
+    '''command line; argv defaults to sys.argv[1:]'''
+    parser = argparse.ArgumentParser(description='render quicklook PNG maps of a variable of CF outputs with an NCL *.rgb palette')
+    parser.add_argument('infiles', type=str, nargs='+',
+                        help='CF files (e.g. tws.*.nc)')
+    parser.add_argument('-v', '--variable', type=str, required=True,
+                        help='variable to render (time, y, x); flipped north up by its Y coordinate')
+    parser.add_argument('-p', '--palette', type=str, required=True,
+                        help='NCL *.rgb palette file (rgb extension is optional)')
+    parser.add_argument('-o', '--outdir', type=str, default='.',
+                        help='output directory of VAR.YYYYMMDDHHMM.png (default: .)')
+    parser.add_argument('-r', '--range', type=float, nargs=2, metavar=('VMIN', 'VMAX'), default=None,
+                        help='value range of the palette (default: min/max over all frames)')
+    parser.add_argument('-z', '--zoom', type=int, default=1,
+                        help='pixels per grid cell (default: 1)')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='number of rendering processes (default: number of CPUs)')
+    parser.add_argument('--overwrite', action='store_true',
+                        help='render frames whose PNG already exists')
+    noahmp_profile.add_arguments(parser)
+    args = parser.parse_args(argv)
+    noahmp_profile.setup(args)
+    main(args.infiles, args.variable, args.palette, args.outdir, args.range,
+         args.zoom, args.jobs, args.overwrite)
+    return
+
+if __name__ == '__main__':
+    cli()
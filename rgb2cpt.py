@@ -53,7 +53,7 @@ def writecpt(cptfile, name, reds, greens, blues):
     pass
 
 
-def main ():
+def main (argv=None):
     usage = "\n%(prog)s: Converts NCL *.rgb color palette file to *.cpt format used by GMT.\n\n\
     This program will convert between an RGB colormap stored in a *.rgb file \n \
     used by NCL/PyNGL into an Color Palatte Tables(CPT). \n"
@@ -70,7 +70,7 @@ def main ():
                         action='store_false', dest='verbose',
                         help='Cancel verbose model')
     parser.add_argument('--version', action='version', version='%(prog)s 1.0')
-    options = parser.parse_args();
+    options = parser.parse_args(argv);
 
     rgbfilename = options.rgbfilename[0]
     if not rgbfilename.endswith('.rgb'):
@@ -102,5 +102,10 @@ def main ():
     pass
 
 
+def cli(argv=None):
+    '''command line; argv defaults to sys.argv[1:]'''
+    main(argv)
+    return
+
 if __name__ == "__main__":
-    main()
+    cli()
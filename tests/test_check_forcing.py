@@ -0,0 +1,38 @@
+import datetime
+import noahmp_check_forcing
+
+HOUR = datetime.timedelta(hours=1)
+T0 = datetime.datetime(2000, 1, 1)
+
+def test_forcing_times_skips_other_names():
+    times = noahmp_check_forcing.forcing_times({'2000010100.LDASIN_DOMAIN1': 10,
+                                                '2000010101.LDASIN_DOMAIN1': 0,
+                                                'README.LDASIN_DOMAIN1': 5})
+    assert times == {T0: 10, T0 + HOUR: 0}
+
+def test_window_includes_both_ends():
+    times = noahmp_check_forcing.window_times(T0, T0 + 3 * HOUR, HOUR)
+    assert times == [T0, T0 + HOUR, T0 + 2 * HOUR, T0 + 3 * HOUR]
+
+def test_gaps_merge_missing_and_empty_files():
+    times = {T0 + i * HOUR: 1 for i in range(7)}
+    del times[T0 + 1 * HOUR]
+    times[T0 + 2 * HOUR] = 0
+    del times[T0 + 5 * HOUR]
+    missing = noahmp_check_forcing.gaps(times, T0, T0 + 6 * HOUR, HOUR)
+    assert missing == [(T0 + HOUR, T0 + 2 * HOUR, 2), (T0 + 5 * HOUR, T0 + 5 * HOUR, 1)]
+
+def test_gaps_at_window_end():
+    times = {T0 + i * HOUR: 1 for i in range(6)}
+    assert noahmp_check_forcing.gaps(times, T0, T0 + 5 * HOUR, HOUR) == []
+    assert noahmp_check_forcing.gaps(times, T0, T0 + 6 * HOUR, HOUR) == [(T0 + 6 * HOUR, T0 + 6 * HOUR, 1)]
+
+def test_forcing_index_leaves_forcing_directory_alone(tmp_path, monkeypatch):
+    monkeypatch.setattr(noahmp_check_forcing, 'CACHEDIR', str(tmp_path / 'cache'))
+    indir = tmp_path / 'forcing'
+    indir.mkdir()
+    (indir / '2000010100.LDASIN_DOMAIN1').write_bytes(b'xx')
+    assert noahmp_check_forcing.forcing_index(str(indir)) == {'2000010100.LDASIN_DOMAIN1': 2}
+    (indir / '2000010100.LDASIN_DOMAIN1').write_bytes(b'xxxx')   # filled in later
+    assert noahmp_check_forcing.forcing_index(str(indir)) == {'2000010100.LDASIN_DOMAIN1': 4}
+    assert sorted(x.name for x in indir.iterdir()) == ['2000010100.LDASIN_DOMAIN1']
@@ -0,0 +1,47 @@
+import datetime
+import numpy as np
+import extract_budget
+
+HOUR = datetime.timedelta(hours=1)
+T0 = datetime.datetime(2000, 1, 1)
+
+def storages(tws):
+    tws = np.asarray(tws, dtype='f8')
+    return {'TWS': tws, 'SMC': 0.5 * tws, 'SNW': np.zeros_like(tws), 'GW': 0.5 * tws}
+
+def budget():
+    b = extract_budget.Budget()
+    b.units = 'hours since 2000-01-01 00:00:00'
+    return b
+
+def test_closed_budget_has_no_residual():
+    b = budget()
+    prcp, et, runoff = np.array([2e-4, 1e-4]), np.array([5e-5, 0.0]), np.array([5e-5, 1e-4])
+    tws = np.array([100.0, 50.0])
+    b.add(T0, prcp, et, runoff, storages(tws))
+    for step in range(1, 4):
+        tws = tws + (prcp - et - runoff) * 3600.0
+        b.add(T0 + step * HOUR, prcp, et, runoff, storages(tws))
+    assert b.nstep() == 3
+    assert np.allclose(b.sums['RESIDUAL'], 0.0)
+    assert np.allclose(b.sums['PRCP'], prcp * 3 * 3600.0)
+    assert np.isclose(b.total('TWS'), np.mean((prcp - et - runoff) * 3 * 3600.0))
+    assert np.allclose(b.means, 0.0)
+
+def test_residual_of_a_leaking_cell():
+    b = budget()
+    b.add(T0, 0.0, 0.0, 0.0, storages([10.0, 10.0]))
+    b.add(T0 + HOUR, np.array([1e-3, 1e-3]), 0.0, 0.0, storages([13.6, 12.6]))
+    # 3.6 kg m-2 of precipitation, storage rose by 3.6 and 2.6
+    assert np.allclose(b.sums['RESIDUAL'], [0.0, 1.0])
+    assert np.allclose(b.maxabs, [0.0, 1.0])
+    assert np.isclose(b.means[0], 0.5)
+
+def test_masked_cells_are_left_out_of_means():
+    b = budget()
+    b.add(T0, 0.0, 0.0, 0.0, storages([1.0, 1.0]))
+    tws = np.ma.masked_array([2.0, 0.0], mask=[False, True])
+    b.add(T0 + HOUR, 0.0, 0.0, 0.0, {'TWS': tws, 'SMC': tws, 'SNW': tws, 'GW': tws})
+    assert np.isnan(b.sums['RESIDUAL'][1])
+    assert np.isclose(b.means[0], -1.0)
+    assert np.isclose(b.total('RESIDUAL'), -1.0)
@@ -0,0 +1,20 @@
+import numpy as np
+import noahmp_ldasout2cf
+
+def test_acc2flx_differences():
+    accs = np.array([[0.0, 10.0], [3.6, 10.0], [10.8, 17.2]])
+    flx = noahmp_ldasout2cf.acc2flx(accs, 3600.0)
+    assert flx.shape == (2, 2)
+    assert np.allclose(flx, [[0.001, 0.0], [0.002, 0.002]])
+
+def test_acc2flx_reset_is_accumulation_since_reset():
+    # the first cell is reset (restart) in the second step, the second is not
+    accs = np.array([[100.0, 1.0], [7.2, 4.6], [14.4, 8.2]])
+    flx = noahmp_ldasout2cf.acc2flx(accs, 3600.0)
+    assert np.allclose(flx, [[0.002, 0.001], [0.002, 0.001]])
+    assert np.all(flx >= 0)
+
+def test_acc2flx_keeps_input():
+    accs = np.array([[5.0], [1.0]])
+    noahmp_ldasout2cf.acc2flx(accs, 1.0)
+    assert np.array_equal(accs, [[5.0], [1.0]])
@@ -0,0 +1,44 @@
+import noahmp_new_case
+
+TEMPLATE = '''&NOAHLSM_OFFLINE
+ OUTDIR = './'
+! RESTART_HIGH = .false.
+/
+'''
+
+def test_logical_override_is_unquoted():
+    overrides = {'RESTART_HIGH': noahmp_new_case.namelist_value('.true.'),
+                 'SPLIT_OUTPUT_COUNT': noahmp_new_case.namelist_value('T')}
+    nml = TEMPLATE
+    for name, value in overrides.items():
+        nml = noahmp_new_case.set_namelist_option(nml, name, value)
+    assert ' RESTART_HIGH = .true.\n' in nml
+    assert ' SPLIT_OUTPUT_COUNT = .true.\n' in nml
+    assert "'" not in nml.replace("'./'", '')
+
+def test_namelist_value():
+    assert noahmp_new_case.namelist_value('.FALSE.') is False
+    assert noahmp_new_case.namelist_value('f') is False
+    assert noahmp_new_case.namelist_value('3') == 3
+    assert noahmp_new_case.namelist_value('1.5') == 1.5
+    assert noahmp_new_case.namelist_value("'restart'") == 'restart'
+
+def test_option_name_is_literal():
+    nml = ' SOIL_THICK_INPUT(1) = 0.10\n SOIL_THICK_INPUTX1 = 3\n/\n'
+    nml = noahmp_new_case.set_namelist_option(nml, 'SOIL_THICK_INPUT(1)', 0.05)
+    assert ' SOIL_THICK_INPUT(1) = 0.05\n' in nml
+    assert ' SOIL_THICK_INPUTX1 = 3\n' in nml
+
+def test_tile_windows_cover_rows_once():
+    for ny, ntiles in ((10, 3), (7, 7), (100, 8), (5, 1)):
+        windows = noahmp_new_case.tile_windows(12, ny, ntiles)
+        assert len(windows) == ntiles
+        rows = [j for xs, xe, ys, ye in windows for j in range(ys, ye + 1)]
+        assert rows == list(range(1, ny + 1))
+        assert all((xs, xe) == (1, 12) for xs, xe, _, _ in windows)
+        sizes = [ye - ys + 1 for _, _, ys, ye in windows]
+        assert max(sizes) - min(sizes) <= 1
+
+def test_tile_windows_at_most_one_row_each():
+    windows = noahmp_new_case.tile_windows(4, 3, 8)
+    assert windows == [(1, 4, 1, 1), (1, 4, 2, 2), (1, 4, 3, 3)]
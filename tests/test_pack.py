@@ -0,0 +1,50 @@
+import numpy as np
+import netCDF4 as nc
+import noahmp_pack
+
+def round_trip(tmp_path, packer, var, values):
+    '''values written packed and read back as a reader sees them'''
+    filename = str(tmp_path / 'packed.nc')
+    with nc.Dataset(filename, 'w') as fo:
+        fo.createDimension('x', len(values))
+        vo = packer.create_variable(fo, var, ('x',))
+        vo.set_auto_maskandscale(False)
+        vo[:] = packer.pack(var, values)
+    with nc.Dataset(filename, 'r') as fi:
+        return np.ma.filled(np.ma.asarray(fi.variables[var][:], dtype='f8'), np.nan)
+
+def test_round_trip_within_half_precision(tmp_path):
+    values = np.array([3000.0, 3000.004, 3123.456, np.nan, 3200.0])
+    packer = noahmp_pack.Packer(noahmp_pack.parse_spec([]), ['TWS'])
+    packer.scan('TWS', values)
+    back = round_trip(tmp_path, packer, 'TWS', values)
+    scale = packer.parameters('TWS')[0]
+    assert scale == np.float32(0.01)
+    assert np.isnan(back[3])
+    ok = np.isfinite(values)
+    assert np.all(np.abs(back[ok] - values[ok]) <= scale / 2 + 1e-9)
+
+def test_wide_range_widens_precision(tmp_path):
+    values = np.array([0.0, 5000.0, 10000.0])
+    packer = noahmp_pack.Packer(noahmp_pack.parse_spec(['TWS=0.01']), ['TWS'])
+    packer.scan('TWS', values)
+    back = round_trip(tmp_path, packer, 'TWS', values)
+    scale = packer.parameters('TWS')[0]
+    assert scale > 0.01
+    assert np.all(np.abs(back - values) <= scale / 2 + 1e-6)
+
+def test_values_outside_bounds_are_clipped(tmp_path):
+    values = np.array([-0.5, 0.25, 1.5])
+    packer = noahmp_pack.Packer(noahmp_pack.parse_spec(['SOIL_M=2e-5:0:1']), ['SOIL_M'])
+    assert not packer.needs_scan()
+    back = round_trip(tmp_path, packer, 'SOIL_M', values)
+    scale, offset = packer.parameters('SOIL_M')
+    assert packer.clipped == {'SOIL_M': 2}
+    lo, hi = offset - noahmp_pack.NPACK * scale, offset + noahmp_pack.NPACK * scale
+    assert lo < 0.0 and hi > 1.0
+    assert np.allclose(back, [lo, 0.25, hi], atol=scale)
+
+def test_unlisted_variables_stay_float(tmp_path):
+    packer = noahmp_pack.Packer(None, ['TWS'])
+    back = round_trip(tmp_path, packer, 'TWS', np.array([1.5, np.nan]))
+    assert back[0] == 1.5 and np.isnan(back[1])
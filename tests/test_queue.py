@@ -0,0 +1,65 @@
+import os
+import noahmp_queue
+
+def case_state(db, caseroot):
+    con = noahmp_queue.connect(db)
+    row = con.execute('SELECT stage, status FROM cases WHERE caseroot = ?', (caseroot,)).fetchone()
+    con.close()
+    return row
+
+def stage_runs(db, caseroot):
+    con = noahmp_queue.connect(db)
+    rows = con.execute('SELECT stage, status FROM stages WHERE caseroot = ? ORDER BY rowid',
+                       (caseroot,)).fetchall()
+    con.close()
+    return rows
+
+def fake_call(failing):
+    '''subprocess.call recording the tools run, failing those in `failing`'''
+    calls = []
+    def call(cmd, **kwargs):
+        name = os.path.basename(cmd[1])
+        calls.append(name)
+        return 1 if name in failing else 0
+    return call, calls
+
+def test_existing_case_starts_at_run_case(tmp_path, monkeypatch):
+    db, caseroot = str(tmp_path / 'q.sqlite'), str(tmp_path / 'case')
+    noahmp_queue.add(db, caseroot, {})
+    assert case_state(db, caseroot) == ('run_case', 'pending')
+    call, calls = fake_call(set())
+    monkeypatch.setattr(noahmp_queue.subprocess, 'call', call)
+    assert noahmp_queue.process_case(db, caseroot)
+    assert calls == ['noahmp_run_case.py']
+    assert case_state(db, caseroot) == ('extract', 'done')
+    assert stage_runs(db, caseroot) == [('run_case', 'done')]
+
+def test_failed_stage_is_retried_from_where_it_failed(tmp_path, monkeypatch):
+    db, caseroot = str(tmp_path / 'q.sqlite'), str(tmp_path / 'case')
+    noahmp_queue.add(db, caseroot, {'strip': True})
+    call, calls = fake_call({'noahmp_strip_output.py'})
+    monkeypatch.setattr(noahmp_queue.subprocess, 'call', call)
+    noahmp_queue.run(db)
+    assert case_state(db, caseroot) == ('strip', 'failed')
+    noahmp_queue.run(db)        # failed cases wait for --retry
+    assert calls == ['noahmp_run_case.py', 'noahmp_strip_output.py']
+    call, calls = fake_call(set())
+    monkeypatch.setattr(noahmp_queue.subprocess, 'call', call)
+    noahmp_queue.run(db, retry=True)
+    assert calls == ['noahmp_strip_output.py']
+    assert case_state(db, caseroot) == ('extract', 'done')
+    assert stage_runs(db, caseroot) == [('run_case', 'done'), ('strip', 'failed'), ('strip', 'done')]
+
+def test_interrupted_case_is_picked_up(tmp_path, monkeypatch):
+    db, caseroot = str(tmp_path / 'q.sqlite'), str(tmp_path / 'case')
+    noahmp_queue.add(db, caseroot, {'strip': True})
+    noahmp_queue.reset(db, caseroot, 'strip')
+    with noahmp_queue.connect(db) as con:
+        con.execute("UPDATE cases SET status = 'running' WHERE caseroot = ?", (caseroot,))
+        con.execute("INSERT INTO stages VALUES (?, 'strip', 0, NULL, 'running')", (caseroot,))
+    call, calls = fake_call(set())
+    monkeypatch.setattr(noahmp_queue.subprocess, 'call', call)
+    noahmp_queue.run(db)
+    assert calls == ['noahmp_strip_output.py']
+    assert case_state(db, caseroot) == ('extract', 'done')
+    assert stage_runs(db, caseroot) == [('strip', 'interrupted'), ('strip', 'done')]
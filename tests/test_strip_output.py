@@ -0,0 +1,40 @@
+import os
+import numpy as np
+import netCDF4 as nc
+import noahmp_strip_output
+
+def test_permute_orders_known_dimensions_in_place():
+    permute = noahmp_strip_output.permute
+    assert permute(('Time', 'south_north', 'soil_layers_stag', 'west_east')) \
+        == ('Time', 'soil_layers_stag', 'south_north', 'west_east')
+    assert permute(('Time', 'west_east', 'other', 'south_north')) \
+        == ('Time', 'south_north', 'other', 'west_east')
+    assert permute(('Time', 'DateStrLen')) == ('Time', 'DateStrLen')
+
+def write_ldasout(filename, fmt):
+    with nc.Dataset(filename, 'w', format=fmt) as fo:
+        fo.createDimension('Time', None)
+        fo.createDimension('south_north', 3)
+        fo.createDimension('soil_layers_stag', 4)
+        fo.createDimension('west_east', 2)
+        v = fo.createVariable('SOIL_M', 'f4', ('Time', 'south_north', 'soil_layers_stag', 'west_east'))
+        v[0] = np.arange(24, dtype='f4').reshape(3, 4, 2)
+        fo.createVariable('BBXY', 'f4', ('Time', 'south_north', 'west_east'))[0] = 1.0
+    return
+
+def test_strip_file_then_untouched(tmp_path):
+    f = str(tmp_path / '2000010100.LDASOUT_DOMAIN1')
+    write_ldasout(f, 'NETCDF4')
+    with nc.Dataset(f, 'r') as fi:
+        assert not noahmp_strip_output.stripped(fi)
+    assert noahmp_strip_output.strip_file(f)
+    with nc.Dataset(f, 'r') as fi:
+        assert noahmp_strip_output.stripped(fi)
+        assert 'BBXY' not in fi.variables
+        v = fi.variables['SOIL_M']
+        assert v.dimensions == ('Time', 'soil_layers_stag', 'south_north', 'west_east')
+        assert np.array_equal(v[0], np.arange(24, dtype='f4').reshape(3, 4, 2).transpose(1, 0, 2))
+    mtime = os.stat(f).st_mtime_ns
+    assert not noahmp_strip_output.strip_file(f)
+    assert os.stat(f).st_mtime_ns == mtime
+    assert os.listdir(str(tmp_path)) == ['2000010100.LDASOUT_DOMAIN1']
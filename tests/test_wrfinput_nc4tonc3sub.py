@@ -0,0 +1,43 @@
+import numpy as np
+import netCDF4 as nc
+import wrfinput_nc4tonc3sub
+
+NY, NX = 5, 4
+
+def write_wrfinput(filename):
+    '''XLAT/XLONG of a 5x4 grid, XLAT stored (Time, west_east, south_north)'''
+    lat = np.repeat(np.arange(NY, dtype='f4')[:, None], NX, axis=1) + 30.0
+    lon = np.repeat(np.arange(NX, dtype='f4')[None, :], NY, axis=0) - 100.0
+    with nc.Dataset(filename, 'w') as fo:
+        fo.createDimension('Time', None)
+        fo.createDimension('south_north', NY)
+        fo.createDimension('west_east', NX)
+        fo.createVariable('XLAT', 'f4', ('Time', 'west_east', 'south_north'))[0] = lat.T
+        fo.createVariable('XLONG', 'f4', ('Time', 'south_north', 'west_east'))[0] = lon
+    return lat, lon
+
+def test_row_block_by_dimension_name(tmp_path):
+    filename = str(tmp_path / 'wrfinput_d01')
+    lat, lon = write_wrfinput(filename)
+    with nc.Dataset(filename, 'r') as fi:
+        assert np.array_equal(wrfinput_nc4tonc3sub.row_block(fi.variables['XLAT'], 1, 3), lat[1:3])
+        assert np.array_equal(wrfinput_nc4tonc3sub.row_block(fi.variables['XLONG'], 1, 3), lon[1:3])
+        assert wrfinput_nc4tonc3sub.row_block(fi.variables['XLAT'], 4, 9).shape == (1, NX)
+
+def test_check_window(tmp_path):
+    filename = str(tmp_path / 'wrfinput_d01')
+    write_wrfinput(filename)
+    with nc.Dataset(filename, 'r') as fi:
+        assert wrfinput_nc4tonc3sub.check_window(fi, ((0, NY), (0, NX))) is None
+        assert wrfinput_nc4tonc3sub.check_window(fi, ((1, 2), (3, 4))) is None
+        assert 'south_north' in wrfinput_nc4tonc3sub.check_window(fi, ((0, NY + 1), (0, NX)))
+        assert 'south_north' in wrfinput_nc4tonc3sub.check_window(fi, ((2, 2), (0, NX)))
+        assert 'west_east' in wrfinput_nc4tonc3sub.check_window(fi, ((0, NY), (-1, 2)))
+
+def test_bbox_window_in_small_row_blocks(tmp_path):
+    filename = str(tmp_path / 'wrfinput_d01')
+    write_wrfinput(filename)
+    with nc.Dataset(filename, 'r') as fi:
+        window = wrfinput_nc4tonc3sub.bbox_window(fi, (31.0, 33.0, -99.0, -98.0), bufsize=8 * NX)
+        assert window == ((1, 4), (1, 3))
+        assert wrfinput_nc4tonc3sub.bbox_window(fi, (0.0, 1.0, 0.0, 1.0)) is None
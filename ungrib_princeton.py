@@ -14,6 +14,8 @@ import argparse
 import dateutil.parser
 import numpy as np
 import netCDF4 as nc
+from noahmp_prefetch import Prefetcher, dataset
+import noahmp_profile
 
 def wps_write_latlon_field(f,
                            hdate, xfcst, map_src,
@@ -72,7 +74,13 @@ def wps_write_latlon_field(f,
 
     return
 
-def main(files=None, prefix='FILE', append=False, begtime=None, endtime=None):
+def read_record(item):
+    """all levels of one time record (prefetch loader)"""
+    flnm, varname, ii = item
+    return dataset(flnm).variables[varname][ii]
+
+def main(files=None, prefix='FILE', append=False, begtime=None, endtime=None,
+         prefetch=2):
     VARS = set(['dswrf', 'dlwrf', 'wind', 'tas', 'shum', 'pres', 'prcp'])
 
     if files is None:
@@ -104,10 +112,14 @@ def main(files=None, prefix='FILE', append=False, begtime=None, endtime=None):
                                 f.variables['time'].units)
             varname = VARS.intersection(set(f.variables.keys())).pop()
             var = f.variables[varname]
-            for ii, dd in enumerate(dates):
-                if ((begtime is not None and dd < begtime)
-                    or (endtime is not None and dd >= endtime)):
-                    continue
+            # read the next records in the background
+            reader = Prefetcher(read_record,
+                                [(flnm, varname, ii) for ii, dd in enumerate(dates)
+                                 if not ((begtime is not None and dd < begtime)
+                                         or (endtime is not None and dd >= endtime))],
+                                prefetch)
+            for (_, _, ii), record in reader:
+                dd = dates[ii]
                 oflnm = ''.join([prefix, ':', dd.strftime('%Y-%m-%d_%H')])
                 omod = 'ab' if os.path.isfile(oflnm) else 'wb'
                 print(oflnm)
@@ -127,19 +139,23 @@ def main(files=None, prefix='FILE', append=False, begtime=None, endtime=None):
                     is_wind_grid_rel = False
                     for iz in range(len(f.dimensions['z'])):
                         xlvl = f.variables['z'][iz]
-                        data = var[ii,iz]
-                        wps_write_latlon_field(of,
-                                               dd, xfcst, map_src,
-                                               field, units, desc,
-                                               xlvl, nlat, nlon,
-                                               startloc,
-                                               startlat, startlon,
-                                               deltalat, deltalon,
-                                               is_wind_grid_rel,
-                                               data)
+                        data = record[iz]
+                        with noahmp_profile.stage('write'):
+                            wps_write_latlon_field(of,
+                                                   dd, xfcst, map_src,
+                                                   field, units, desc,
+                                                   xlvl, nlat, nlon,
+                                                   startloc,
+                                                   startlat, startlon,
+                                                   deltalat, deltalon,
+                                                   is_wind_grid_rel,
+                                                   data)
+                        noahmp_profile.count('written', field, data)
+            reader.report()
     return
 
-if __name__ == '__main__':
+def cli(argv=None):
+    '''command line; argv defaults to sys.argv[1:]'''
     # prefix, append switch
     parser = argparse.ArgumentParser(
         description='Convert Princeton Meteorological Forcing Dataset from NetCDF format to WPS intermediate file format')
@@ -157,10 +173,19 @@ if __name__ == '__main__':
     parser.add_argument('-e', '--endtime',
                         help='end date & time (exclusive)',
                         default=None, type=str)
-    args = parser.parse_args()
+    parser.add_argument('--prefetch', type=int, default=2,
+                        help='number of time records read ahead in the background, 0 to disable (default: 2)')
+    noahmp_profile.add_arguments(parser)
+    args = parser.parse_args(argv)
+    noahmp_profile.setup(args)
 
     main(files=args.file,
          prefix=args.prefix,
          append=args.append,
          begtime=dateutil.parser.parse(args.begtime) if args.begtime is not None else None,
-         endtime=dateutil.parser.parse(args.endtime) if args.endtime is not None else None)
+         endtime=dateutil.parser.parse(args.endtime) if args.endtime is not None else None,
+         prefetch=args.prefetch)
+    return
+
+if __name__ == '__main__':
+    cli()
@@ -1,17 +1,35 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 import sys
+import numpy as np
 import netCDF4 as nc
+import noahmp_profile
 
+VARIABLES = ('HGT', 'ISLTYP', 'IVGTYP', 'TMN', 'XLAT', 'XLONG',
+             'XLAND', 'MAPFAC_MX', 'MAPFAC_MY')
+BUFSIZE = 64 * 2**20            # bytes of a variable copied at once
+# spatial dimensions: (axis of the window, extra points of staggering)
+SPATIAL = {'south_north': (0, 0), 'south_north_stag': (0, 1),
+           'west_east': (1, 0), 'west_east_stag': (1, 1)}
 
-def copy_dim_def(ncout, ncin, dim_name):
+def dim_slice(dim_name, window=None):
+    '''index range of a dimension within window ((j0, j1), (i0, i1))'''
+    if window is None or dim_name not in SPATIAL:
+        return slice(None)
+    axis, stag = SPATIAL[dim_name]
+    return slice(window[axis][0], window[axis][1] + stag)
+
+def copy_dim_def(ncout, ncin, dim_name, window=None):
     if dim_name not in ncin.dimensions:
         print('unknown dimension name: ' + dim_name)
         return
+    if dim_name in ncout.dimensions:
+        return
     if ncin.dimensions[dim_name].isunlimited():
         ncout.createDimension(dim_name, None)
     else:
-        ncout.createDimension(dim_name, len(ncin.dimensions[dim_name]))
+        size = len(ncin.dimensions[dim_name])
+        ncout.createDimension(dim_name, len(range(size)[dim_slice(dim_name, window)]))
     return
 
 def copy_var_def(ncout, ncin, var_name):
@@ -41,43 +59,146 @@ def copy_attr(ncout, ncin, var_name):
                 attr_name, getattr(ncin.variables[var_name], attr_name))
     return
 
-def copy_var_val(ncout, ncin, var_name):
+def copy_var_val(ncout, ncin, var_name, window=None, bufsize=BUFSIZE):
+    '''copy values in blocks of rows (of about bufsize bytes) within window'''
     if var_name not in ncin.variables or var_name not in ncout.variables:
         print('unknown variable name: ' + var_name)
         return
-    old_mask = ncin.variables[var_name].mask
-    old_scale = ncin.variables[var_name].scale
-    ncin.variables[var_name].set_auto_mask(False)
-    ncin.variables[var_name].set_auto_scale(False)
-    ncout.variables[var_name][:] = ncin.variables[var_name][:]
-    ncin.variables[var_name].set_auto_mask(old_mask)
-    ncin.variables[var_name].set_auto_scale(old_scale)
+    vi = ncin.variables[var_name]
+    vo = ncout.variables[var_name]
+    old_mask = vi.mask
+    old_scale = vi.scale
+    vi.set_auto_mask(False)
+    vi.set_auto_scale(False)
+    vo.set_auto_maskandscale(False)
+    slices = [dim_slice(dim, window) for dim in vi.dimensions]
+    rows = [k for k, dim in enumerate(vi.dimensions) if dim.startswith('south_north')]
+    if len(rows) == 0:
+        with noahmp_profile.stage('read'):
+            v = vi[:]
+        with noahmp_profile.stage('write'):
+            vo[:] = v
+        noahmp_profile.count('read', var_name, v)
+    else:
+        k = rows[0]
+        start, stop, _ = slices[k].indices(vi.shape[k])
+        shape = [len(range(n)[sl]) for n, sl in zip(vi.shape, slices)]
+        rowbytes = vi.dtype.itemsize * int(np.prod(shape)) // max(shape[k], 1)
+        step = max(bufsize // max(rowbytes, 1), 1)
+        for j0 in range(start, stop, step):
+            j1 = min(j0 + step, stop)
+            src = list(slices)
+            src[k] = slice(j0, j1)
+            dst = [slice(None)] * len(slices)
+            dst[k] = slice(j0 - start, j1 - start)
+            with noahmp_profile.stage('read'):
+                v = vi[tuple(src)]
+            with noahmp_profile.stage('write'):
+                vo[tuple(dst)] = v
+            noahmp_profile.count('read', var_name, v)
+    vi.set_auto_mask(old_mask)
+    vi.set_auto_scale(old_scale)
     return
 
-def main(fin, fout):
-    with nc.Dataset(fin, 'r') as fi, \
-         nc.Dataset(fout, 'w', format='NETCDF4_CLASSIC') as fo:
-        for dim in ('Time', 'south_north', 'west_east'):
-            copy_dim_def(fo, fi, dim)
-        for var in ('HGT', 'ISLTYP', 'IVGTYP', 'TMN', 'XLAT', 'XLONG',
-                    'XLAND', 'MAPFAC_MX', 'MAPFAC_MY'):
-            copy_var_def(fo, fi, var)
-        for var in ('HGT', 'ISLTYP', 'IVGTYP', 'TMN', 'XLAT', 'XLONG',
-                    'XLAND', 'MAPFAC_MX', 'MAPFAC_MY'):
-            copy_var_val(fo, fi, var)
-        for att in ('DX', 'DY', 'GRID_ID',
-                    'TRUELAT1', 'TRUELAT2', 'STAND_LON', 'MAP_PROJ',
-                    'MMINLU',
-                    'ISWATER', 'ISURBAN', 'ISICE', 'ISOILWATER'):
-            setattr(fo, att, getattr(fi, att))
+def row_block(var, j0, j1):
+    '''rows j0:j1 of a (..., south_north, ..., west_east) variable as a 2-D
+    (row, column) array, at the first index of any other dimension'''
+    index = tuple(slice(j0, j1) if dim == 'south_north' else
+                  slice(None) if dim == 'west_east' else 0 for dim in var.dimensions)
+    v = np.ma.filled(var[index], np.nan)
+    if var.dimensions.index('south_north') > var.dimensions.index('west_east'):
+        v = v.T
+    return v
+
+def check_window(ncin, window):
+    '''None if window ((j0, j1), (i0, i1)) is a non-empty index range within
+    the domain, else what is wrong with it'''
+    for axis, dim in enumerate(('south_north', 'west_east')):
+        n = len(ncin.dimensions[dim])
+        k0, k1 = window[axis]
+        if not 0 <= k0 < k1 <= n:
+            return '{0:s} window {1:d}:{2:d} is not within 0:{3:d}'.format(dim, k0, k1, n)
+    return None
+
+def bbox_window(ncin, bbox, bufsize=BUFSIZE):
+    '''smallest index window ((j0, j1), (i0, i1)) holding all cells with
+    XLAT/XLONG inside bbox (LAT0, LAT1, LON0, LON1), scanned in row blocks'''
+    lat0, lat1, lon0, lon1 = bbox
+    xlat = ncin.variables['XLAT']
+    xlong = ncin.variables['XLONG']
+    ny = len(ncin.dimensions['south_north'])
+    nx = len(ncin.dimensions['west_east'])
+    step = max(bufsize // (8 * nx), 1)
+    jj, ii = [], []
+    for j0 in range(0, ny, step):
+        lat = row_block(xlat, j0, j0 + step)
+        lon = row_block(xlong, j0, j0 + step)
+        j, i = np.nonzero((lat >= lat0) & (lat <= lat1) & (lon >= lon0) & (lon <= lon1))
+        if len(j) > 0:
+            jj += [j0 + j.min(), j0 + j.max()]
+            ii += [i.min(), i.max()]
+    if len(jj) == 0:
+        return None
+    return (min(jj), max(jj) + 1), (min(ii), max(ii) + 1)
+
+def main(fin, fout, variables=VARIABLES, window=None, bbox=None, bufsize=BUFSIZE):
+    with nc.Dataset(fin, 'r') as fi:
+        if bbox is not None:
+            with noahmp_profile.stage('bbox'):
+                window = bbox_window(fi, bbox, bufsize)
+            if window is None:
+                print('no grid cells within the lat/lon window')
+                sys.exit(1)
+        if window is not None:
+            problem = check_window(fi, window)
+            if problem is not None:
+                print(problem)
+                sys.exit(1)
+            print('window south_north {0[0][0]:d}:{0[0][1]:d}, west_east {0[1][0]:d}:{0[1][1]:d}'.format(window))
+        with nc.Dataset(fout, 'w', format='NETCDF4_CLASSIC') as fo:
+            for dim in ('Time', 'south_north', 'west_east'):
+                copy_dim_def(fo, fi, dim, window)
+            for var in variables:
+                if var in fi.variables:
+                    for dim in fi.variables[var].dimensions:
+                        copy_dim_def(fo, fi, dim, window)
+                copy_var_def(fo, fi, var)
+            for var in variables:
+                copy_var_val(fo, fi, var, window, bufsize)
+            for att in ('DX', 'DY', 'GRID_ID',
+                        'TRUELAT1', 'TRUELAT2', 'STAND_LON', 'MAP_PROJ',
+                        'MMINLU',
+                        'ISWATER', 'ISURBAN', 'ISICE', 'ISOILWATER'):
+                setattr(fo, att, getattr(fi, att))
     return
 
 import argparse
-if __name__ == '__main__':
+def cli(argv=None):
+    '''command line; argv defaults to sys.argv[1:]'''
     parser = argparse.ArgumentParser(description='Convert WRFINPUT from NetCDF-4 format to NetCDF-3 format (subset, LDAS static fields only)')
     parser.add_argument('nc4file', type=str,
                         help='NetCDF-4 format WRFINPUT')
     parser.add_argument('nc3file', type=str,
                         help='NetCDF-3 format WRFINPUT')
-    args = parser.parse_args()
-    main(args.nc4file, args.nc3file)
+    parser.add_argument('-v', '--variables', type=str, nargs='+', default=VARIABLES,
+                        help='variables to copy (default: ' + ' '.join(VARIABLES) + ')')
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--index', type=int, nargs=4, metavar=('J0', 'J1', 'I0', 'I1'),
+                       help='crop to rows J0:J1 and columns I0:I1 (0-based, end exclusive)')
+    group.add_argument('--bbox', type=float, nargs=4, metavar=('LAT0', 'LAT1', 'LON0', 'LON1'),
+                       help='crop to the smallest window holding all cells within the lat/lon box')
+    parser.add_argument('--buffer', type=float, default=BUFSIZE / 2**20,
+                        help='MiB of a variable copied at once (default: {0:g})'.format(BUFSIZE / 2**20))
+    noahmp_profile.add_arguments(parser)
+    args = parser.parse_args(argv)
+    noahmp_profile.setup(args)
+    window = None
+    if args.index is not None:
+        j0, j1, i0, i1 = args.index
+        window = (j0, j1), (i0, i1)
+    main(args.nc4file, args.nc3file, args.variables, window, args.bbox,
+         int(args.buffer * 2**20))
+    return
+
+if __name__ == '__main__':
+    cli()